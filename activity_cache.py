@@ -0,0 +1,85 @@
+import json
+import os
+import numpy as np
+from capture_journal import file_sha256
+
+# Bump when the cached arrays or the parsing/planning rules change
+CACHE_VERSION = 3
+
+def load_cached_plan(cache_file, csv_file, params):
+    """
+    Load parsed activities and screenshot dates cached for csv_file
+
+    The cache is valid when it was built with the same CACHE_VERSION and
+    params (name filter, start date) from an export with the same size and
+    SHA-256. If size and mtime both match the export is not re-hashed.
+    Returns tuple of (activities_data, screenshot_dates) or None on a miss
+    """
+    try:
+        with np.load(cache_file, allow_pickle=False) as cache:
+            meta = json.loads(str(cache['meta']))
+            if meta.get('version') != CACHE_VERSION or meta.get('params') != params:
+                return None
+
+            stat = os.stat(csv_file)
+            if stat.st_size != meta['size']:
+                return None
+            if stat.st_mtime_ns != meta['mtime_ns'] and file_sha256(csv_file) != meta['sha256']:
+                return None
+
+            activity_dates = cache['activity_dates'].tolist()
+            activity_distances = cache['activity_distances'].tolist()
+            activity_names = cache['activity_names'].tolist()
+            activity_files = cache['activity_files'].tolist()
+            activity_ids = cache['activity_ids'].tolist()
+            plan_dates = cache['plan_dates'].tolist()
+            plan_distances = cache['plan_distances'].tolist()
+            plan_days = cache['plan_days'].tolist()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable activity cache {cache_file}: {e}")
+        return None
+
+    activities_data = []
+    for date, distance, name, filename, activity_id in zip(
+        activity_dates, activity_distances, activity_names, activity_files, activity_ids
+    ):
+        activity = {'date': date, 'distance': distance, 'name': name}
+        if filename:
+            activity['filename'] = filename
+        if activity_id:
+            activity['id'] = activity_id
+        activities_data.append(activity)
+    screenshot_dates = [
+        {'date': date, 'accumulated_distance': distance if days else 0, 'accumulated_days': days}
+        for date, distance, days in zip(plan_dates, plan_distances, plan_days)
+    ]
+    return activities_data, screenshot_dates
+
+def save_cached_plan(cache_file, csv_file, params, activities_data, screenshot_dates):
+    """
+    Store parsed activities and screenshot dates as compact arrays in an .npz file
+    """
+    stat = os.stat(csv_file)
+    meta = {
+        'version': CACHE_VERSION,
+        'params': params,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_sha256(csv_file)
+    }
+    tmp_file = cache_file + '.tmp.npz'
+    np.savez_compressed(
+        tmp_file,
+        meta=np.array(json.dumps(meta)),
+        activity_dates=np.array([a['date'] for a in activities_data], dtype='U10'),
+        activity_distances=np.array([a['distance'] for a in activities_data], dtype=np.float64),
+        activity_names=np.array([a['name'] for a in activities_data], dtype=str),
+        activity_files=np.array([a.get('filename', '') for a in activities_data], dtype=str),
+        activity_ids=np.array([a.get('id', '') for a in activities_data], dtype=str),
+        plan_dates=np.array([d['date'] for d in screenshot_dates], dtype='U10'),
+        plan_distances=np.array([d['accumulated_distance'] for d in screenshot_dates], dtype=np.float64),
+        plan_days=np.array([d['accumulated_days'] for d in screenshot_dates], dtype=np.int64)
+    )
+    os.replace(tmp_file, cache_file)
@@ -0,0 +1,416 @@
+import base64
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import nullcontext
+import cv2
+import numpy as np
+from mss import mss
+from page_load import grab_low_res_frame
+
+try:
+    import pyautogui
+except Exception:
+    # pyautogui needs a display, the DevTools backend does not
+    pyautogui = None
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+# Executables tried in order when no Chromium path is given
+CHROMIUM_NAMES = (
+    "chromium", "chromium-browser", "google-chrome", "google-chrome-stable", "chrome",
+    "/Applications/Chromium.app/Contents/MacOS/Chromium",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe"
+)
+
+def wait_for_page(grab_frame, detector=None, load_timeout=30):
+    """
+    Wait until the page stops changing (or a fixed load_timeout without a detector)
+    grab_frame() returns a small grayscale frame of the page
+    Returns the number of seconds waited
+    """
+    if detector is None:
+        print(f"Waiting {load_timeout} seconds for page to load...")
+        time.sleep(load_timeout)
+        return load_timeout
+    print(f"Waiting up to {detector.timeout} seconds for page to load...")
+    stable, waited = detector.wait(grab_frame)
+    if stable:
+        print(f"Page stable after {waited:.1f} seconds")
+    else:
+        print(f"Page still changing after {waited:.1f} seconds, capturing anyway")
+    return waited
+
+class CaptureBackend:
+    """
+    Loads a URL and grabs the rendered page
+
+    capture(url) returns tuple of (RGB uint8 frame of shape (height, width, 3),
+    seconds spent waiting for the page to load) and raises on failure.
+    Up to `concurrency` captures may run at the same time from different threads.
+    With a StageTimer in `timer`, the navigate, wait and grab stages are timed.
+    """
+    concurrency = 1
+    # The backend types into the desktop, so the user must keep their hands off it
+    controls_desktop = False
+    timer = None
+
+    def timed(self, stage):
+        return self.timer.stage(stage) if self.timer is not None else nullcontext()
+
+    def capture(self, url):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class PyAutoGUIBackend(CaptureBackend):
+    """
+    Types each URL into the focused browser window with pyautogui and grabs
+    the screen region with mss
+
+    Args:
+    bounds: mss grab region (the second monitor or a crop region inside it)
+    detector: PageLoadDetector polling the screen, or None to always wait load_timeout
+    load_timeout: Seconds to wait without a detector
+    pause: Seconds between a grab and the next navigation, counted from the
+           grab so the pause overlaps the processing of the grabbed frame
+    """
+    controls_desktop = True
+
+    def __init__(self, bounds, detector=None, load_timeout=30, pause=1):
+        if pyautogui is None:
+            raise RuntimeError("pyautogui is not available (it needs a display)")
+        self.bounds = bounds
+        self.detector = detector
+        self.load_timeout = load_timeout
+        self.pause = pause
+        self.last_grab = None
+
+    def navigate(self, url):
+        print("Focusing URL bar...")
+        # Press Ctrl+L to focus on URL bar
+        pyautogui.hotkey('ctrl', 'l')
+        time.sleep(1)  # Increased pause after focusing URL bar
+
+        print("Clearing current URL...")
+        # Clear the current URL (select all and delete)
+        pyautogui.hotkey('ctrl', 'a')
+        pyautogui.press('delete')
+        time.sleep(0.5)
+
+        print("Typing URL...")
+        pyautogui.write(url)
+
+        print("Pressing Enter...")
+        pyautogui.press('enter')
+
+    def capture(self, url):
+        # Wait between screenshots; the previous frame was processed meanwhile
+        if self.pause and self.last_grab is not None:
+            remaining = self.pause - (time.monotonic() - self.last_grab)
+            if remaining > 0:
+                print(f"Waiting {remaining:.1f} seconds before next iteration...")
+                time.sleep(remaining)
+        with self.timed('navigate'):
+            self.navigate(url)
+        with mss() as sct:
+            with self.timed('wait'):
+                waited = wait_for_page(lambda: grab_low_res_frame(sct, self.bounds), self.detector, self.load_timeout)
+            print("Taking screenshot of second monitor...")
+            with self.timed('grab'):
+                screenshot = sct.grab(self.bounds)
+                width, height = screenshot.size
+                frame = np.frombuffer(screenshot.rgb, dtype=np.uint8).reshape(height, width, 3)
+        self.last_grab = time.monotonic()
+        return frame, waited
+
+def find_chromium(path=None):
+    """
+    Path of the Chromium/Chrome executable, or None if none is installed
+    """
+    for name in ((path,) if path else CHROMIUM_NAMES):
+        found = shutil.which(name) or (name if os.path.isfile(name) else None)
+        if found:
+            return found
+    return None
+
+class DevToolsTab:
+    """
+    One browser tab driven over its DevTools protocol WebSocket
+    Only one thread may use a tab at a time
+    """
+    def __init__(self, target, timeout=30):
+        self.target_id = target['id']
+        self.timeout = timeout
+        self.ws = websocket.create_connection(
+            target['webSocketDebuggerUrl'], timeout=timeout, suppress_origin=True
+        )
+        self.message_id = 0
+        self.loaded = False
+
+    def dispatch(self, message):
+        if message.get('method') == 'Page.loadEventFired':
+            self.loaded = True
+
+    def call(self, method, **params):
+        """
+        Send a command and wait for its result
+        """
+        self.message_id += 1
+        self.ws.settimeout(self.timeout)
+        self.ws.send(json.dumps({'id': self.message_id, 'method': method, 'params': params}))
+        while True:
+            message = json.loads(self.ws.recv())
+            if message.get('id') == self.message_id:
+                if 'error' in message:
+                    raise RuntimeError(f"{method} failed: {message['error'].get('message')}")
+                return message.get('result', {})
+            self.dispatch(message)
+
+    def wait_for_load(self, timeout):
+        """
+        Wait for the load event of the last navigation
+        Returns True if it fired within timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        while not self.loaded:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.ws.settimeout(remaining)
+            try:
+                self.dispatch(json.loads(self.ws.recv()))
+            except websocket.WebSocketTimeoutException:
+                return False
+        return True
+
+    def navigate(self, url):
+        self.loaded = False
+        result = self.call('Page.navigate', url=url)
+        if result.get('errorText'):
+            raise RuntimeError(f"Navigation failed: {result['errorText']}")
+        # Same-document navigations (only the #fragment changed) fire no load event
+        if 'loaderId' not in result:
+            self.loaded = True
+
+    def screenshot(self, clip=None, scale=1, image_format='png', quality=None):
+        """
+        Screenshot of the viewport (or the clip {left, top, width, height} inside it)
+        Returns the decoded BGR (or grayscale for jpeg) image
+        """
+        params = {'format': image_format}
+        if quality is not None:
+            params['quality'] = quality
+        if clip is not None or scale != 1:
+            if clip is None:
+                metrics = self.call('Page.getLayoutMetrics')['cssVisualViewport']
+                clip = {'left': 0, 'top': 0, 'width': metrics['clientWidth'], 'height': metrics['clientHeight']}
+            params['clip'] = {
+                'x': clip['left'], 'y': clip['top'],
+                'width': clip['width'], 'height': clip['height'], 'scale': scale
+            }
+        data = base64.b64decode(self.call('Page.captureScreenshot', **params)['data'])
+        flags = cv2.IMREAD_COLOR if image_format == 'png' else cv2.IMREAD_GRAYSCALE
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        if image is None:
+            raise RuntimeError("Could not decode the screenshot")
+        return image
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+class DevToolsBackend(CaptureBackend):
+    """
+    Drives a local Chromium over the DevTools protocol: each tab has a
+    fixed-size viewport, pages are navigated directly and screenshots come
+    straight from the renderer, so the desktop stays usable and several dates
+    load at the same time
+
+    A browser already listening on the debugging port is reused, otherwise one
+    is launched with the given profile (log in to Strava once in that profile,
+    e.g. with headless=False). Needs the websocket-client package.
+
+    Args:
+    viewport: (width, height) of every tab
+    bounds: Region of the viewport to keep ({left, top, width, height}), None for all of it
+    tabs: Number of tabs, i.e. captures running at the same time
+    chromium_path: Browser executable, None to search the usual names
+    port: Remote debugging port
+    profile: User data folder, None for a throwaway one
+    headless: Run the launched browser without a window
+    detector: PageLoadDetector polling low-resolution screenshots, or None to wait load_timeout
+    load_timeout: Seconds to wait for the load event, and after it without a detector
+    """
+    def __init__(
+        self,
+        viewport=(1920, 1080),
+        bounds=None,
+        tabs=4,
+        chromium_path=None,
+        port=9222,
+        profile=None,
+        headless=True,
+        detector=None,
+        load_timeout=30
+    ):
+        if websocket is None:
+            raise ImportError("The DevTools backend needs the websocket-client package (pip install websocket-client)")
+        self.viewport = viewport
+        self.bounds = bounds
+        self.concurrency = max(1, tabs)
+        self.port = port
+        self.detector = detector
+        self.load_timeout = load_timeout
+        self.process = None
+        self.temp_profile = None
+        self.tabs = []
+        self.idle_tabs = queue.Queue()
+        self.lock = threading.Lock()
+
+        try:
+            self.endpoint('version')
+            print(f"Using the browser already listening on port {port}")
+        except OSError:
+            self.launch(chromium_path, profile, headless)
+        try:
+            for _ in range(self.concurrency):
+                self.idle_tabs.put(self.open_tab())
+        except Exception:
+            self.close()
+            raise
+        print(f"Opened {self.concurrency} tabs with a {viewport[0]}x{viewport[1]} viewport")
+
+    def endpoint(self, path, method='GET'):
+        """
+        Call the browser's HTTP endpoint /json/<path>
+        """
+        request = urllib.request.Request(f"http://127.0.0.1:{self.port}/json/{path}", method=method)
+        with urllib.request.urlopen(request, timeout=5) as response:
+            body = response.read()
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body.decode(errors='replace')
+
+    def launch(self, chromium_path, profile, headless, startup_timeout=30):
+        executable = find_chromium(chromium_path)
+        if executable is None:
+            raise RuntimeError("Chromium/Chrome not found, set chromium_path")
+        if profile is None:
+            self.temp_profile = tempfile.mkdtemp(prefix="heatmap-chromium-")
+            profile = self.temp_profile
+        args = [
+            executable,
+            f"--remote-debugging-port={self.port}",
+            f"--user-data-dir={os.path.abspath(profile)}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            "--hide-scrollbars",
+            # Keep background tabs rendering at full speed
+            "--disable-background-timer-throttling",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-renderer-backgrounding",
+            "about:blank"
+        ]
+        if headless:
+            args.insert(1, "--headless=new")
+        print(f"Launching {executable}")
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                self.endpoint('version')
+                return
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"Chromium exited with code {self.process.returncode}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Chromium did not open port {self.port} within {startup_timeout} seconds")
+                time.sleep(0.2)
+
+    def open_tab(self):
+        target = self.endpoint('new?about:blank', method='PUT')
+        tab = DevToolsTab(target, timeout=self.load_timeout)
+        with self.lock:
+            self.tabs.append(tab)
+        tab.call('Page.enable')
+        width, height = self.viewport
+        tab.call('Emulation.setDeviceMetricsOverride', width=width, height=height, deviceScaleFactor=1, mobile=False)
+        return tab
+
+    def close_tab(self, tab):
+        tab.close()
+        with self.lock:
+            if tab in self.tabs:
+                self.tabs.remove(tab)
+        try:
+            self.endpoint(f'close/{tab.target_id}')
+        except OSError:
+            pass
+
+    def capture(self, url):
+        tab = self.idle_tabs.get()
+        try:
+            with self.timed('navigate'):
+                tab.navigate(url)
+            with self.timed('wait'):
+                start = time.monotonic()
+                if not tab.wait_for_load(self.load_timeout):
+                    print(f"No load event after {self.load_timeout} seconds, capturing anyway")
+                # Map tiles are still drawn after the load event
+                waited = time.monotonic() - start + wait_for_page(
+                    lambda: tab.screenshot(self.bounds, scale=0.125, image_format='jpeg', quality=50),
+                    self.detector, self.load_timeout
+                )
+            with self.timed('grab'):
+                frame = cv2.cvtColor(tab.screenshot(self.bounds), cv2.COLOR_BGR2RGB)
+        except Exception:
+            # The tab may be broken (crashed renderer, closed socket), start over with a new one
+            self.close_tab(tab)
+            try:
+                tab = self.open_tab()
+            except Exception as e:
+                # Keep the closed tab, the next capture on it tries again
+                print(f"Warning: Could not open a new tab: {e}")
+            raise
+        finally:
+            self.idle_tabs.put(tab)
+        return frame, waited
+
+    def close(self):
+        with self.lock:
+            tabs = list(self.tabs)
+        for tab in tabs:
+            self.close_tab(tab)
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+        if self.temp_profile is not None:
+            shutil.rmtree(self.temp_profile, ignore_errors=True)
+            self.temp_profile = None
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_TRAILER = b'IEND\xaeB`\x82'
+
+def file_sha256(filepath, chunk_size=1 << 20):
+    """
+    SHA-256 hex digest of a file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def atomic_write_json(path, data, indent=None):
+    """
+    Write data as JSON to a temporary file and atomically replace path with it,
+    so a crash never leaves the file half-written
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_json_or_empty(path):
+    """
+    Load a JSON object, or an empty dict if the file is missing or unreadable
+    """
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Warning: Could not read {path}: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def is_valid_png(filepath):
+    """
+    Cheap structural check: non-empty file that starts with the PNG signature
+    and ends with the IEND chunk (catches zero-byte and truncated writes)
+    """
+    try:
+        size = os.path.getsize(filepath)
+        if size < len(PNG_SIGNATURE) + len(PNG_TRAILER):
+            return False
+        with open(filepath, 'rb') as f:
+            if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+                return False
+            f.seek(-len(PNG_TRAILER), os.SEEK_END)
+            return f.read() == PNG_TRAILER
+    except OSError:
+        return False
+
+class CaptureJournal:
+    """
+    Records every completed capture (file size and content hash) so an
+    interrupted run can resume where it stopped
+
+    The journal is a JSON file that is rewritten atomically after each
+    recorded date, so a crash never leaves it half-written.
+    """
+    def __init__(self, path="capture_journal.json"):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """
+        Load existing journal entries, starting empty if the file is missing or unreadable
+        """
+        self.entries = read_json_or_empty(self.path).get('captures', {})
+
+    def save(self):
+        atomic_write_json(self.path, {'captures': self.entries}, indent=2)
+
+    def record(self, date_str, filepath, **extra):
+        """
+        Record a completed capture for date_str
+        Returns False (and records nothing) if the file is not a valid PNG
+        """
+        if not is_valid_png(filepath):
+            return False
+        self.entries[date_str] = {
+            'file': str(filepath),
+            'size': os.path.getsize(filepath),
+            'sha256': file_sha256(filepath),
+            'completed_at': datetime.now().isoformat(timespec='seconds'),
+            **extra
+        }
+        self.save()
+        return True
+
+    def is_complete(self, date_str, filepath):
+        """
+        True if date_str was recorded and its file still exists with the same size and hash
+        """
+        entry = self.entries.get(date_str)
+        if not entry or not os.path.exists(filepath):
+            return False
+        if os.path.getsize(filepath) != entry['size']:
+            return False
+        return file_sha256(filepath) == entry['sha256'] and is_valid_png(filepath)
+
+    def forget(self, date_str):
+        """
+        Drop the entry for date_str so it gets captured again
+        """
+        if self.entries.pop(date_str, None) is not None:
+            self.save()
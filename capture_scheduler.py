@@ -0,0 +1,269 @@
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from instrumentation import StageTimer
+
+# Error of a frame held back behind an earlier frame's retry (ordered runs)
+HELD = "held back for an earlier retry"
+
+class CaptureScheduler:
+    """
+    Work queue for captures with per-item attempt counts and exponential back-off
+
+    A capture that raises, or whose result the validation hook rejects, is
+    retried after base_delay * 2 ** (attempts - 1) seconds (at most max_delay).
+    With requeue the retry goes to the end of the queue so the remaining
+    dates go first, otherwise it is retried in place (when the results must
+    stay in order, e.g. frames streamed into a video).
+
+    Every result then passes through a process stage: process, validate and
+    on_success run one item at a time, in capture order. With pipeline that
+    stage runs on its own thread, so the next capture starts as soon as a frame
+    is grabbed while the previous one is still being processed. In ordered
+    runs, frames grabbed after a rejected one are held back and captured again
+    after its retry.
+
+    With workers > 1, up to that many captures run at the same time on a thread
+    pool (e.g. one per browser tab), so workers need requeue.
+
+    capture, process, validate, clock and sleep are plain callables, so the
+    scheduling can be exercised with a fake capture backend and a fake clock.
+
+    Args:
+    capture: capture(item) -> result, raising on failure
+    validate: validate(item, result) -> True if the result is good (None accepts every result)
+    max_attempts: Attempts per item before it is given up
+    base_delay, max_delay: Back-off in seconds
+    requeue: Retry failed items after the rest of the queue instead of in place
+    workers: Captures running at the same time
+    process: process(item, result) -> processed result, run before validation (None keeps the result)
+    pipeline: Run the process stage on its own thread
+    timer: StageTimer for the busy time of the capture, process and save stages
+    clock, sleep: Time source and sleep function
+    """
+    def __init__(
+        self,
+        capture,
+        validate=None,
+        max_attempts=3,
+        base_delay=5.0,
+        max_delay=300.0,
+        requeue=True,
+        workers=1,
+        process=None,
+        pipeline=False,
+        timer=None,
+        clock=time.monotonic,
+        sleep=time.sleep
+    ):
+        self.capture = capture
+        self.validate = validate
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requeue = requeue
+        # Results must arrive in order without requeue
+        self.workers = max(1, workers) if requeue else 1
+        self.process = process
+        self.pipeline = pipeline
+        self.timer = timer if timer is not None else StageTimer()
+        self.timer.capacity['capture'] = self.workers
+        self.clock = clock
+        self.sleep = sleep
+        self.attempts = {}
+        self.failed = {}
+        self.key = None
+        self.on_success = None
+        # Sequence number of the rejected frame that holds back the later ones
+        self.halted_at = None
+
+    def delay(self, attempts):
+        """
+        Back-off before the next attempt after `attempts` failed ones
+        """
+        return min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+
+    def push(self, queue, ready_at, seq, item):
+        """
+        Queue another attempt: at the end with requeue, otherwise back in its
+        original position
+        """
+        if self.requeue:
+            queue.append((ready_at, seq, item))
+            return
+        index = 0
+        while index < len(queue) and queue[index][1] < seq:
+            index += 1
+        queue.insert(index, (ready_at, seq, item))
+
+    def pop_due(self, queue):
+        """
+        Pop the first item that is due (only the head of the queue without
+        requeue), or None if it has to wait
+        Returns tuple of (sequence number, item)
+        """
+        now = self.clock()
+        for index, (ready_at, seq, item) in enumerate(queue):
+            if ready_at <= now:
+                del queue[index]
+                return seq, item
+            if not self.requeue:
+                break
+        return None
+
+    def wait_time(self, queue):
+        """
+        Seconds until the next queued item is due
+        """
+        if not self.requeue:
+            return max(0.0, queue[0][0] - self.clock())
+        return max(0.0, min(ready_at for ready_at, _, _ in queue) - self.clock())
+
+    def start(self, item):
+        """
+        Count an attempt of item
+        """
+        item_key = self.key(item)
+        self.attempts[item_key] = self.attempts.get(item_key, 0) + 1
+
+    def attempt(self, item):
+        """
+        Capture item once
+        Returns tuple of (result, error message or None)
+        """
+        with self.timer.frame(self.key(item)), self.timer.stage('capture'):
+            try:
+                return self.capture(item), None
+            except Exception as e:
+                return None, str(e) or type(e).__name__
+
+    def check(self, seq, item, result):
+        """
+        Process stage: process and validate a captured result, and hand a good
+        one to on_success
+        Returns tuple of (result, error message or HELD or None)
+        """
+        if self.halted_at is not None and seq > self.halted_at:
+            return result, HELD
+        with self.timer.frame(self.key(item)):
+            return self.check_frame(seq, item, result)
+
+    def check_frame(self, seq, item, result):
+        """
+        check() of a frame that is not held back
+        """
+        with self.timer.stage('process'):
+            try:
+                if self.process is not None:
+                    result = self.process(item, result)
+                error = None
+                if self.validate is not None and not self.validate(item, result):
+                    error = "rejected by validation"
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        if error is not None:
+            if not self.requeue and self.attempts[self.key(item)] < self.max_attempts:
+                self.halted_at = seq
+            return result, error
+        if self.halted_at == seq:
+            self.halted_at = None
+        if self.on_success is not None:
+            with self.timer.stage('save'):
+                self.on_success(item, result)
+        return result, None
+
+    def finish(self, queue, seq, item, result, error, completed):
+        """
+        Record the outcome of an attempt, queueing a retry if it failed
+        """
+        item_key = self.key(item)
+        if error is None:
+            completed[item_key] = result
+            return
+
+        if error is HELD:
+            # Not the frame's fault: capture it again right after the retry, without counting an attempt
+            self.attempts[item_key] -= 1
+            self.push(queue, 0.0, seq, item)
+            return
+
+        attempt = self.attempts[item_key]
+        if attempt >= self.max_attempts:
+            self.failed[item_key] = error
+            print(f"Giving up on {item_key} after {attempt} attempts: {error}")
+            if self.halted_at == seq:
+                self.halted_at = None
+            return
+
+        delay = self.delay(attempt)
+        print(f"Attempt {attempt}/{self.max_attempts} for {item_key} failed ({error}), retrying in {delay:.0f} seconds")
+        self.push(queue, self.clock() + delay, seq, item)
+
+    def run(self, items, key=lambda item: item['date'], on_success=None):
+        """
+        Capture every item, calling on_success(item, result) for each good result
+        Returns dict of key -> result for the completed items (self.failed has
+        the last error of every item that ran out of attempts)
+        """
+        queue = deque((0.0, seq, item) for seq, item in enumerate(items))
+        completed = {}
+        self.key = key
+        self.on_success = on_success
+        self.halted_at = None
+        capture_pool = ThreadPoolExecutor(self.workers, thread_name_prefix="capture") if self.workers > 1 else None
+        process_pool = ThreadPoolExecutor(1, thread_name_prefix="process") if self.pipeline else None
+        # Future -> (stage, sequence number, item)
+        running = {}
+
+        def count(stage):
+            return sum(1 for running_stage, _, _ in running.values() if running_stage == stage)
+
+        def can_capture():
+            # Grabbed frames waiting for the process stage are capped, so a slow stage can't pile up frames
+            return count('capture') < self.workers and count('process') <= self.workers
+
+        def captured(seq, item, result, error):
+            if error is not None:
+                self.finish(queue, seq, item, result, error, completed)
+            elif process_pool is not None:
+                running[process_pool.submit(self.check, seq, item, result)] = ('process', seq, item)
+            else:
+                self.finish(queue, seq, item, *self.check(seq, item, result), completed)
+
+        try:
+            while queue or running:
+                while queue and can_capture():
+                    entry = self.pop_due(queue)
+                    if entry is None:
+                        break
+                    seq, item = entry
+                    self.start(item)
+                    if capture_pool is None:
+                        # Capture on this thread while the process stage works on the previous frame
+                        captured(seq, item, *self.attempt(item))
+                        break
+                    running[capture_pool.submit(self.attempt, item)] = ('capture', seq, item)
+
+                if not running:
+                    wait_time = self.wait_time(queue) if queue else 0
+                    if wait_time > 0:
+                        print(f"Waiting {wait_time:.0f} seconds before the next retry...")
+                        self.sleep(wait_time)
+                    continue
+
+                # Wake up when a stage finishes, or when a retry becomes due while a capture could start
+                timeout = self.wait_time(queue) if queue and can_capture() else None
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=lambda future: running[future][1]):
+                    stage, seq, item = running.pop(future)
+                    if stage == 'capture':
+                        captured(seq, item, *future.result())
+                    else:
+                        self.finish(queue, seq, item, *future.result(), completed)
+        finally:
+            # Ctrl+C: drop the queued captures, but process every frame already grabbed
+            if capture_pool is not None:
+                capture_pool.shutdown(wait=True, cancel_futures=True)
+            if process_pool is not None:
+                process_pool.shutdown(wait=True)
+        return completed
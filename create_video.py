@@ -4,14 +4,34 @@ from pathlib import Path
 import re
 from datetime import datetime
 import json
+from collections import deque
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from video_encoders import create_encoder, ffmpeg_available, concat_videos
+from frame_store import FrameStore
+from frame_check import collapse_duplicates, frame_fingerprint
+from capture_journal import file_sha256
+from instrumentation import StageTimer, instrumented_run
 
-def filter_unique_activities(screenshot_metadata):
+# Batch mode: render every challenge folder written by the screenshot script's batch mode
+batch_mode = False
+challenges_folder = "challenges"
+# Read frames from the memory-mapped frame store written by image-cropper.py (output_format = "store")
+use_frame_store = False
+frame_store_folder = "frame_store"
+# Per-stage timings, frames/s and bytes written of every run are saved here as JSON
+# (None disables); run with --profile or HEATMAP_PROFILE=1 to also profile the run
+run_report_folder = "run_reports"
+
+def filter_unique_activities(screenshot_metadata, hold_dates=None):
     """
     Filter screenshots to only include those where the day number increases
-    (i.e., where a new Tallinn Streets activity was completed)
+    (i.e., where a new Tallinn Streets activity was completed), plus the hold
+    days the screenshot script scheduled (hold_dates, YYYY-MM-DD)
     """
     if not screenshot_metadata:
         return []
+    hold_dates = set(hold_dates or [])
     
     # Sort by date to ensure proper order
     screenshot_metadata.sort(key=lambda x: x['date'])
@@ -27,18 +47,202 @@ def filter_unique_activities(screenshot_metadata):
             filtered_screenshots.append(screenshot)
             last_day_count = current_day_count
             print(f"  Including: {screenshot['date']} - Day {current_day_count}, {screenshot['accumulated_distance']:.2f} km")
+        elif screenshot['date'] in hold_dates:
+            filtered_screenshots.append(screenshot)
+            print(f"  Including: {screenshot['date']} - Day {current_day_count}, {screenshot['accumulated_distance']:.2f} km (hold)")
         else:
             print(f"  Skipping: {screenshot['date']} - Day {current_day_count}, {screenshot['accumulated_distance']:.2f} km (no new activity)")
     
     print(f"\nFiltered from {len(screenshot_metadata)} to {len(filtered_screenshots)} screenshots")
     return filtered_screenshots
 
-def load_screenshot_metadata():
+def read_frame(image_path):
+    """
+    Read a frame as a BGR array from a PNG or a raw RGB .npy file
+    """
+    if Path(image_path).suffix == '.npy':
+        return cv2.cvtColor(np.load(image_path), cv2.COLOR_RGB2BGR)
+    return cv2.imread(str(image_path))
+
+def timed_read_frame(image_path, timer):
+    """
+    read_frame() timed as the frame's decode stage
+    """
+    with timer.stage('decode', Path(image_path).stem):
+        return read_frame(image_path)
+
+def prefetch_frames(image_paths, prefetch_depth=8, workers=2, timer=None):
+    """
+    Yield decoded frames in the same order as image_paths while a thread pool
+    decodes ahead of the consumer, so decoding overlaps overlay drawing and encoding
+    At most prefetch_depth frames are decoded but not yet consumed (0 = read serially)
+    Decoding is timed as the 'decode' stage of timer (a StageTimer)
+    """
+    timer = timer if timer is not None else StageTimer()
+    if prefetch_depth <= 0:
+        for image_path in image_paths:
+            yield timed_read_frame(image_path, timer)
+        return
+    
+    timer.capacity['decode'] = workers
+    
+    paths = iter(image_paths)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for image_path in paths:
+                pending.append(executor.submit(timed_read_frame, image_path, timer))
+                if len(pending) >= prefetch_depth:
+                    break
+            while pending:
+                frame = pending.popleft().result()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    pending.append(executor.submit(timed_read_frame, next_path, timer))
+                yield frame
+        finally:
+            # Stop decoding ahead if the consumer gives up early
+            for future in pending:
+                future.cancel()
+
+class OverlayRenderer:
+    """
+    Draws text labels on semi-transparent dark backgrounds
+
+    Font metrics are computed once per video, and only the label background
+    rectangles are blended in place instead of blending a full-frame copy.
+    The result is pixel-identical to drawing the rectangles on a copy of the
+    frame and applying cv2.addWeighted to the whole frame.
+
+    Args:
+    width, height: Frame size
+    font_scale: Defaults to height / 1000
+    font_thickness: Defaults to max(1, int(height / 500))
+    font_color: BGR text color
+    alpha: Opacity of the label backgrounds
+    padding: Distance of the labels from the frame edges
+    rect_pad: Padding of the background around the text
+    line_gap: Vertical gap between stacked labels
+    """
+    def __init__(
+        self,
+        width,
+        height,
+        font=cv2.FONT_HERSHEY_SIMPLEX,
+        font_scale=None,
+        font_thickness=None,
+        font_color=(255, 255, 255),
+        alpha=0.6,
+        padding=20,
+        rect_pad=5,
+        line_gap=10
+    ):
+        self.width = width
+        self.height = height
+        self.font = font
+        self.font_scale = height / 1000 if font_scale is None else font_scale  # Scale font based on image height
+        self.font_thickness = max(1, int(height / 500)) if font_thickness is None else font_thickness
+        self.font_color = font_color
+        self.alpha = alpha
+        self.padding = padding
+        self.rect_pad = rect_pad
+        self.line_gap = line_gap
+        
+        # Hershey fonts: the text height is constant and the width is the rounded
+        # sum of scaled glyph advances plus the thickness (as in cv2.getTextSize)
+        self.text_height = cv2.getTextSize("0", font, self.font_scale, self.font_thickness)[0][1]
+        self.advances = {
+            chr(c): cv2.getTextSize(chr(c), font, 1.0, 0)[0][0] for c in range(32, 127)
+        }
+
+    def text_size(self, text):
+        """
+        Same (width, height) as cv2.getTextSize, without calling it per frame
+        """
+        view_x = 0.0
+        for char in text:
+            advance = self.advances.get(char)
+            if advance is None:
+                return tuple(cv2.getTextSize(text, self.font, self.font_scale, self.font_thickness)[0])
+            view_x += advance * self.font_scale
+        return round(view_x + self.font_thickness), self.text_height
+
+    def stats_labels(self, date_text, distance_text, days_text):
+        """
+        Layout of the standard overlays: date (bottom right), distance (bottom left)
+        and days (above distance)
+        Returns list of (text, (x, y), (width, height)) labels for render()
+        """
+        date_size = self.text_size(date_text)
+        distance_size = self.text_size(distance_text)
+        days_size = self.text_size(days_text)
+        bottom = self.height - self.padding
+        return [
+            (date_text, (self.width - date_size[0] - self.padding, bottom), date_size),
+            (distance_text, (self.padding, bottom), distance_size),
+            (days_text, (self.padding, bottom - distance_size[1] - self.line_gap), days_size)
+        ]
+
+    def background_rect(self, position, size):
+        """
+        Inclusive (x1, y1, x2, y2) background rectangle of a label, clipped to the frame
+        Returns None if the rectangle is entirely outside the frame
+        """
+        x, y = position
+        x1 = max(x - self.rect_pad, 0)
+        y1 = max(y - size[1] - self.rect_pad, 0)
+        x2 = min(x + size[0] + self.rect_pad, self.width - 1)
+        y2 = min(y + self.rect_pad, self.height - 1)
+        if x1 > x2 or y1 > y2:
+            return None
+        return x1, y1, x2, y2
+
+    def render(self, image, labels):
+        """
+        Draw labels (text, (x, y), (width, height)) onto image in place
+        """
+        rects = [self.background_rect(position, size) for _, position, size in labels]
+        
+        # Overlapping backgrounds are darkened once, like a single full-frame blend
+        for group in _overlapping_groups([r for r in rects if r is not None]):
+            x1 = min(r[0] for r in group)
+            y1 = min(r[1] for r in group)
+            x2 = max(r[2] for r in group)
+            y2 = max(r[3] for r in group)
+            roi = image[y1:y2 + 1, x1:x2 + 1]
+            blended = cv2.addWeighted(np.zeros_like(roi), self.alpha, roi, 1 - self.alpha, 0)
+            if len(group) == 1:
+                roi[:] = blended
+            else:
+                mask = np.zeros(roi.shape[:2], dtype=bool)
+                for rx1, ry1, rx2, ry2 in group:
+                    mask[ry1 - y1:ry2 - y1 + 1, rx1 - x1:rx2 - x1 + 1] = True
+                roi[mask] = blended[mask]
+        
+        for text, position, _ in labels:
+            cv2.putText(image, text, position, self.font, self.font_scale, self.font_color, self.font_thickness, cv2.LINE_AA)
+        return image
+
+def _overlapping_groups(rects):
+    """
+    Group inclusive (x1, y1, x2, y2) rectangles into sets of transitively overlapping ones
+    """
+    groups = []
+    for rect in rects:
+        merged = [rect]
+        for group in groups[:]:
+            if any(rect[0] <= r[2] and r[0] <= rect[2] and rect[1] <= r[3] and r[1] <= rect[3] for r in group):
+                merged.extend(group)
+                groups.remove(group)
+        groups.append(merged)
+    return groups
+
+def load_screenshot_metadata(metadata_file='screenshot_metadata.json'):
     """
     Load metadata about screenshots for Tallinn Streets activities only
     """
     try:
-        with open('screenshot_metadata.json', 'r') as f:
+        with open(metadata_file, 'r') as f:
             metadata = json.load(f)
         
         # Get the screenshot dates
@@ -46,9 +250,9 @@ def load_screenshot_metadata():
         
         print(f"Loaded metadata for {len(screenshot_dates)} total screenshots")
         
-        # Filter to only include screenshots where day count increases
+        # Filter to only include screenshots where day count increases, and hold days
         print("Filtering for unique activities only...")
-        filtered_dates = filter_unique_activities(screenshot_dates)
+        filtered_dates = filter_unique_activities(screenshot_dates, metadata.get('hold_dates'))
         
         return filtered_dates
         
@@ -60,7 +264,16 @@ def create_video_from_images(
     input_folder="cropped_screenshots",
     output_filename="timelapse.mp4",
     fps=2,
-    date_format="%Y-%m-%d"
+    date_format="%Y-%m-%d",
+    prefetch_depth=8,
+    encoder="auto",
+    encoder_options=None,
+    segments=1,
+    metadata_file="screenshot_metadata.json",
+    title="Tallinn Streets",
+    frame_store=None,
+    journal_file="capture_journal.json",
+    timer=None
 ):
     """
     Create a video from PNG images with date overlay and accumulated stats
@@ -71,15 +284,161 @@ def create_video_from_images(
     output_filename: Name of the output video file
     fps: Frames per second for the video
     date_format: Format to display the date
+    prefetch_depth: Number of frames decoded ahead in background threads (0 = no prefetching)
+    encoder: "ffmpeg", "opencv" or "auto" (ffmpeg if installed, otherwise the OpenCV mp4v writer)
+    encoder_options: Encoder settings, e.g. {"codec": "libx264", "preset": "slow", "crf": 20, "threads": 0}
+    segments: Encode this many contiguous segments in parallel processes and join them
+              with a stream-copy concat (needs ffmpeg)
+    metadata_file: Metadata written by the screenshot script
+    title: Name of the challenge shown in messages
+    frame_store: Frame store folder to read the frames from instead of input_folder
+    journal_file: Capture journal whose frame fingerprints collapse identical
+                  consecutive captures into one held frame (None disables)
+    timer: StageTimer for the decode, overlay and encode stages
     """
+    timer = timer if timer is not None else StageTimer()
     # Load metadata for accumulated stats (filtered for unique activities only)
-    screenshot_metadata = load_screenshot_metadata()
+    screenshot_metadata = load_screenshot_metadata(metadata_file)
     
     if not screenshot_metadata:
         print("No screenshot metadata available. Processing all images without overlays.")
         screenshot_metadata = []
     
-    # Get list of PNG files that correspond to our filtered metadata
+    if frame_store:
+        png_files, metadata_lookup, all_png_files, target_dates = find_store_frames(frame_store, screenshot_metadata)
+    else:
+        png_files, metadata_lookup, all_png_files, target_dates = find_frame_files(input_folder, screenshot_metadata)
+    
+    if not png_files:
+        print(f"No PNG files found in {frame_store or input_folder} for the filtered dates")
+        print(f"Looking for files: {sorted(target_dates)}")
+        print(f"Available files: {sorted([f.name for f in all_png_files])}")
+        return
+    
+    print(f"Processing {len(png_files)} images (filtered from {len(all_png_files)} total)")
+    for png_file in png_files:
+        meta = metadata_lookup.get(png_file.stem, {})
+        print(f"  Will process: {png_file.name} - Day {meta.get('accumulated_days', '?')}, {meta.get('accumulated_distance', 0):.2f} km")
+    
+    journal_entries = load_frame_fingerprints(journal_file) if journal_file else {}
+    fingerprints = frame_fingerprints(png_files, journal_entries, frame_store)
+    
+    # Read first image to get dimensions
+    first_image = FrameStore(frame_store).frame(png_files[0].stem) if frame_store else read_frame(png_files[0])
+    height, width = first_image.shape[:2]
+    
+    encoder_options = encoder_options or {}
+    if segments > 1 and not ffmpeg_available(encoder_options.get('ffmpeg_path', 'ffmpeg')):
+        print("ffmpeg not found, segments cannot be concatenated. Encoding a single segment.")
+        segments = 1
+    segments = max(1, min(segments, len(png_files)))
+    
+    if segments == 1:
+        encode_frames(
+            png_files, metadata_lookup, output_filename, fps, width, height,
+            date_format, prefetch_depth, encoder, encoder_options,
+            frame_store=frame_store, fingerprints=fingerprints, timer=timer
+        )
+    else:
+        # Contiguous frame ranges, each encoded in its own process
+        bounds = np.linspace(0, len(png_files), segments + 1).astype(int)
+        output_path = Path(output_filename)
+        segment_folder = output_path.with_name(output_path.stem + "_segments")
+        segment_folder.mkdir(exist_ok=True)
+        
+        tasks = []
+        for index in range(segments):
+            segment_file = str(segment_folder / f"segment_{index:03d}{output_path.suffix}")
+            tasks.append((
+                png_files[bounds[index]:bounds[index + 1]], metadata_lookup, segment_file,
+                fps, width, height, date_format, prefetch_depth, encoder, encoder_options,
+                bounds[index] + 1, len(png_files), frame_store, fingerprints
+            ))
+        
+        segment_files = [task[2] for task in tasks]
+        print(f"Encoding {len(png_files)} frames in {segments} parallel segments...")
+        with ProcessPoolExecutor(max_workers=segments) as executor:
+            for stats in executor.map(_encode_segment, tasks):
+                timer.merge(stats)
+        
+        print("Joining segments without re-encoding...")
+        with timer.stage('concat'):
+            concat_videos(segment_files, output_filename, encoder_options.get('ffmpeg_path', 'ffmpeg'))
+        for segment_file in segment_files:
+            os.remove(segment_file)
+        segment_folder.rmdir()
+    
+    timer.count_bytes(os.path.getsize(output_filename))
+    print(f"\nVideo created successfully: {output_filename}")
+    print(f"Video contains {len(png_files)} frames showing progression through {title} activities")
+
+def load_frame_fingerprints(journal_file="capture_journal.json"):
+    """
+    Capture journal entries that have a fingerprint by YYYYMMDD, read from the
+    screenshot script's capture journal
+    Returns empty dict if the journal is missing or has no fingerprints
+    """
+    try:
+        with open(journal_file, 'r') as f:
+            captures = json.load(f).get('captures', {})
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"Warning: Could not read frame fingerprints from {journal_file}: {e}")
+        return {}
+    return {
+        date_str.replace('-', ''): entry
+        for date_str, entry in captures.items() if entry.get('fingerprint')
+    }
+
+def journal_entry_matches(entry, image_path):
+    """
+    True if a capture journal entry was recorded for this very file and its
+    content has not changed since
+    """
+    try:
+        if os.path.abspath(entry['file']) != os.path.abspath(image_path):
+            return False
+        if os.path.getsize(image_path) != entry['size']:
+            return False
+        return file_sha256(image_path) == entry['sha256']
+    except (KeyError, TypeError, OSError):
+        return False
+
+def frame_fingerprints(png_files, journal_entries, frame_store=None):
+    """
+    Fingerprints by YYYYMMDD of the frames about to be read
+    A journal fingerprint is only used if its entry's file is the frame being
+    read and still has the recorded SHA-256. A stale journal (after an offline
+    re-render, or for another folder or the frame store) would otherwise
+    collapse the wrong frames, so those frames are fingerprinted fresh.
+    Frames without a journal fingerprint get none (they are never collapsed).
+    """
+    if not journal_entries:
+        return {}
+    store = FrameStore(frame_store) if frame_store else None
+    fingerprints = {}
+    fresh = 0
+    for image_path in png_files:
+        entry = journal_entries.get(image_path.stem)
+        if entry is None:
+            continue
+        if store is None and journal_entry_matches(entry, image_path):
+            fingerprints[image_path.stem] = entry['fingerprint']
+            continue
+        frame = store.frame(image_path.stem) if store is not None else read_frame(image_path)
+        if frame is not None:
+            fingerprints[image_path.stem] = frame_fingerprint(frame)
+            fresh += 1
+    if fresh:
+        print(f"Fingerprinted {fresh} frames whose capture journal entry does not match the file")
+    return fingerprints
+
+def find_frame_files(input_folder, screenshot_metadata):
+    """
+    Match frame files in input_folder to the metadata dates
+    Returns tuple of (sorted frame files, metadata by YYYYMMDD, all files found, wanted YYYYMMDD dates)
+    """
     input_path = Path(input_folder)
     
     # Create a set of dates we want to process
@@ -90,141 +449,319 @@ def create_video_from_images(
         # Convert date to filename format (YYYYMMDD)
         date_obj = datetime.strptime(meta['date'], '%Y-%m-%d')
         filename_date = date_obj.strftime('%Y%m%d')
-        target_dates.add(filename_date + '.png')
-        metadata_lookup[filename_date + '.png'] = meta
+        target_dates.add(filename_date)
+        metadata_lookup[filename_date] = meta
     
-    # Get all PNG files and filter for only the ones we want
-    all_png_files = list(input_path.glob("*.png"))
-    png_files = [f for f in all_png_files if f.name in target_dates]
-    png_files = sorted(png_files)  # Sort by filename (which is date-based)
-    
-    if not png_files:
-        print(f"No PNG files found in {input_folder} for the filtered dates")
-        print(f"Looking for files: {sorted(target_dates)}")
-        print(f"Available files: {sorted([f.name for f in all_png_files])}")
-        return
+    # Get all frame files (PNG or raw .npy) and filter for only the ones we want
+    all_png_files = list(input_path.glob("*.png")) + list(input_path.glob("*.npy"))
+    # One file per date, preferring the most recently written if both formats exist
+    frame_files = {}
+    for f in all_png_files:
+        if f.stem in target_dates:
+            if f.stem not in frame_files or f.stat().st_mtime > frame_files[f.stem].stat().st_mtime:
+                frame_files[f.stem] = f
+    png_files = sorted(frame_files.values())  # Sort by filename (which is date-based)
+    return png_files, metadata_lookup, all_png_files, target_dates
+
+def find_store_frames(store_folder, screenshot_metadata):
+    """
+    Like find_frame_files, for the frames of a frame store
+    The returned paths are YYYYMMDD.png names that only carry the date
+    """
+    store = FrameStore(store_folder)
+    metadata_lookup = {meta['date'].replace('-', ''): meta for meta in screenshot_metadata}
+    target_dates = set(metadata_lookup)
+    all_png_files = [Path(date_key + '.png') for date_key in store.dates()]
+    png_files = [f for f in all_png_files if f.stem in target_dates]
+    return png_files, metadata_lookup, all_png_files, target_dates
+
+def draw_frame_overlay(image, image_path, day_number, meta, overlay_renderer, date_format):
+    """
+    Draw date (bottom right), distance (bottom left) and days (above distance) onto a frame
+    day_number is the 1-based position of the frame in the video, so any frame
+    can be rendered without processing the ones before it
+    """
+    # Extract date from filename (expecting YYYYMMDD format)
+    date_match = re.search(r'(\d{8})', image_path.stem)
+    if not date_match:
+        return image
     
-    print(f"Processing {len(png_files)} images (filtered from {len(all_png_files)} total)")
-    for png_file in png_files:
-        meta = metadata_lookup.get(png_file.name, {})
-        print(f"  Will process: {png_file.name} - Day {meta.get('accumulated_days', '?')}, {meta.get('accumulated_distance', 0):.2f} km")
+    date_str = date_match.group(1)
+    # Convert to desired display format
+    date_obj = datetime.strptime(date_str, '%Y%m%d')
+    display_date = date_obj.strftime(date_format)
     
-    # Read first image to get dimensions
-    first_image = cv2.imread(str(png_files[0]))
-    height, width = first_image.shape[:2]
+    # Get accumulated stats from metadata
+    accumulated_distance = meta.get('accumulated_distance', 0)
     
-    # Initialize video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_writer = cv2.VideoWriter(
-        output_filename,
-        fourcc,
-        fps,
-        (width, height)
+    labels = overlay_renderer.stats_labels(
+        display_date,
+        f"{accumulated_distance:.1f} km",
+        f"Day {day_number}" if day_number > 0 else "Day 0"
     )
+    return overlay_renderer.render(image, labels)
+
+def encode_frames(
+    png_files,
+    metadata_lookup,
+    output_filename,
+    fps,
+    width,
+    height,
+    date_format,
+    prefetch_depth=8,
+    encoder="auto",
+    encoder_options=None,
+    first_frame_number=1,
+    total_frames=None,
+    frame_store=None,
+    fingerprints=None,
+    timer=None
+):
+    """
+    Decode, overlay and encode a contiguous run of frames into output_filename
+    first_frame_number is the position of png_files[0] in the whole video
+    With a frame_store folder the frames are mapped from the store instead of decoded
+    fingerprints (by YYYYMMDD, from the capture journal) collapse consecutive
+    identical captures: the first one is decoded once and held for the whole
+    run, with each date's own overlay
+    The decode, overlay and encode stages of every frame are timed with timer
+    """
+    timer = timer if timer is not None else StageTimer()
+    total_frames = total_frames or len(png_files)
+    video_writer = create_encoder(output_filename, fps, width, height, encoder, **(encoder_options or {}))
+    
+    # Font settings and metrics for overlays, computed once per video
+    overlay_renderer = OverlayRenderer(width, height)
     
-    # Font settings for overlays
-    font = cv2.FONT_HERSHEY_SIMPLEX
-    font_scale = height / 1000  # Scale font based on image height
-    font_thickness = max(1, int(height / 500))
-    font_color = (255, 255, 255)  # White color
+    if fingerprints:
+        runs = collapse_duplicates([fingerprints.get(image_path.stem) for image_path in png_files])
+    else:
+        runs = [[index] for index in range(len(png_files))]
+    held_files = [png_files[run[0]] for run in runs]
     
-    days = 0
     # Process each image
-    for i, image_path in enumerate(png_files, 1):
-        print(f"Processing image {i}/{len(png_files)}: {image_path.name}")
-        
-        # Read image
-        image = cv2.imread(str(image_path))
-        
-        # Get metadata for this image
-        meta = metadata_lookup.get(image_path.name, {})
-        
-        # Extract date from filename (expecting YYYYMMDD format)
-        date_match = re.search(r'(\d{8})', image_path.stem)
-        if date_match:
-            date_str = date_match.group(1)
-            # Convert to desired display format
-            date_obj = datetime.strptime(date_str, '%Y%m%d')
-            display_date = date_obj.strftime(date_format)
-            
-            # Get accumulated stats from metadata
-            accumulated_distance = meta.get('accumulated_distance', 0)
-            accumulated_days = meta.get('accumulated_days', 0)
-            days += 1
-            
-            # Prepare overlay texts
-            date_text = display_date
-            distance_text = f"{accumulated_distance:.1f} km"
-            days_text = f"Day {days}" if days > 0 else "Day 0"
-            
-            # Calculate positions and sizes for all texts
-            
-            # Date overlay (bottom right)
-            date_size = cv2.getTextSize(date_text, font, font_scale, font_thickness)[0]
-            date_padding = 20
-            date_x = width - date_size[0] - date_padding
-            date_y = height - date_padding
-            
-            # Distance overlay (bottom left)
-            distance_size = cv2.getTextSize(distance_text, font, font_scale, font_thickness)[0]
-            distance_x = date_padding
-            distance_y = height - date_padding
-            
-            # Days overlay (above distance, bottom left)
-            days_size = cv2.getTextSize(days_text, font, font_scale, font_thickness)[0]
-            days_x = date_padding
-            days_y = height - date_padding - distance_size[1] - 10  # 10px gap between texts
-            
-            # Create overlay with semi-transparent backgrounds
-            overlay = image.copy()
-            alpha = 0.6
-            rect_pad = 5
-            
-            # Background for date (bottom right)
-            date_rect_start = (date_x - rect_pad, date_y + rect_pad)
-            date_rect_end = (date_x + date_size[0] + rect_pad, date_y - date_size[1] - rect_pad)
-            cv2.rectangle(overlay, date_rect_start, date_rect_end, (0, 0, 0), -1)
-            
-            # Background for distance (bottom left)
-            distance_rect_start = (distance_x - rect_pad, distance_y + rect_pad)
-            distance_rect_end = (distance_x + distance_size[0] + rect_pad, distance_y - distance_size[1] - rect_pad)
-            cv2.rectangle(overlay, distance_rect_start, distance_rect_end, (0, 0, 0), -1)
+    if frame_store:
+        store = FrameStore(frame_store)
+        frames = (store.frame(image_path.stem) for image_path in held_files)
+    else:
+        frames = prefetch_frames(held_files, prefetch_depth, timer=timer)
+    frame_number = first_frame_number
+    for run, image in zip(runs, frames):
+        if len(run) > 1:
+            print(f"Holding {png_files[run[0]].name} for {len(run)} identical frames")
+        for position, index in enumerate(run):
+            image_path = png_files[index]
+            print(f"Processing image {frame_number}/{total_frames}: {image_path.name}")
             
-            # Background for days (above distance)
-            days_rect_start = (days_x - rect_pad, days_y + rect_pad)
-            days_rect_end = (days_x + days_size[0] + rect_pad, days_y - days_size[1] - rect_pad)
-            cv2.rectangle(overlay, days_rect_start, days_rect_end, (0, 0, 0), -1)
+            # The last frame of a run can draw on the decoded image itself
+            frame = image if position == len(run) - 1 else image.copy()
+            meta = metadata_lookup.get(image_path.stem, {})
+            with timer.stage('overlay', image_path.stem):
+                draw_frame_overlay(frame, image_path, frame_number, meta, overlay_renderer, date_format)
             
-            # Apply the overlay with transparency
-            image = cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0)
-            
-            # Add all text overlays
-            cv2.putText(image, date_text, (date_x, date_y), font, font_scale, font_color, font_thickness, cv2.LINE_AA)
-            cv2.putText(image, distance_text, (distance_x, distance_y), font, font_scale, font_color, font_thickness, cv2.LINE_AA)
-            cv2.putText(image, days_text, (days_x, days_y), font, font_scale, font_color, font_thickness, cv2.LINE_AA)
+            # Write frame to video
+            with timer.stage('encode', image_path.stem):
+                video_writer.write(frame)
+            timer.count_frames()
+            frame_number += 1
+    
+    # Release video writer (ffmpeg finishes encoding the buffered frames)
+    with timer.stage('encode'):
+        video_writer.close()
+
+class StreamingVideoWriter:
+    """
+    Overlays and encodes frames as they are captured or rendered, without
+    writing and re-reading intermediate PNGs
+    Only one frame is held in memory at a time, however many days there are
+
+    Args:
+    output_filename: Name of the output video file
+    fps: Frames per second for the video
+    screenshot_dates: Accumulated stats of every date (screenshot_metadata.json's screenshot_dates)
+    date_format: Format to display the date
+    encoder, encoder_options: As for create_video_from_images
+    archive_folder: Also save every raw frame as YYYYMMDD.png here (None disables)
+    timer: StageTimer for the overlay, encode and png encode stages and the bytes written
+    hold_dates: Hold days of the capture plan, encoded although no activity was added
+    """
+    def __init__(
+        self,
+        output_filename="timelapse.mp4",
+        fps=2,
+        screenshot_dates=None,
+        date_format="%Y-%m-%d",
+        encoder="auto",
+        encoder_options=None,
+        archive_folder=None,
+        timer=None,
+        hold_dates=None
+    ):
+        self.output_filename = output_filename
+        self.timer = timer if timer is not None else StageTimer()
+        self.fps = fps
+        self.date_format = date_format
+        self.encoder = encoder
+        self.encoder_options = encoder_options or {}
+        self.archive_folder = archive_folder
+        # Same frames as the PNG workflow: dates where a new activity was added, and hold days
+        self.metadata_lookup = {
+            meta['date']: meta for meta in filter_unique_activities(list(screenshot_dates or []), hold_dates)
+        }
+        self.video_writer = None
+        self.overlay_renderer = None
+        self.frame_count = 0
+
+    def write(self, date_str, image):
+        """
+        Archive, overlay and encode the BGR frame of a YYYY-MM-DD date
+        Returns False (after archiving) if the date is not part of the video
+        """
+        file_date = date_str.replace('-', '')
+        if self.archive_folder:
+            os.makedirs(self.archive_folder, exist_ok=True)
+            archive_path = os.path.join(self.archive_folder, file_date + '.png')
+            with self.timer.stage('png encode', file_date):
+                cv2.imwrite(archive_path, image, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            self.timer.count_bytes(os.path.getsize(archive_path))
+        meta = self.metadata_lookup.get(date_str)
+        if meta is None:
+            return False
+        
+        if self.video_writer is None:
+            height, width = image.shape[:2]
+            self.video_writer = create_encoder(self.output_filename, self.fps, width, height, self.encoder, **self.encoder_options)
+            self.overlay_renderer = OverlayRenderer(width, height)
         
-        # Write frame to video
-        video_writer.write(image)
+        self.frame_count += 1
+        with self.timer.stage('overlay', file_date):
+            draw_frame_overlay(image, Path(file_date + '.png'), self.frame_count, meta, self.overlay_renderer, self.date_format)
+        with self.timer.stage('encode', file_date):
+            self.video_writer.write(image)
+        return True
+
+    def close(self):
+        if self.video_writer is not None:
+            with self.timer.stage('encode'):
+                self.video_writer.close()
+            self.video_writer = None
+            self.timer.count_bytes(os.path.getsize(self.output_filename))
+            print(f"\nVideo created successfully: {self.output_filename} ({self.frame_count} frames)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _encode_segment(task):
+    """
+    Process pool entry point for encoding one segment
+    Returns the segment's StageTimer counters for the parent's timer
+    """
+    timer = StageTimer()
+    encode_frames(*task, timer=timer)
+    return timer.export()
+
+def create_batch_videos(
+    challenges_root="challenges",
+    output_name="timelapse.mp4",
+    fps=2,
+    date_format="%Y-%m-%d",
+    prefetch_depth=8,
+    encoder="auto",
+    encoder_options=None,
+    timer=None
+):
+    """
+    Render one video per challenge folder written by the screenshot script's batch mode
+    Challenges that share captured frames decode each shared frame only once
+    and every video is written in the same pass
+    The decode, overlay and encode stages are timed with timer
+    """
+    timer = timer if timer is not None else StageTimer()
+    videos = []
+    for metadata_file in sorted(Path(challenges_root).glob("*/screenshot_metadata.json")):
+        with open(metadata_file, 'r') as f:
+            metadata = json.load(f)
+        title = metadata.get('title', metadata_file.parent.name)
+        print(f"\nChallenge '{title}':")
+        screenshot_metadata = load_screenshot_metadata(str(metadata_file)) or []
+        frames_folder = metadata.get('frames_folder', 'cropped_screenshots')
+        png_files, metadata_lookup, _, _ = find_frame_files(frames_folder, screenshot_metadata)
+        if not png_files:
+            print(f"No frames found in {frames_folder} for '{title}', skipping")
+            continue
+        videos.append({
+            'title': title,
+            'output_filename': str(metadata_file.parent / output_name),
+            'frames': set(png_files),
+            'metadata_lookup': metadata_lookup,
+            'frame_count': len(png_files),
+            'frame_number': 0
+        })
     
-    # Release video writer
-    video_writer.release()
-    print(f"\nVideo created successfully: {output_filename}")
-    print(f"Video contains {len(png_files)} frames showing progression through Tallinn Streets activities")
+    if not videos:
+        print(f"No challenge frames found under {challenges_root}")
+        return
+    
+    # Every distinct frame once, in date order, so each video receives its frames in order
+    unique_files = sorted(set().union(*(video['frames'] for video in videos)), key=lambda f: (f.stem, str(f)))
+    total_frames = sum(video['frame_count'] for video in videos)
+    print(f"\nRendering {len(videos)} videos ({total_frames} frames) from {len(unique_files)} decoded frames")
+    
+    try:
+        for image_path, image in zip(unique_files, prefetch_frames(unique_files, prefetch_depth, timer=timer)):
+            consumers = [video for video in videos if image_path in video['frames']]
+            for index, video in enumerate(consumers):
+                if 'writer' not in video:
+                    height, width = image.shape[:2]
+                    video['writer'] = create_encoder(video['output_filename'], fps, width, height, encoder, **(encoder_options or {}))
+                    video['overlay_renderer'] = OverlayRenderer(width, height)
+                
+                # The last consumer can draw on the decoded frame itself
+                frame = image if index == len(consumers) - 1 else image.copy()
+                video['frame_number'] += 1
+                meta = video['metadata_lookup'].get(image_path.stem, {})
+                with timer.stage('overlay', image_path.stem):
+                    draw_frame_overlay(frame, image_path, video['frame_number'], meta, video['overlay_renderer'], date_format)
+                with timer.stage('encode', image_path.stem):
+                    video['writer'].write(frame)
+                timer.count_frames()
+            print(f"Processed {image_path.name} for {len(consumers)} video(s)")
+    finally:
+        for video in videos:
+            if 'writer' in video:
+                with timer.stage('encode'):
+                    video['writer'].close()
+    
+    for video in videos:
+        timer.count_bytes(os.path.getsize(video['output_filename']))
+        print(f"\nVideo created successfully: {video['output_filename']}")
+        print(f"Video contains {video['frame_count']} frames showing progression through {video['title']} activities")
 
-def main():
+def main(timer=None):
     print("Starting video creation process...")
     
+    if batch_mode:
+        create_batch_videos(challenges_folder, fps=3, date_format="%B %d, %Y", timer=timer)
+        return
+    
     # Verify input folder exists
-    if not os.path.exists("cropped_screenshots"):
-        print("Error: 'cropped_screenshots' folder not found!")
+    frames_folder = frame_store_folder if use_frame_store else "cropped_screenshots"
+    if not os.path.exists(frames_folder):
+        print(f"Error: '{frames_folder}' folder not found!")
         return
     
     # Create video with default settings
     create_video_from_images(
         fps=3,  # 2 frames per second
-        date_format="%B %d, %Y"  # e.g., "January 01, 2024"
+        date_format="%B %d, %Y",  # e.g., "January 01, 2024"
+        frame_store=frame_store_folder if use_frame_store else None,
+        timer=timer
     )
     
 if __name__ == "__main__":
-    import os
-    main()
\ No newline at end of file
+    with instrumented_run("create_video", run_report_folder) as run_timer:
+        main(run_timer)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import json
+
+def save_crop_bounds(crop_bounds, path="crop_bounds.json"):
+    """
+    Save crop bounds (left, top, right, bottom) selected with CropSelector
+    """
+    left, top, right, bottom = crop_bounds
+    with open(path, 'w') as f:
+        json.dump({'left': left, 'top': top, 'right': right, 'bottom': bottom}, f, indent=2)
+
+def load_crop_bounds(path="crop_bounds.json"):
+    """
+    Load saved crop bounds
+    Returns tuple of (left, top, right, bottom) or None if no bounds are saved
+    """
+    try:
+        with open(path, 'r') as f:
+            bounds = json.load(f)
+        crop_bounds = (int(bounds['left']), int(bounds['top']), int(bounds['right']), int(bounds['bottom']))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Warning: Could not read crop bounds from {path}: {e}")
+        return None
+
+    left, top, right, bottom = crop_bounds
+    if right <= left or bottom <= top:
+        print(f"Warning: Ignoring empty crop bounds in {path}: {crop_bounds}")
+        return None
+    return crop_bounds
+
+def crop_region(monitor_bounds, crop_bounds):
+    """
+    Turn crop bounds (relative to the monitor screenshot) into an mss grab
+    region in absolute screen coordinates
+    """
+    left, top, right, bottom = crop_bounds
+    if left < 0 or top < 0 or right > monitor_bounds['width'] or bottom > monitor_bounds['height']:
+        raise ValueError(f"Crop bounds {crop_bounds} do not fit the monitor {monitor_bounds}")
+    return {
+        "top": monitor_bounds['top'] + top,
+        "left": monitor_bounds['left'] + left,
+        "width": right - left,
+        "height": bottom - top
+    }
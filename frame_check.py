@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+
+# Luma weights for B, G, R
+GRAY_WEIGHTS = np.array([0.114, 0.587, 0.299], dtype=np.float32)
+
+def frame_fingerprint(frame, rgb=False, hash_size=16, lit_red=128, lit_margin=48):
+    """
+    Cheap fingerprint of a heatmap frame
+
+    Args:
+    frame: (height, width, 3) uint8 frame, BGR unless rgb is set
+    hash_size: The frame is averaged down to hash_size x hash_size for the perceptual hash
+    lit_red, lit_margin: A pixel is lit (part of the orange heatmap) when its red
+                         channel is at least lit_red and exceeds blue by lit_margin
+    Returns dict with 'hash' (hex average hash of the downscaled grayscale frame)
+    and 'lit' (number of lit pixels)
+    """
+    red = frame[:, :, 0 if rgb else 2]
+    blue = frame[:, :, 2 if rgb else 0]
+    lit = np.count_nonzero((red >= lit_red) & (red.astype(np.int16) - blue >= lit_margin))
+
+    small = cv2.resize(np.ascontiguousarray(frame), (hash_size, hash_size), interpolation=cv2.INTER_AREA)
+    gray = small.astype(np.float32) @ (GRAY_WEIGHTS[::-1] if rgb else GRAY_WEIGHTS)
+    bits = np.packbits(gray > gray.mean())
+    return {'hash': bits.tobytes().hex(), 'lit': int(lit)}
+
+def hash_distance(hash_a, hash_b):
+    """
+    Number of differing bits between two hex hashes
+    """
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+def is_duplicate(fingerprint, previous, max_distance=0, lit_tolerance=0):
+    """
+    True if two fingerprints show the same heatmap
+    """
+    if fingerprint is None or previous is None:
+        return False
+    return (
+        hash_distance(fingerprint['hash'], previous['hash']) <= max_distance and
+        abs(fingerprint['lit'] - previous['lit']) <= lit_tolerance
+    )
+
+def collapse_duplicates(fingerprints, max_distance=0, lit_tolerance=0):
+    """
+    Group consecutive identical frames
+    fingerprints is a list in frame order (None where unknown, never collapsed)
+    Returns list of runs, each a list of frame indices whose first frame can
+    be held for the whole run
+    """
+    runs = []
+    for index, fingerprint in enumerate(fingerprints):
+        if runs and is_duplicate(fingerprint, fingerprints[runs[-1][0]], max_distance, lit_tolerance):
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+def coverage_drops(fingerprints, tolerance=0.02):
+    """
+    Indices of frames whose lit pixel count fell more than tolerance (a fraction)
+    below the last good frame before them
+    The heatmap only ever grows, so a drop means a blank or half-loaded capture
+    """
+    drops = []
+    last_lit = None
+    for index, fingerprint in enumerate(fingerprints):
+        if fingerprint is None:
+            continue
+        if last_lit is not None and fingerprint['lit'] < last_lit * (1 - tolerance):
+            drops.append(index)
+        else:
+            last_lit = fingerprint['lit']
+    return drops
@@ -0,0 +1,143 @@
+import os
+import time
+import numpy as np
+from capture_journal import atomic_write_json, read_json_or_empty
+
+class FrameStore:
+    """
+    Every cropped frame of a timelapse in one memory-mapped uint8 array of
+    shape (frames, height, width, 3), so the video can be re-rendered without
+    decoding PNGs again
+
+    frames.u8 holds the BGR frames back to back and index.json maps YYYYMMDD
+    dates to their slot. New dates are appended after the existing frames and a
+    re-cropped date is overwritten in its own slot, so existing data is never
+    rewritten.
+    """
+    def __init__(self, folder="frame_store"):
+        self.folder = folder
+        self.data_path = os.path.join(folder, 'frames.u8')
+        self.index_path = os.path.join(folder, 'index.json')
+        self.height = None
+        self.width = None
+        # Allocated slots, including ones whose write failed
+        self.slot_count = 0
+        self.slots = {}
+        # When each date was last written, to skip up-to-date frames
+        self.written = {}
+        self.load()
+
+    @property
+    def frame_bytes(self):
+        return self.height * self.width * 3
+
+    def load(self):
+        """
+        Load the index, starting empty (and dropping any frames) if the store is missing or unreadable
+        """
+        index = read_json_or_empty(self.index_path)
+        try:
+            self.height = index['height']
+            self.width = index['width']
+            self.slot_count = index['slot_count']
+            self.slots = index['slots']
+            self.written = index['written']
+        except KeyError:
+            self.reset(None, None)
+
+    def save_index(self):
+        os.makedirs(self.folder, exist_ok=True)
+        atomic_write_json(self.index_path, {
+            'height': self.height,
+            'width': self.width,
+            'slot_count': self.slot_count,
+            'slots': self.slots,
+            'written': self.written
+        })
+
+    def reset(self, height, width):
+        """
+        Drop every frame and start over with a new frame size
+        """
+        self.height = height
+        self.width = width
+        self.slot_count = 0
+        self.slots = {}
+        self.written = {}
+        if os.path.exists(self.data_path):
+            os.remove(self.data_path)
+
+    def __contains__(self, date_key):
+        return date_key in self.slots
+
+    def dates(self):
+        """
+        Stored YYYYMMDD dates in order
+        """
+        return sorted(self.slots)
+
+    def is_up_to_date(self, date_key, source_mtime):
+        return date_key in self.slots and self.written.get(date_key, 0) >= source_mtime
+
+    def reserve(self, date_key, height, width):
+        """
+        Slot for a date's frame, appending a new one (and growing frames.u8) if needed
+        """
+        if self.height is None:
+            self.height, self.width = height, width
+        if (height, width) != (self.height, self.width):
+            raise ValueError(f"Frame size {width}x{height} does not match the store's {self.width}x{self.height}")
+        slot = self.slots.get(date_key)
+        if slot is None:
+            slot = self.slot_count
+            self.slot_count += 1
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self.data_path, 'ab') as f:
+                f.truncate(self.slot_count * self.frame_bytes)
+        return slot
+
+    def commit(self, date_key, slot):
+        """
+        Index a frame written to its reserved slot
+        """
+        self.slots[date_key] = slot
+        self.written[date_key] = time.time()
+
+    def put(self, date_key, frame):
+        """
+        Write one BGR frame and index it
+        """
+        slot = self.reserve(date_key, frame.shape[0], frame.shape[1])
+        write_frame_slot(self.data_path, slot, frame)
+        self.commit(date_key, slot)
+
+    def frame(self, date_key):
+        """
+        Copy-on-write view of a date's frame in the mapped file: nothing is
+        decoded or copied up front, and only the pages that get drawn on
+        (e.g. by overlays) are copied in memory
+        """
+        return np.memmap(
+            self.data_path, dtype=np.uint8, mode='c',
+            offset=self.slots[date_key] * self.frame_bytes, shape=(self.height, self.width, 3)
+        )
+
+    def frames(self):
+        """
+        Read-only array of every slot, shape (slots, height, width, 3)
+        """
+        return np.memmap(
+            self.data_path, dtype=np.uint8, mode='r',
+            shape=(self.slot_count, self.height, self.width, 3)
+        )
+
+def write_frame_slot(data_path, slot, frame):
+    """
+    Write a BGR frame into its slot of frames.u8 (safe from several processes
+    as long as each writes its own slot)
+    """
+    frame_bytes = frame.shape[0] * frame.shape[1] * 3
+    target = np.memmap(data_path, dtype=np.uint8, mode='r+', offset=slot * frame_bytes, shape=frame.shape)
+    target[:] = frame
+    target.flush()
+    del target
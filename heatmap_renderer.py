@@ -0,0 +1,396 @@
+import gzip
+import io
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+import cv2
+import numpy as np
+
+try:
+    import fitdecode
+except ImportError:
+    fitdecode = None
+
+# Map position of the Strava heatmap URL (#zoom/lat/lon)
+DEFAULT_VIEW = "10.83/59.4333/24.7447"
+# FIT positions are stored in semicircles
+SEMICIRCLES_TO_DEGREES = 180 / 2 ** 31
+
+def _open_track_file(path):
+    path = str(path)
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _parse_time(text):
+    """
+    ISO 8601 timestamp of a GPX/TCX point as POSIX seconds (NaN if missing or malformed)
+    """
+    if not text:
+        return math.nan
+    try:
+        value = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return math.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _read_gpx(f):
+    points = []
+    for _, elem in ET.iterparse(f):
+        if _local_name(elem.tag) == 'trkpt':
+            time_text = next((child.text for child in elem if _local_name(child.tag) == 'time'), None)
+            points.append((float(elem.get('lat')), float(elem.get('lon')), _parse_time(time_text)))
+            elem.clear()
+    return points
+
+def _read_tcx(f):
+    points = []
+    for _, elem in ET.iterparse(f):
+        if _local_name(elem.tag) == 'Trackpoint':
+            values = {}
+            for child in elem:
+                if _local_name(child.tag) == 'Position':
+                    values.update((_local_name(value.tag), value.text) for value in child)
+                else:
+                    values[_local_name(child.tag)] = child.text
+            if values.get('LatitudeDegrees') and values.get('LongitudeDegrees'):
+                points.append((
+                    float(values['LatitudeDegrees']),
+                    float(values['LongitudeDegrees']),
+                    _parse_time(values.get('Time'))
+                ))
+            elem.clear()
+    return points
+
+def _read_fit(f):
+    if fitdecode is None:
+        raise ImportError("Reading FIT files needs the fitdecode package (pip install fitdecode)")
+    points = []
+    with fitdecode.FitReader(f) as fit:
+        for frame in fit:
+            if isinstance(frame, fitdecode.FitDataMessage) and frame.name == 'record':
+                if frame.has_field('position_lat') and frame.has_field('position_long'):
+                    lat = frame.get_value('position_lat')
+                    lon = frame.get_value('position_long')
+                    if lat is not None and lon is not None:
+                        timestamp = frame.get_value('timestamp') if frame.has_field('timestamp') else None
+                        points.append((
+                            lat * SEMICIRCLES_TO_DEGREES,
+                            lon * SEMICIRCLES_TO_DEGREES,
+                            timestamp.timestamp() if timestamp is not None else math.nan
+                        ))
+    return points
+
+def read_track_points(path):
+    """
+    Read the track points of a GPX, TCX or FIT file (optionally gzipped)
+    Returns float64 array of shape (points, 3) with latitude, longitude and
+    POSIX time in seconds (NaN where the file has no timestamp)
+    """
+    name = str(path).lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.gpx'):
+        reader = _read_gpx
+    elif name.endswith('.tcx'):
+        reader = _read_tcx
+    elif name.endswith('.fit'):
+        reader = _read_fit
+    else:
+        raise ValueError(f"Unsupported track file: {path}")
+
+    with _open_track_file(path) as f:
+        if reader is _read_fit:
+            points = reader(f)
+        else:
+            # Garmin TCX files often start with whitespace before the XML declaration
+            points = reader(io.BytesIO(f.read().lstrip()))
+    return np.array(points, dtype=np.float64).reshape(-1, 3)
+
+def read_track(path):
+    """
+    Read the track points of a GPX, TCX or FIT file (optionally gzipped)
+    Returns float64 array of shape (points, 2) with latitude and longitude
+    """
+    return read_track_points(path)[:, :2]
+
+class Viewport:
+    """
+    Web Mercator view of the map, like the #zoom/lat/lon fragment of the heatmap URL
+
+    Args:
+    zoom: Map zoom level (fractional zoom allowed)
+    lat, lon: Map center
+    width, height: Frame size in pixels
+    tile_size: Pixel size of a zoom level 0 world (512 for Mapbox GL maps such as Strava's)
+    """
+    def __init__(self, zoom, lat, lon, width, height, tile_size=512):
+        self.zoom = zoom
+        self.lat = lat
+        self.lon = lon
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.world_size = tile_size * 2 ** zoom
+        self.center_x, self.center_y = self.world_pixels(np.array([[lat, lon]]))[0]
+
+    @classmethod
+    def from_fragment(cls, fragment, width, height, tile_size=512):
+        """
+        Viewport from a "#10.83/59.4333/24.7447" style URL fragment
+        """
+        zoom, lat, lon = (float(value) for value in fragment.lstrip('#').split('/')[:3])
+        return cls(zoom, lat, lon, width, height, tile_size)
+
+    @classmethod
+    def for_tile(cls, z, x, y, tile_size=512):
+        """
+        Viewport covering exactly the slippy map tile z/x/y
+        """
+        world_size = tile_size * 2 ** z
+        lon = (x + 0.5) * tile_size / world_size * 360.0 - 180.0
+        lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) * tile_size / world_size))))
+        return cls(z, lat, lon, tile_size, tile_size, tile_size)
+
+    def world_pixels(self, latlon):
+        """
+        Project (lat, lon) rows to absolute Web Mercator pixel coordinates at this zoom
+        """
+        lat = np.clip(latlon[:, 0], -85.05112878, 85.05112878)
+        x = (latlon[:, 1] + 180.0) / 360.0 * self.world_size
+        sin_lat = np.sin(np.radians(lat))
+        y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * self.world_size
+        return np.column_stack((x, y))
+
+    def project(self, latlon):
+        """
+        Project (lat, lon) rows to frame pixel coordinates
+        """
+        pixels = self.world_pixels(latlon)
+        pixels[:, 0] += self.width / 2 - self.center_x
+        pixels[:, 1] += self.height / 2 - self.center_y
+        return pixels
+
+def make_colormap(background=(18, 18, 18), color=(2, 76, 252), highlight=(170, 235, 255)):
+    """
+    256 entry BGR lookup table from the dark background through the heatmap
+    color (Strava orange by default) to a bright highlight for the densest streets
+    """
+    t = np.linspace(0.0, 1.0, 256)[:, None]
+    background = np.array(background, dtype=np.float64)
+    color = np.array(color, dtype=np.float64)
+    highlight = np.array(highlight, dtype=np.float64)
+    # First half fades in the color, the second half brightens it
+    low = background + (color - background) * np.clip(t * 2, 0, 1)
+    high = color + (highlight - color) * np.clip(t * 2 - 1, 0, 1)
+    lut = np.where(t < 0.5, low, high)
+    return np.round(lut).astype(np.uint8)
+
+class HeatmapRenderer:
+    """
+    Rasterizes GPS tracks into a float32 intensity canvas and colors it like
+    the Strava dark/orange personal heatmap
+
+    Args:
+    viewport: Viewport to render
+    line_width: Track line width in pixels
+    saturation: Number of passes over a street that reaches the brightest color
+    colormap: 256 entry BGR lookup table (see make_colormap)
+    """
+    def __init__(self, viewport, line_width=2, saturation=20, colormap=None):
+        self.viewport = viewport
+        self.line_width = line_width
+        self.saturation = saturation
+        self.colormap = make_colormap() if colormap is None else colormap
+
+    def new_canvas(self):
+        return np.zeros((self.viewport.height, self.viewport.width), dtype=np.float32)
+
+    def track_layer(self, latlon):
+        """
+        Rasterize one track into a uint8 layer (255 where the track passes),
+        so a track that crosses itself still counts as one pass
+        Returns None if the track has no points inside the frame
+        """
+        if len(latlon) < 2:
+            return None
+        pixels = self.viewport.project(latlon)
+        margin = self.line_width + 1
+        inside = (
+            (pixels[:, 0] > -margin) & (pixels[:, 0] < self.viewport.width + margin) &
+            (pixels[:, 1] > -margin) & (pixels[:, 1] < self.viewport.height + margin)
+        )
+        if not inside.any():
+            return None
+        layer = np.zeros((self.viewport.height, self.viewport.width), dtype=np.uint8)
+        # Fixed-point coordinates keep sub-pixel precision for the antialiased lines
+        shift = 4
+        points = np.round(pixels * (1 << shift)).astype(np.int32)
+        cv2.polylines(layer, [points.reshape(-1, 1, 2)], False, 255, self.line_width, cv2.LINE_AA, shift)
+        return layer
+
+    def add_track(self, canvas, latlon):
+        """
+        Add one track to an intensity canvas in place
+        """
+        layer = self.track_layer(latlon)
+        if layer is not None:
+            cv2.accumulate(layer.astype(np.float32) * (1 / 255), canvas)
+        return canvas
+
+    def colorize(self, canvas):
+        """
+        Turn an intensity canvas into a BGR frame
+        """
+        scale = 255 / math.log1p(self.saturation)
+        index = np.minimum(np.log1p(canvas) * scale, 255).astype(np.uint8)
+        return self.colormap[index]
+
+    def render(self, tracks):
+        """
+        Render a frame with all tracks (arrays of lat/lon rows)
+        """
+        canvas = self.new_canvas()
+        for latlon in tracks:
+            self.add_track(canvas, latlon)
+        return self.colorize(canvas)
+
+class HeatmapAccumulator:
+    """
+    Running intensity canvas for rendering frames in date order, so each
+    activity is stamped once instead of re-rendering every track for every frame
+
+    Snapshots of the canvas let a later run resume (or seek to a date)
+    without replaying every activity from the start date.
+
+    Args:
+    renderer: HeatmapRenderer that stamps and colors the canvas
+    snapshot_folder: Folder for canvas snapshots, None disables them
+    snapshot_interval: Save a snapshot every N frames, 0 disables them
+    snapshot_keep: Number of newest snapshots kept on disk, 0 keeps every one
+    """
+    def __init__(self, renderer, snapshot_folder=None, snapshot_interval=0, snapshot_keep=3):
+        self.renderer = renderer
+        self.snapshot_folder = snapshot_folder
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_keep = snapshot_keep
+        self.canvas = renderer.new_canvas()
+        # Last date whose activities are all on the canvas, and how many were stamped
+        self.cutoff = None
+        self.activity_count = 0
+        self.frames_since_snapshot = 0
+
+    def view_key(self):
+        """
+        Settings a snapshot must have been rendered with to be reused
+        """
+        viewport = self.renderer.viewport
+        return {
+            'view': [viewport.zoom, viewport.lat, viewport.lon, viewport.width, viewport.height, viewport.tile_size],
+            'line_width': self.renderer.line_width
+        }
+
+    def stamp(self, latlon):
+        """
+        Add one activity's track (None if it has no track) to the canvas
+        """
+        if latlon is not None:
+            self.renderer.add_track(self.canvas, latlon)
+        self.activity_count += 1
+
+    def advance(self, date_str):
+        """
+        Mark every activity up to date_str as stamped and return the frame for it
+        """
+        self.cutoff = date_str
+        frame = self.renderer.colorize(self.canvas)
+        self.frames_since_snapshot += 1
+        if self.snapshot_interval and self.frames_since_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+        return frame
+
+    def snapshot_path(self, date_str):
+        return os.path.join(self.snapshot_folder, f"canvas_{date_str.replace('-', '')}.npz")
+
+    def snapshot_names(self):
+        """
+        File names of the saved snapshots, newest cutoff first
+        """
+        if not self.snapshot_folder or not os.path.isdir(self.snapshot_folder):
+            return []
+        return sorted(
+            (name for name in os.listdir(self.snapshot_folder)
+             if name.startswith('canvas_') and name.endswith('.npz') and '.tmp' not in name),
+            reverse=True
+        )
+
+    def prune_snapshots(self, current):
+        """
+        Delete all but the snapshot_keep newest snapshots, never the current one
+        """
+        if not self.snapshot_keep:
+            return
+        kept = {os.path.basename(current)}
+        for name in self.snapshot_names():
+            if name in kept:
+                continue
+            if len(kept) < self.snapshot_keep:
+                kept.add(name)
+                continue
+            try:
+                os.remove(os.path.join(self.snapshot_folder, name))
+            except OSError as e:
+                print(f"Warning: Could not delete old canvas snapshot {name}: {e}")
+
+    def save_snapshot(self):
+        """
+        Store the canvas with its cutoff date and activity count
+        """
+        if not self.snapshot_folder or self.cutoff is None:
+            return
+        os.makedirs(self.snapshot_folder, exist_ok=True)
+        meta = {'cutoff': self.cutoff, 'activity_count': self.activity_count, **self.view_key()}
+        path = self.snapshot_path(self.cutoff)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, meta=np.array(json.dumps(meta)), canvas=self.canvas)
+        os.replace(tmp_path, path)
+        self.frames_since_snapshot = 0
+        self.prune_snapshots(path)
+
+    def restore(self, before_date, count_activities):
+        """
+        Load the latest usable snapshot with a cutoff before before_date
+
+        count_activities(cutoff) must return how many activities fall up to
+        cutoff today. A snapshot whose count differs (activities were added or
+        removed since) or that was rendered for another view is skipped.
+        Returns the restored cutoff date, or None if no snapshot was used
+        """
+        for name in self.snapshot_names():
+            path = os.path.join(self.snapshot_folder, name)
+            try:
+                with np.load(path, allow_pickle=False) as snapshot:
+                    meta = json.loads(str(snapshot['meta']))
+                    if meta['cutoff'] >= before_date:
+                        continue
+                    if {k: meta.get(k) for k in self.view_key()} != self.view_key():
+                        continue
+                    if meta['activity_count'] != count_activities(meta['cutoff']):
+                        continue
+                    canvas = snapshot['canvas']
+            except Exception as e:
+                print(f"Warning: Ignoring unreadable canvas snapshot {path}: {e}")
+                continue
+            if canvas.shape != self.canvas.shape:
+                continue
+            self.canvas = canvas.astype(np.float32, copy=False)
+            self.cutoff = meta['cutoff']
+            self.activity_count = meta['activity_count']
+            self.frames_since_snapshot = 0
+            return self.cutoff
+        return None
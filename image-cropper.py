@@ -2,7 +2,29 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 import os
+import time
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from crop_config import load_crop_bounds, save_crop_bounds
+from frame_store import FrameStore, write_frame_slot
+from instrumentation import StageTimer, instrumented_run
+
+# Crop bounds are saved here so strava-screenshot.py can crop at grab time
+crop_bounds_file = "crop_bounds.json"
+# Reuse saved crop bounds instead of opening the selector (delete the file to select again)
+reuse_saved_bounds = True
+# Number of worker processes for cropping (None = one per CPU core)
+crop_workers = None
+# "png", "npy" (raw uncompressed arrays, fastest for intermediate frames) or
+# "store" (one memory-mapped array of every frame in frame_store_folder)
+output_format = "png"
+frame_store_folder = "frame_store"
+# zlib level for PNG output, 0 (none, fastest) to 9; None uses the slow optimize=True encoder
+png_compress_level = 1
+# Per-stage timings, frames/s and bytes written of every run are saved here as JSON
+# (None disables); run with --profile or HEATMAP_PROFILE=1 to also profile the run
+run_report_folder = "run_reports"
 
 class CropSelector:
     def __init__(self, image_path):
@@ -131,11 +153,89 @@ class CropSelector:
         self.root.destroy()
         return self.crop_coords
 
-def crop_images(input_folder="screenshots", output_folder="cropped_screenshots"):
-    """Process all PNG files in the input folder and save cropped versions"""
+def crop_file(png_file, output_file, crop_bounds, output_format="png", compress_level=1, slot=None, timings=None):
+    """
+    Crop a single screenshot and save it as PNG or .npy, or write it to
+    its slot of a frame store (output_file is then the store's frames.u8)
+    The seconds spent in the decode, crop and encode (or write) stages are
+    stored in the timings dict if one is given
+    Returns the number of bytes written
+    """
+    timings = timings if timings is not None else {}
+    clock = time.perf_counter
+    start = clock()
+    with Image.open(png_file) as img:
+        img.load()
+        timings['decode'] = clock() - start
+        start = clock()
+        cropped = img.crop(crop_bounds)
+        timings['crop'] = clock() - start
+        start = clock()
+        if output_format == "store":
+            frame = np.ascontiguousarray(np.asarray(cropped.convert("RGB"))[:, :, ::-1])
+            write_frame_slot(output_file, slot, frame)
+            timings['write'] = clock() - start
+            return frame.nbytes
+        if output_format == "npy":
+            np.save(output_file, np.asarray(cropped.convert("RGB")))
+        elif compress_level is None:
+            cropped.save(output_file, "PNG", optimize=True)
+        else:
+            cropped.save(output_file, "PNG", compress_level=compress_level)
+        timings['encode'] = clock() - start
+    return os.path.getsize(output_file)
+
+def _crop_task(task):
+    """
+    Process pool entry point: crop one file and report the result instead of raising
+    Returns tuple of (file name, bytes written, error or None, stage timings)
+    """
+    png_file, output_file, crop_bounds, output_format, compress_level, slot = task
+    timings = {}
+    try:
+        size = crop_file(png_file, output_file, crop_bounds, output_format, compress_level, slot, timings)
+        return png_file.name, size, None, timings
+    except Exception as e:
+        return png_file.name, 0, str(e), timings
+
+def is_up_to_date(output_file, source_mtime):
+    """
+    True if output_file exists and is newer than its source (and the crop bounds)
+    """
+    try:
+        return output_file.stat().st_mtime >= source_mtime
+    except FileNotFoundError:
+        return False
+
+def crop_images(
+    input_folder="screenshots",
+    output_folder="cropped_screenshots",
+    workers=None,
+    output_format="png",
+    compress_level=1,
+    store_folder="frame_store",
+    timer=None
+):
+    """
+    Process all PNG files in the input folder and save cropped versions
+    
+    Args:
+    input_folder: Folder containing the full screenshots
+    output_folder: Folder for the cropped frames
+    workers: Number of worker processes (None = one per CPU core, 1 = no pool)
+    output_format: "png", "npy" for raw uncompressed frames, or "store" to
+                   append the frames to the memory-mapped frame store in store_folder
+    compress_level: PNG zlib level 0-9, or None for optimize=True
+    timer: StageTimer for the decode, crop and encode stages of every frame
+    """
+    timer = timer if timer is not None else StageTimer()
+    if output_format not in ("png", "npy", "store"):
+        raise ValueError(f"Unknown output format: {output_format}")
+    
     # Create output folder if it doesn't exist
     output_path = Path(output_folder)
-    output_path.mkdir(exist_ok=True)
+    if output_format != "store":
+        output_path.mkdir(exist_ok=True)
     
     # Get all PNG files
     input_path = Path(input_folder)
@@ -147,39 +247,117 @@ def crop_images(input_folder="screenshots", output_folder="cropped_screenshots")
     
     print(f"Found {len(png_files)} PNG files to process")
     
-    # Get crop coordinates using the first image
-    print("\nOpening coordinate selector...")
-    selector = CropSelector(png_files[0])
-    crop_bounds = selector.get_coordinates()
-    
-    if not crop_bounds:
-        print("No selection made. Exiting.")
-        return
+    crop_bounds = load_crop_bounds(crop_bounds_file) if reuse_saved_bounds else None
+    if crop_bounds:
+        print(f"\nUsing saved crop bounds from {crop_bounds_file}")
+    else:
+        # Get crop coordinates using the first image
+        print("\nOpening coordinate selector...")
+        selector = CropSelector(png_files[0])
+        crop_bounds = selector.get_coordinates()
+        
+        if not crop_bounds:
+            print("No selection made. Exiting.")
+            return
+        
+        save_crop_bounds(crop_bounds, crop_bounds_file)
+        print(f"Saved crop bounds to {crop_bounds_file}")
         
     print(f"\nUsing crop bounds: {crop_bounds}")
     
-    # Process all images with selected bounds
+    # Outputs older than their screenshot or the crop bounds are redone
+    bounds_mtime = os.path.getmtime(crop_bounds_file) if os.path.exists(crop_bounds_file) else 0
+    store = None
+    if output_format == "store":
+        store = FrameStore(store_folder)
+        height, width = crop_bounds[3] - crop_bounds[1], crop_bounds[2] - crop_bounds[0]
+        if store.height is not None and (store.height, store.width) != (height, width):
+            print(f"Crop size changed, rebuilding the frame store in {store_folder}")
+            store.reset(height, width)
+    tasks = []
+    skipped = 0
     for png_file in png_files:
-        try:
-            with Image.open(png_file) as img:
-                cropped = img.crop(crop_bounds)
-                output_file = output_path / png_file.name
-                cropped.save(output_file, "PNG", optimize=True)
-                print(f"Processed: {png_file.name}")
-        except Exception as e:
-            print(f"Error processing {png_file.name}: {e}")
+        source_mtime = max(png_file.stat().st_mtime, bounds_mtime)
+        if store is not None:
+            if store.is_up_to_date(png_file.stem, source_mtime):
+                skipped += 1
+                continue
+            slot = store.reserve(png_file.stem, height, width)
+            tasks.append((png_file, store.data_path, crop_bounds, output_format, compress_level, slot))
+            continue
+        output_file = output_path / (png_file.stem + "." + output_format)
+        if is_up_to_date(output_file, source_mtime):
+            skipped += 1
+            continue
+        tasks.append((png_file, output_file, crop_bounds, output_format, compress_level, None))
+    
+    if skipped:
+        print(f"Skipping {skipped} files that are already up to date")
+    if not tasks:
+        return
+    
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    print(f"Cropping {len(tasks)} files with {workers} worker(s)...")
+    for stage in ('decode', 'crop', 'encode', 'write'):
+        timer.capacity[stage] = workers
+    
+    # Process all images with selected bounds
+    start = time.perf_counter()
+    processed = 0
+    failed = 0
+    bytes_written = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        results = executor.map(_crop_task, tasks, chunksize=4) if executor else map(_crop_task, tasks)
+        for task, (name, size, error, timings) in zip(tasks, results):
+            for stage, seconds in timings.items():
+                timer.add(stage, seconds, task[0].stem)
+            if error:
+                failed += 1
+                print(f"Error processing {name}: {error}")
+            else:
+                processed += 1
+                bytes_written += size
+                timer.count_frames()
+                timer.count_bytes(size)
+                if store is not None:
+                    store.commit(task[0].stem, task[5])
+                print(f"Processed: {name}")
+    finally:
+        if executor:
+            executor.shutdown()
+        if store is not None:
+            # Index only the frames that were written
+            store.save_index()
+    elapsed = time.perf_counter() - start
+    
+    print(f"\nCropped {processed} files in {elapsed:.1f} s "
+          f"({processed / elapsed if elapsed else 0:.1f} files/s, "
+          f"{bytes_written / 1e6 / elapsed if elapsed else 0:.1f} MB/s written), "
+          f"{skipped} up to date, {failed} failed")
 
-def main():
+def main(timer=None):
     print("Starting batch image cropping process...")
     
     if not os.path.exists("screenshots"):
         print("Error: 'screenshots' folder not found!")
         return
     
-    crop_images()
+    crop_images(
+        workers=crop_workers,
+        output_format=output_format,
+        compress_level=png_compress_level,
+        store_folder=frame_store_folder,
+        timer=timer
+    )
     
     print("\nCropping complete!")
-    print("Cropped images are saved in the 'cropped_screenshots' folder")
+    if output_format == "store":
+        print(f"Cropped frames are saved in the '{frame_store_folder}' frame store")
+    else:
+        print("Cropped images are saved in the 'cropped_screenshots' folder")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with instrumented_run("image-cropper", run_report_folder) as run_timer:
+        main(run_timer)
\ No newline at end of file
@@ -0,0 +1,241 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from capture_journal import atomic_write_json
+
+# Set to anything but "" or "0" (or pass --profile) to run a script under cProfile
+PROFILE_ENV = "HEATMAP_PROFILE"
+
+class StageTimer:
+    """
+    Busy time of the stages of a pipeline, to show which stage limits the throughput
+
+    Stages may run on different threads at the same time. A stage's utilisation
+    is its busy time over the elapsed time times its capacity (the number of
+    threads that can work on it at once), so the stage closest to 100% is the
+    bottleneck.
+
+    Stage times are also kept per frame (YYYYMMDD or date key): either passed
+    explicitly, or taken from the frame() block the calling thread is in.
+    Frames done and bytes written give the run's throughput.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.busy = {}
+        self.counts = {}
+        self.capacity = {}
+        self.frame_times = {}
+        self.frames = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def add(self, name, seconds, frame=None):
+        if frame is None:
+            frame = getattr(self.local, 'frame', None)
+        with self.lock:
+            self.busy[name] = self.busy.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if frame is not None:
+                times = self.frame_times.setdefault(str(frame), {})
+                times[name] = times.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name, frame=None):
+        """
+        Time the body of a with block as one run of a stage
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - start, frame)
+
+    @contextmanager
+    def frame(self, key):
+        """
+        Attribute the stages timed on this thread inside the with block to a frame
+        """
+        previous = getattr(self.local, 'frame', None)
+        self.local.frame = key
+        try:
+            yield
+        finally:
+            self.local.frame = previous
+
+    def count_frames(self, frames=1):
+        with self.lock:
+            self.frames += frames
+
+    def count_bytes(self, nbytes):
+        with self.lock:
+            self.bytes_written += nbytes
+
+    def merge(self, stats):
+        """
+        Add the export() of a timer from another process (e.g. a pool worker)
+        The stages' capacities add up, as the workers run side by side
+        """
+        with self.lock:
+            for name, busy in stats['busy'].items():
+                self.busy[name] = self.busy.get(name, 0.0) + busy
+                self.counts[name] = self.counts.get(name, 0) + stats['counts'][name]
+                self.capacity[name] = self.capacity.get(name, 0) + stats['capacity'].get(name, 1)
+            for frame, stages in stats['frame_times'].items():
+                times = self.frame_times.setdefault(frame, {})
+                for name, seconds in stages.items():
+                    times[name] = times.get(name, 0.0) + seconds
+            self.frames += stats['frames']
+            self.bytes_written += stats['bytes_written']
+
+    def export(self):
+        """
+        Raw counters, picklable for merge()
+        """
+        with self.lock:
+            return {
+                'busy': dict(self.busy),
+                'counts': dict(self.counts),
+                'capacity': dict(self.capacity),
+                'frame_times': {frame: dict(times) for frame, times in self.frame_times.items()},
+                'frames': self.frames,
+                'bytes_written': self.bytes_written
+            }
+
+    def utilisation(self):
+        """
+        Dict of stage -> fraction of its capacity it was busy since the timer started
+        """
+        elapsed = max(self.clock() - self.started, 1e-9)
+        with self.lock:
+            return {
+                name: busy / (elapsed * self.capacity.get(name, 1))
+                for name, busy in self.busy.items()
+            }
+
+    def summary(self):
+        """
+        Machine-readable totals: elapsed time, throughput and every stage
+        """
+        elapsed = self.clock() - self.started
+        utilisation = self.utilisation()
+        with self.lock:
+            stages = {
+                name: {
+                    'busy_seconds': round(busy, 4),
+                    'runs': self.counts[name],
+                    'mean_seconds': round(busy / self.counts[name], 4),
+                    'capacity': self.capacity.get(name, 1),
+                    'utilisation': round(utilisation[name], 4)
+                }
+                for name, busy in self.busy.items()
+            }
+            frame_times = {
+                frame: {name: round(seconds, 4) for name, seconds in times.items()}
+                for frame, times in sorted(self.frame_times.items())
+            }
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'frames': self.frames,
+                'frames_per_second': round(self.frames / elapsed, 3) if elapsed > 0 else 0,
+                'bytes_written': self.bytes_written,
+                'megabytes_per_second': round(self.bytes_written / 1e6 / elapsed, 3) if elapsed > 0 else 0,
+                'stages': stages,
+                'bottleneck': max(utilisation, key=utilisation.get) if utilisation else None,
+                'frame_times': frame_times
+            }
+
+    def report(self, title="Stage utilisation"):
+        """
+        Print every stage's utilisation and the bottleneck
+        """
+        if not self.busy:
+            return
+        elapsed = self.clock() - self.started
+        utilisation = self.utilisation()
+        print(f"\n{title} over {elapsed:.1f} s:")
+        for name, fraction in utilisation.items():
+            busy, count = self.busy[name], self.counts[name]
+            workers = self.capacity.get(name, 1)
+            capacity = f", {workers} workers" if workers > 1 else ""
+            print(f"  {name:<12} {fraction:6.1%} busy ({busy:.1f} s in {count} runs, {busy / count:.2f} s each{capacity})")
+        if self.frames:
+            print(f"{self.frames} frames at {self.frames / elapsed:.2f} frames/s, "
+                  f"{self.bytes_written / 1e6:.1f} MB written")
+        print(f"Bottleneck: {max(utilisation, key=utilisation.get)}")
+
+    def write_report(self, path, **info):
+        """
+        Write summary() plus info (script name, status, ...) as JSON, atomically
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        report = dict(info)
+        report.update(self.summary())
+        atomic_write_json(path, report, indent=2)
+        return path
+
+def profiling_enabled():
+    """
+    True if the --profile flag or the HEATMAP_PROFILE environment variable is set
+    """
+    return '--profile' in sys.argv[1:] or os.environ.get(PROFILE_ENV, '') not in ('', '0')
+
+@contextmanager
+def instrumented_run(name, report_folder="run_reports", profile=None, top=25):
+    """
+    Time a whole script run: yields its StageTimer, then prints the stage
+    utilisation and writes report_folder/<name>_<start time>.json (also after
+    an error or Ctrl+C)
+
+    With profile (None: the --profile flag or HEATMAP_PROFILE) the run goes
+    through cProfile as well. The stats are saved next to the report as .prof
+    (for pstats or snakeviz) and the top functions by cumulative time are printed.
+    Worker processes are not profiled.
+    """
+    timer = StageTimer()
+    started_at = datetime.now()
+    stem = os.path.join(report_folder or ".", f"{name}_{started_at.strftime('%Y%m%d_%H%M%S')}")
+    profiler = cProfile.Profile() if (profiling_enabled() if profile is None else profile) else None
+    status = "completed"
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield timer
+    except KeyboardInterrupt:
+        status = "interrupted"
+        raise
+    except BaseException:
+        status = "failed"
+        raise
+    finally:
+        profile_path = None
+        if profiler is not None:
+            profiler.disable()
+            profile_path = stem + '.prof'
+            os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+            profiler.dump_stats(profile_path)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+            print(f"\nProfile saved: {profile_path}")
+            print(output.getvalue())
+        timer.report(f"{name} stage utilisation")
+        if report_folder:
+            try:
+                path = timer.write_report(
+                    stem + '.json', script=name, status=status,
+                    started_at=started_at.isoformat(timespec='seconds'),
+                    finished_at=datetime.now().isoformat(timespec='seconds'),
+                    profile=profile_path
+                )
+                print(f"Run report saved: {path}")
+            except OSError as e:
+                print(f"Warning: Could not write the run report: {e}")
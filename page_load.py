@@ -0,0 +1,61 @@
+import time
+import numpy as np
+
+def frame_difference(previous, current):
+    """
+    Mean absolute per-pixel difference between two frames of the same shape
+    """
+    return float(np.mean(np.abs(current.astype(np.int16) - previous.astype(np.int16))))
+
+def grab_low_res_frame(sct, monitor_bounds, step=8):
+    """
+    Grab monitor_bounds with an mss instance and keep every step-th pixel
+    Returns a small grayscale uint8 array, enough to tell whether tiles are still changing
+    """
+    screenshot = sct.grab(monitor_bounds)
+    pixels = np.asarray(screenshot)[::step, ::step, :3]
+    return pixels.mean(axis=2).astype(np.uint8)
+
+class PageLoadDetector:
+    """
+    Decides when a page has finished rendering by polling frames until
+    consecutive frames stop changing by more than threshold
+
+    Args:
+    threshold: Maximum mean absolute pixel difference for two frames to count as equal
+    stable_frames: Number of consecutive unchanged frames required
+    poll_interval: Seconds between frame grabs
+    timeout: Hard limit in seconds, the page is assumed loaded after this
+    min_wait: Seconds to wait before polling, so the old page is not mistaken for a loaded one
+    """
+    def __init__(self, threshold=2.0, stable_frames=3, poll_interval=0.5, timeout=30, min_wait=2.0):
+        self.threshold = threshold
+        self.stable_frames = stable_frames
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.min_wait = min_wait
+
+    def wait(self, grab_frame, clock=time.monotonic, sleep=time.sleep):
+        """
+        Poll grab_frame() until the frames are stable or the timeout is reached
+        Returns tuple of (stable, waited_seconds)
+        """
+        start = clock()
+        sleep(min(self.min_wait, self.timeout))
+
+        previous = grab_frame()
+        unchanged = 0
+
+        while clock() - start < self.timeout:
+            sleep(self.poll_interval)
+            current = grab_frame()
+
+            if frame_difference(previous, current) <= self.threshold:
+                unchanged += 1
+                if unchanged >= self.stable_frames:
+                    return True, clock() - start
+            else:
+                unchanged = 0
+            previous = current
+
+        return False, clock() - start
@@ -0,0 +1,84 @@
+import os
+import queue
+import threading
+from contextlib import nullcontext
+import mss.tools
+
+class BackgroundPNGWriter:
+    """
+    Compresses and saves captured frames on a background thread, so the
+    capture loop can start the next navigation while zlib is still working
+
+    At most max_pending frames wait to be written; submit() blocks when the
+    writer falls behind. Results are collected on the calling thread with
+    pop_completed(), and close() flushes every pending write.
+
+    Args:
+    max_pending: Frames that may wait in the queue before submit() blocks
+    compress_level: PNG zlib level 0-9 (mss's default is 6)
+    timer: StageTimer for the 'png encode' stage and the bytes written
+    """
+    def __init__(self, max_pending=4, compress_level=6, timer=None):
+        self.compress_level = compress_level
+        self.timer = timer
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.completed = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._run, name="png-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, key, filepath, rgb, size):
+        """
+        Queue raw RGB bytes of the given (width, height) for saving as filepath
+        """
+        if not self.thread.is_alive():
+            raise RuntimeError("PNG writer is closed")
+        self.queue.put((key, filepath, rgb, size))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                key, filepath, rgb, size = item
+                # Write to a temporary file so a crash never leaves a truncated PNG behind
+                tmp_path = filepath + '.tmp'
+                try:
+                    with self.timer.stage('png encode', key) if self.timer is not None else nullcontext():
+                        mss.tools.to_png(rgb, size, level=self.compress_level, output=tmp_path)
+                    os.replace(tmp_path, filepath)
+                    if self.timer is not None:
+                        self.timer.count_bytes(os.path.getsize(filepath))
+                    self.completed.put((key, filepath, None))
+                except Exception as e:
+                    self.completed.put((key, filepath, str(e)))
+            finally:
+                self.queue.task_done()
+
+    def pop_completed(self):
+        """
+        List of (key, filepath, error or None) for writes finished since the last call
+        """
+        completed = []
+        while True:
+            try:
+                completed.append(self.completed.get_nowait())
+            except queue.Empty:
+                return completed
+
+    def pending(self):
+        return self.queue.unfinished_tasks
+
+    def close(self):
+        """
+        Wait for every queued frame to be written and stop the thread
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
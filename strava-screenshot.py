@@ -1,15 +1,121 @@
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 import os
-import pyautogui
-from mss import mss
 import mss.tools
 import screeninfo
-import pandas as pd
+import numpy as np
+import bisect
+import cv2
 import re
+import csv
+import io
+import json
+from collections import deque
+from page_load import PageLoadDetector
+from capture_journal import CaptureJournal
+from crop_config import load_crop_bounds, crop_region
+from activity_cache import load_cached_plan, save_cached_plan
+from heatmap_renderer import HeatmapAccumulator, HeatmapRenderer, Viewport
+from tile_cache import TileCache
+from track_store import TrackStore, activity_key
+from create_video import StreamingVideoWriter
+from png_writer import BackgroundPNGWriter
+from frame_check import frame_fingerprint, collapse_duplicates, coverage_drops
+from capture_scheduler import CaptureScheduler
+from capture_backends import DevToolsBackend, PyAutoGUIBackend
+from instrumentation import StageTimer, instrumented_run
 
+# Strava personal heatmap; {sport}, {start_date} and {date} are filled in for every capture
+heatmap_url = "https://www.strava.com/maps/personal-heatmap?sport={sport}&style=dark&terrain=false&labels=false&poi=false&cPhotos=false&pColor=orange&pCommutes=false&pHidden=true&pDate={start_date}_{date}&pPrivate=true&pPhotos=false&pClusters=false#10.83/59.4333/24.7447"
+# First date of the heatmap and of the timelapse
+first_date = "2024-01-01"
+
+# Hard timeout for a page load (the fixed wait when adaptive_wait is off)
 sleep_time = 30
 iteration_time = 1
+# "changes" only captures dates where a new activity was added, "all" captures every calendar day
+capture_mode = "changes"
+# In "changes" mode, also capture a "hold" day every N days without new activities (0 disables)
+hold_interval = 0
+# Stop waiting as soon as consecutive low resolution frames of the monitor stop changing
+adaptive_wait = True
+stability_threshold = 2.0
+stable_frames = 3
+poll_interval = 0.5
+# Completed captures are journaled here (next to screenshot_metadata.json) so runs can resume
+journal_file = "capture_journal.json"
+# Grab only the crop saved by image-cropper.py (straight into cropped_screenshots/) if available
+crop_at_grab = True
+crop_bounds_file = "crop_bounds.json"
+# Parsed activities and the date plan are cached here, keyed on the export's size, mtime and hash
+cache_file = "activities_cache.npz"
+# Ignore the cache and parse the export again
+rebuild_cache = False
+# Batch mode: build every challenge listed in challenges_file from one pass over the export
+batch_mode = False
+challenges_file = "challenges.json"
+challenges_folder = "challenges"
+# Render frames locally from the export's GPX/FIT/TCX track files instead of capturing the browser
+offline_render = False
+# Folder of the extracted Strava bulk export (the Filename column is relative to it)
+export_folder = "."
+# Map view (#zoom/lat/lon, the heatmap URL's by default) and frame size for offline rendering
+render_view = heatmap_url.rsplit('#', 1)[1]
+render_size = (1920, 1080)
+# Save the offline render's canvas every N frames so it can resume there (0 disables)
+snapshot_interval = 50
+snapshot_folder = "render_snapshots"
+# Only the newest N canvas snapshots are kept (0 keeps every one)
+snapshot_keep = 3
+# Parsed tracks of the export, only new activities are parsed on later runs
+track_store_folder = "track_store"
+# Number of worker processes for parsing tracks (None = one per CPU core)
+ingest_workers = None
+# Composite frames from a z/x/y tile cache of the heatmap density, so a new
+# render_view or render_size reuses the tiles instead of re-rendering everything
+use_tile_cache = False
+tile_cache_folder = "tile_cache"
+tile_cache_size_mb = 512
+# Stream captured (or rendered) frames straight into the video instead of writing PNGs
+stream_video = False
+stream_output = "timelapse.mp4"
+stream_fps = 3
+stream_date_format = "%B %d, %Y"
+# In streaming mode, also keep every raw frame as a PNG
+archive_frames = False
+# Compress and save screenshots on a background thread while the next date loads;
+# the capture loop waits when more than max_pending_writes frames are queued
+background_writes = True
+max_pending_writes = 4
+# A capture whose lit (orange) pixel count falls more than this fraction below the
+# previous date's is blank or half-loaded; it is dropped from the journal to be captured again
+coverage_tolerance = 0.02
+recapture_coverage_drops = True
+# Retry failed captures, and captures whose coverage dropped (validate_captures), up to
+# capture_attempts times with exponential back-off, after the rest of the dates
+validate_captures = True
+capture_attempts = 3
+retry_delay = 5
+retry_max_delay = 120
+# Start loading the next date as soon as a frame is grabbed, while a worker thread
+# fingerprints, validates and saves the previous one; reports each stage's utilisation
+pipelined_capture = True
+# Per-stage timings, frames/s and bytes written of every run are saved here as JSON
+# (None disables); run with --profile or HEATMAP_PROFILE=1 to also profile the run
+run_report_folder = "run_reports"
+# How pages are loaded and grabbed: "pyautogui" types every URL into the browser on the
+# second monitor, "devtools" drives a local Chromium over the DevTools protocol instead
+capture_backend = "pyautogui"
+# Chromium/Chrome executable for the devtools backend (None searches the usual names)
+chromium_path = None
+# A browser already listening on this port is reused instead of launching one
+devtools_port = 9222
+# Browser profile; log in to Strava in it once with devtools_headless = False
+devtools_profile = "chromium_profile"
+devtools_headless = True
+# Tabs loading dates at the same time, each with a viewport_size viewport
+devtools_tabs = 4
+viewport_size = (1920, 1080)
 
 def get_second_monitor_bounds():
     """
@@ -33,468 +139,852 @@ def get_second_monitor_bounds():
         print(f"Error getting monitor info: {str(e)}")
         return None
 
-def take_strava_screenshot(date_data, monitor_bounds):
+def screenshot_path(date_str, output_folder='screenshots'):
     """
-    Takes a screenshot of Strava heatmap for a specific date on the specified monitor
+    Path of the screenshot for a date (output_folder/YYYYMMDD.png)
+    """
+    filename = datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y%m%d') + '.png'
+    return os.path.join(output_folder, filename)
+
+def capture_heatmap(date_data, backend, sport='Run', start_date=first_date):
+    """
+    Load the Strava heatmap for a specific date with a capture backend and grab it
+    Returns tuple of (RGB frame, seconds spent waiting for the page to load)
     """
-        
     date_str = date_data['date']
-    # Base URL template
-    base_url = "https://www.strava.com/maps/personal-heatmap?sport=Run&style=dark&terrain=false&labels=false&poi=false&cPhotos=false&pColor=orange&pCommutes=false&pHidden=true&pDate=2024-01-01_{0}&pPrivate=true&pPhotos=false&pClusters=false#10.83/59.4333/24.7447"
-    
-    # Format URL with date
-    url = base_url.format(date_str)
+    # Format URL with sport and date range
+    url = heatmap_url.format(sport=sport, start_date=start_date, date=date_str)
     
-    try:
+    if 'accumulated_days' in date_data:
         print(f"Processing date {date_str} (Day {date_data['accumulated_days']}, {date_data['accumulated_distance']:.2f} km)...")
-        print("Focusing URL bar...")
-        # Press Ctrl+L to focus on URL bar
-        pyautogui.hotkey('ctrl', 'l')
-        time.sleep(1)  # Increased pause after focusing URL bar
-        
-        print("Clearing current URL...")
-        # Clear the current URL (select all and delete)
-        pyautogui.hotkey('ctrl', 'a')
-        pyautogui.press('delete')
-        time.sleep(0.5)
-        
-        print("Typing URL...")
-        pyautogui.write(url)
-        
-        print("Pressing Enter...")
-        pyautogui.press('enter')
-        
-        print(f"Waiting {sleep_time} seconds for page to load...")
-        time.sleep(sleep_time)
-        
-        # Format filename (YYYYMMDD.png)
-        filename = datetime.strptime(date_str, '%Y-%m-%d').strftime('%Y%m%d') + '.png'
-        
-        # Create 'screenshots' directory if it doesn't exist
-        os.makedirs('screenshots', exist_ok=True)
-        
-        print("Taking screenshot of second monitor...")
-        with mss.mss() as sct:
-            screenshot = sct.grab(monitor_bounds)
-            
-            # Save the screenshot
-            filepath = os.path.join('screenshots', filename)
-            mss.tools.to_png(screenshot.rgb, screenshot.size, output=filepath)
-        
-        print(f"Screenshot saved: {filepath}")
-        
-        # Wait between screenshots
-        print(f"Waiting {iteration_time} seconds before next iteration...")
-        time.sleep(iteration_time)
-        
-    except Exception as e:
-        print(f"Error processing date {date_str}: {str(e)}")
+    else:
+        print(f"Processing date {date_str} ({sport})...")
+    return backend.capture(url)
+
+# A new activity row starts with its numeric ID (optionally inside a wrapping quote)
+ACTIVITY_START = re.compile(r'^"?\d+,')
 
-def load_tallinn_streets_data(csv_file="TallinnStreets.csv"):
+def unwrap_row(fields):
     """
-    Load CSV data and filter for Tallinn Streets activities
-    Returns list of activity dates and their distances
+    Rows exported as a single quoted field (ID,""Date"",Name,... wrapped in
+    quotes) are parsed again
+    """
+    if len(fields) == 1 and ',' in fields[0]:
+        return next(csv.reader(io.StringIO(fields[0])), [])
+    return fields
+
+def parse_csv_record(record):
+    """
+    Split one logical record (the text of one row) into fields
+    """
+    return unwrap_row(next(csv.reader(io.StringIO(record)), []))
+
+def iter_csv_rows(lines):
+    """
+    Parse the export with csv.reader, which keeps quoted fields that span
+    several lines together
+    Yields lists of fields, the header first, skipping blank lines
+
+    A row that csv.reader rejects or whose field count differs from the
+    header's is malformed, typically an unterminated quote that swallowed the
+    following rows. It is closed at the first of its lines that starts a new
+    activity row, and the lines from there on are parsed again, so one
+    malformed row cannot swallow the rest of the file.
+    """
+    pending = deque()
+    consumed = []
+    source = iter(lines)
+
+    def feed():
+        while True:
+            if pending:
+                line = pending.popleft()
+            else:
+                line = next(source, None)
+                if line is None:
+                    return
+            consumed.append(line)
+            yield line
+
+    reader = csv.reader(feed())
+    field_count = None
+    while True:
+        consumed.clear()
+        try:
+            fields = next(reader, None)
+            malformed = False
+        except csv.Error:
+            fields, malformed = [], True
+        if fields is None:
+            return
+        if not fields and not malformed:
+            continue
+        fields = unwrap_row(fields)
+        if field_count is None:
+            field_count = len(fields)
+            yield fields
+            continue
+        if malformed or len(fields) != field_count:
+            split = next((index for index, line in enumerate(consumed) if index and ACTIVITY_START.match(line)), None)
+            if split is not None:
+                pending.extendleft(reversed(consumed[split:]))
+                # The reader may have run into the end of the file already
+                reader = csv.reader(feed())
+                record = ''.join(consumed[:split])
+                if record.count('"') % 2:
+                    record += '"'
+                fields = parse_csv_record(record)
+        if fields:
+            yield fields
+
+def load_challenge_activities(csv_file, challenges):
+    """
+    Parse the export once and partition the activities between challenges
+    Each challenge is a dict with a 'name' and optionally a 'name_pattern'
+    (case-insensitive substring of the activity name) and a 'sport_type'
+    (Activity Type, e.g. Run or Ride); an activity can belong to several challenges
+    Returns dict of challenge name -> list of activity dates and their distances
+    (plus the activity's ID and track file when the export has those columns)
+    
+    The export is streamed row by row and only the needed columns of
+    matching rows are converted.
     """
+    partitions = {challenge['name']: [] for challenge in challenges}
+    patterns = [
+        (challenge['name'], (challenge.get('name_pattern') or '').lower(), (challenge.get('sport_type') or '').lower())
+        for challenge in challenges
+    ]
+    total = 0
+    
     try:
-        # First try pandas with different parameters
-        df = pd.read_csv(csv_file, engine='python', on_bad_lines='skip', quotechar='"')
-        
-        print(f"Loaded CSV with {len(df)} total activities")
-        print(f"Columns found: {list(df.columns[:5])}...")
-        
-        if 'Activity Name' in df.columns:
-            tallinn_activities = df[df['Activity Name'].str.contains('Tallinn Streets', na=False, case=False)]
+        with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
+            rows = iter_csv_rows(f)
+            header = [column.strip() for column in next(rows, [])]
+            try:
+                date_index = header.index('Activity Date')
+                name_index = header.index('Activity Name')
+                # The first Distance column is in km (a later one is in meters)
+                distance_index = header.index('Distance')
+                type_index = header.index('Activity Type') if any(sport for _, _, sport in patterns) else None
+                # Track file of the activity in the bulk export (optional)
+                filename_index = header.index('Filename') if 'Filename' in header else None
+                id_index = header.index('Activity ID') if 'Activity ID' in header else None
+            except ValueError as e:
+                print(f"Error: Required column missing from {csv_file}: {e}")
+                return partitions
+            min_fields = max(date_index, name_index, distance_index, type_index or 0) + 1
             
-            if len(tallinn_activities) > 0:
-                print(f"Found {len(tallinn_activities)} activities with 'Tallinn Streets' in the name")
-                
-                # Process pandas results
-                activities_data = []
-                for _, row in tallinn_activities.iterrows():
-                    try:
-                        # Parse date
-                        date_str = str(row['Activity Date']).strip().strip('"')
-                        date_obj = pd.to_datetime(date_str, format='%b %d, %Y, %I:%M:%S %p')
-                        formatted_date = date_obj.strftime('%Y-%m-%d')
-                        
-                        # Parse distance
-                        distance = float(row['Distance']) if pd.notna(row['Distance']) else 0
-                        
-                        activities_data.append({
-                            'date': formatted_date,
-                            'distance': distance,
-                            'name': str(row['Activity Name'])
-                        })
-                    except Exception as e:
-                        print(f"Error processing pandas row: {e}")
-                        continue
+            for fields in rows:
+                total += 1
+                if len(fields) < min_fields:
+                    continue
+                name = fields[name_index].strip()
+                activity_type = fields[type_index].strip().lower() if type_index is not None else ''
+                matches = [
+                    challenge_name for challenge_name, pattern, sport in patterns
+                    if pattern in name.lower() and (not sport or sport == activity_type)
+                ]
+                if not matches:
+                    continue
                 
-                if activities_data:
-                    activities_data.sort(key=lambda x: x['date'])
-                    print(f"Processed {len(activities_data)} Tallinn Streets activities:")
-                    for activity in activities_data:
-                        print(f"  {activity['date']}: {activity['distance']:.2f} km - {activity['name']}")
-                    return activities_data
-        
-        print("Pandas parsing failed or no results, trying manual parsing...")
-        
-    except Exception as e:
-        print(f"Pandas parsing failed: {str(e)}")
-        print("Attempting manual CSV parsing...")
+                try:
+                    date_str = fields[date_index].strip().strip('"')
+                    date_obj = datetime.strptime(date_str, '%b %d, %Y, %I:%M:%S %p')
+                    distance = fields[distance_index].strip()
+                    activity = {
+                        'date': date_obj.strftime('%Y-%m-%d'),
+                        'distance': float(distance) if distance else 0,
+                        'name': name
+                    }
+                    if filename_index is not None and filename_index < len(fields):
+                        activity['filename'] = fields[filename_index].strip()
+                    if id_index is not None and id_index < len(fields):
+                        activity['id'] = fields[id_index].strip()
+                except ValueError as e:
+                    print(f"Error processing row for '{name}': {e}")
+                    continue
+                for challenge_name in matches:
+                    partitions[challenge_name].append(dict(activity))
+    except OSError as e:
+        print(f"Error reading {csv_file}: {e}")
+        return partitions
     
-    # Manual parsing for complex CSV structure
-    activities_data = []
+    print(f"Loaded CSV with {total} total activities")
+    for activities_data in partitions.values():
+        activities_data.sort(key=lambda x: x['date'])
+    return partitions
+
+def load_tallinn_streets_data(csv_file="TallinnStreets.csv", name_filter="Tallinn Streets"):
+    """
+    Load CSV data and filter for activities whose name contains name_filter
+    (case-insensitive)
+    Returns list of activity dates and their distances
+    """
+    challenge = {'name': name_filter, 'name_pattern': name_filter}
+    activities_data = load_challenge_activities(csv_file, [challenge])[name_filter]
     
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        content = f.read()
+    print(f"Processed {len(activities_data)} activities with '{name_filter}' in the name:")
+    for activity in activities_data:
+        print(f"  {activity['date']}: {activity['distance']:.2f} km - {activity['name']}")
     
-    # Split by lines but be aware that entries can span multiple lines
-    lines = content.split('\n')
-    print(f"Processing {len(lines)} lines manually...")
+    return activities_data
+
+def generate_screenshot_dates(activities_data, start_date=first_date):
+    """
+    Generate dates from start_date to each activity date
+    Activities are sorted once and the accumulated stats for every day are
+    looked up with a cumulative sum and a binary search over activity dates
+    """
+    if not activities_data:
+        return []
     
-    current_entry = ""
-    in_entry = False
+    # Sort once by activity date (stable, so same-day activities keep CSV order)
+    activity_dates = np.array([act['date'] for act in activities_data], dtype='datetime64[D]')
+    distances = np.array([act['distance'] for act in activities_data], dtype=float)
+    order = np.argsort(activity_dates, kind='stable')
+    activity_dates = activity_dates[order]
+    cumulative_distance = np.cumsum(distances[order])
     
-    for i, line in enumerate(lines):
-        # Skip empty lines
-        if not line.strip():
-            continue
-            
-        # Check if this is the start of a new entry (starts with quote and ID)
-        if re.match(r'^"?\d+,', line.strip()):
-            # Process previous entry if we were building one
-            if current_entry and 'Tallinn Streets' in current_entry:
-                activities_data.extend(parse_single_entry(current_entry, i))
-            
-            # Start new entry
-            current_entry = line
-            in_entry = True
-        else:
-            # This is a continuation of the current entry
-            if in_entry:
-                current_entry += "\n" + line
+    # Every calendar day from start_date up to the last activity
+    days = np.arange(np.datetime64(start_date, 'D'), activity_dates[-1] + 1)
+    
+    # Number of activities on or before each day
+    accumulated_days = np.searchsorted(activity_dates, days, side='right')
     
-    # Process the last entry
-    if current_entry and 'Tallinn Streets' in current_entry:
-        activities_data.extend(parse_single_entry(current_entry, len(lines)))
+    screenshot_dates = []
+    for date_str, count in zip(days.astype(str).tolist(), accumulated_days.tolist()):
+        screenshot_dates.append({
+            'date': date_str,
+            'accumulated_distance': float(cumulative_distance[count - 1]) if count else 0,
+            'accumulated_days': count
+        })
     
-    # Sort by date
-    activities_data.sort(key=lambda x: x['date'])
+    return screenshot_dates
+
+def plan_capture_dates(screenshot_dates, mode="changes", hold_interval=0):
+    """
+    Select which of the screenshot dates actually need a capture
+    In "changes" mode only dates where accumulated_days increases are kept
+    (the same frames filter_unique_activities in create_video.py uses),
+    optionally plus a hold day every hold_interval days without changes
+    Hold days are marked with 'hold' so the video keeps them too
+    """
+    if mode == "all":
+        return list(screenshot_dates)
+    if mode != "changes":
+        raise ValueError(f"Unknown capture mode: {mode}")
     
-    print(f"\nManual parsing completed. Found {len(activities_data)} Tallinn Streets activities:")
-    for activity in activities_data:
-        print(f"  {activity['date']}: {activity['distance']:.2f} km - {activity['name']}")
+    capture_dates = []
+    last_day_count = 0
+    days_since_capture = 0
     
-    return activities_data
+    for date_data in screenshot_dates:
+        days_since_capture += 1
+        if date_data['accumulated_days'] > last_day_count:
+            capture_dates.append(date_data)
+            last_day_count = date_data['accumulated_days']
+            days_since_capture = 0
+        elif capture_dates and hold_interval and days_since_capture >= hold_interval:
+            capture_dates.append(dict(date_data, hold=True))
+            days_since_capture = 0
+    
+    return capture_dates
 
-def parse_single_entry(entry_text, line_num):
+def held_dates(capture_dates):
     """
-    Parse a single CSV entry that may span multiple lines
+    Hold days of a capture plan, which the video shows although no activity was added
     """
-    try:
-        print(f"\nProcessing entry around line {line_num} with Tallinn Streets activity...")
-        
-        # Extract date - look for the pattern ""Date""
-        date_pattern = r'""([^"]+)""'
-        date_match = re.search(date_pattern, entry_text)
-        
-        if not date_match:
-            print(f"  Could not extract date from entry")
-            return []
-        
-        date_str = date_match.group(1)
-        print(f"  Found date: {date_str}")
-        
-        # Parse date
-        try:
-            date_obj = datetime.strptime(date_str, '%b %d, %Y, %I:%M:%S %p')
-            formatted_date = date_obj.strftime('%Y-%m-%d')
-            print(f"  Parsed date: {formatted_date}")
-        except Exception as e:
-            print(f"  Could not parse date '{date_str}': {e}")
-            return []
-        
-        # Extract activity name
-        name_patterns = [
-            r'(Tallinn Streets[^,]*)',
-            r'(Survival Morning Run - Tallinn Streets[^,]*)',
-            r'([^,]*Tallinn Streets[^,]*)'
-        ]
-        
-        activity_name = "Tallinn Streets Activity"
-        for pattern in name_patterns:
-            name_match = re.search(pattern, entry_text)
-            if name_match:
-                activity_name = name_match.group(1).strip()
-                break
-        
-        print(f"  Activity name: {activity_name}")
-        
-        # Extract distance - look for decimal numbers after the activity name
-        # Use a more robust approach: split by commas and look for reasonable distances
-        
-        # First, let's try to split the entry into fields using CSV parsing
+    return [d['date'] for d in capture_dates if d.get('hold')]
+
+def load_activity_plan(
+    csv_file="TallinnStreets.csv",
+    name_filter="Tallinn Streets",
+    start_date=first_date,
+    cache_file="activities_cache.npz",
+    force_rebuild=False
+):
+    """
+    Load activities and screenshot dates, from the cache when the export and
+    the filter are unchanged, otherwise by parsing the export and caching the result
+    Returns tuple of (activities_data, screenshot_dates)
+    """
+    params = {'name_filter': name_filter, 'start_date': start_date}
+    if not force_rebuild:
+        cached = load_cached_plan(cache_file, csv_file, params)
+        if cached is not None:
+            print(f"Loaded {len(cached[0])} activities and {len(cached[1])} dates from {cache_file}")
+            return cached
+    
+    activities_data = load_tallinn_streets_data(csv_file, name_filter)
+    screenshot_dates = generate_screenshot_dates(activities_data, start_date)
+    if activities_data:
         try:
-            import csv
-            from io import StringIO
-            
-            # Clean the entry for CSV parsing
-            cleaned_entry = entry_text.replace('\n', ' ').replace('\r', '')
-            
-            csv_reader = csv.reader(StringIO(cleaned_entry), quotechar='"')
-            fields = next(csv_reader)
-            
-            # Distance is typically in field 6 (0-indexed)
-            if len(fields) > 6:
-                try:
-                    distance = float(fields[6])
-                    print(f"  Found distance in field 6: {distance} km")
-                    
-                    return [{
-                        'date': formatted_date,
-                        'distance': distance,
-                        'name': activity_name
-                    }]
-                except ValueError:
-                    print(f"  Field 6 is not a valid distance: {fields[6]}")
-            
-        except Exception as e:
-            print(f"  CSV parsing failed: {e}")
+            save_cached_plan(cache_file, csv_file, params, activities_data, screenshot_dates)
+        except OSError as e:
+            print(f"Warning: Could not write activity cache {cache_file}: {e}")
+    return activities_data, screenshot_dates
+
+def render_offline_frames(activities_data, capture_dates, output_folder="cropped_screenshots", start_date=first_date, video=None, timer=None, work_folder=None):
+    """
+    Render the heatmap of every capture date from the activities' track files,
+    without a browser, network or second monitor
+    Frames are written as output_folder/YYYYMMDD.png like cropped screenshots
+
+    Each activity is stamped once onto a running canvas, so a frame only costs
+    its new activities. Rendering resumes at the first missing frame from the
+    latest canvas snapshot before it. With use_tile_cache the frames are
+    composited from cached density tiles instead. With a StreamingVideoWriter
+    every date is rendered straight into the video.
+    The ingest, render and png encode stages are timed with timer (a StageTimer).
+    Canvas snapshots and tiles belong to one set of activities, so renders of
+    different activities need their own work_folder (None: snapshot_folder
+    and tile_cache_folder).
+    """
+    if not capture_dates:
+        print("No dates to render. Nothing to do.")
+        return
+    timer = timer if timer is not None else StageTimer()
+    snapshots = os.path.join(work_folder, snapshot_folder) if work_folder else snapshot_folder
+    tile_folder = os.path.join(work_folder, tile_cache_folder) if work_folder else tile_cache_folder
+    store = TrackStore(track_store_folder)
+    with timer.stage('ingest'):
+        store.ingest(activities_data, export_folder, ingest_workers)
+    
+    viewport = Viewport.from_fragment(render_view, *render_size)
+    renderer = HeatmapRenderer(viewport)
+    accumulator = HeatmapAccumulator(renderer, snapshots, snapshot_interval, snapshot_keep)
+    
+    # The heatmap shows activities from start_date up to each date
+    activities = sorted((a for a in activities_data if a['date'] >= start_date), key=lambda a: a['date'])
+    activity_dates = [a['date'] for a in activities]
+    
+    if video is not None:
+        pending_dates = capture_dates
+    else:
+        first_missing = next(
+            (i for i, d in enumerate(capture_dates) if not os.path.exists(screenshot_path(d['date'], output_folder))),
+            None
+        )
+        if first_missing is None:
+            print("All frames already rendered. Nothing to do.")
+            return
+        pending_dates = capture_dates[first_missing:]
+        os.makedirs(output_folder, exist_ok=True)
+    
+    if use_tile_cache:
+        tiles = TileCache(
+            tile_folder, renderer,
+            [(activity['date'], store.latlon(activity_key(activity))) for activity in activities],
+            max_bytes=tile_cache_size_mb * 2 ** 20
+        )
         
-        # Fallback: look for decimal patterns
-        decimal_pattern = r'(?:^|,)([0-9]+\.[0-9]+)(?=,|$)'
-        decimal_matches = re.findall(decimal_pattern, entry_text.replace('\n', ' '))
+        def next_frame(date_str):
+            return renderer.colorize(tiles.density(viewport, date_str))
+    else:
+        resumed = accumulator.restore(pending_dates[0]['date'], lambda cutoff: bisect.bisect_right(activity_dates, cutoff))
+        if resumed:
+            print(f"Resuming from the canvas snapshot of {resumed} ({accumulator.activity_count} activities)")
         
-        if decimal_matches:
-            print(f"  Found decimal numbers: {decimal_matches[:5]}")
-            
-            # Filter for reasonable distance values
-            potential_distances = []
-            for d in decimal_matches:
-                try:
-                    val = float(d)
-                    if 0.1 <= val <= 100:
-                        potential_distances.append(val)
-                except ValueError:
-                    continue
-            
-            if potential_distances:
-                distance = potential_distances[0]
-                print(f"  Selected distance: {distance} km")
+        def next_frame(date_str):
+            # The accumulator counts the activities stamped so far
+            while accumulator.activity_count < len(activities) and activities[accumulator.activity_count]['date'] <= date_str:
+                accumulator.stamp(store.latlon(activity_key(activities[accumulator.activity_count])))
+            return accumulator.advance(date_str)
+    
+    total_dates = len(pending_dates)
+    for index, date_data in enumerate(pending_dates, 1):
+        date_str = date_data['date']
+        start = time.perf_counter()
+        with timer.frame(date_str):
+            with timer.stage('render'):
+                frame = next_frame(date_str)
+            if video is not None:
+                video.write(date_str, frame)
+                target = video.output_filename
             else:
-                distance = 0
-                print(f"  No reasonable distance found, using 0")
-        else:
-            distance = 0
-            print(f"  No decimal numbers found, using 0")
-        
-        return [{
-            'date': formatted_date,
-            'distance': distance,
-            'name': activity_name
-        }]
-        
+                target = screenshot_path(date_str, output_folder)
+                with timer.stage('png encode'):
+                    cv2.imwrite(target, frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                timer.count_bytes(os.path.getsize(target))
+        timer.count_frames()
+        print(f"Rendered {index}/{total_dates}: {target} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    if use_tile_cache:
+        print(f"Tile cache: {tiles.renders} tiles rendered, {tiles.hits} reused, "
+              f"{tiles.total_bytes / 2 ** 20:.0f} MB on disk")
+    else:
+        # Later runs with new activities continue from here
+        accumulator.save_snapshot()
+
+def page_load_detector():
+    """
+    PageLoadDetector for adaptive_wait, or None to always wait sleep_time
+    """
+    if not adaptive_wait:
+        return None
+    return PageLoadDetector(
+        threshold=stability_threshold,
+        stable_frames=stable_frames,
+        poll_interval=poll_interval,
+        timeout=sleep_time
+    )
+
+def get_source_bounds():
+    """
+    Bounds of what the capture backend sees: the second monitor, or the
+    browser viewport for the devtools backend
+    Returns None if the second monitor is missing
+    """
+    if capture_backend == "devtools":
+        return {"top": 0, "left": 0, "width": viewport_size[0], "height": viewport_size[1]}
+    monitor_bounds = get_second_monitor_bounds()
+    if monitor_bounds is None:
+        print("Error: Could not detect second monitor. Please ensure it's connected.")
+        return None
+    print(f"Detected second monitor bounds: {monitor_bounds}")
+    return monitor_bounds
+
+def open_capture_backend(capture_bounds):
+    """
+    Capture backend selected by capture_backend, grabbing capture_bounds
+    Returns None if it could not be started
+    """
+    try:
+        if capture_backend == "devtools":
+            return DevToolsBackend(
+                viewport_size, capture_bounds, devtools_tabs, chromium_path, devtools_port,
+                devtools_profile, devtools_headless, page_load_detector(), sleep_time
+            )
+        if capture_backend == "pyautogui":
+            return PyAutoGUIBackend(capture_bounds, page_load_detector(), sleep_time, iteration_time)
+        print(f"Error: Unknown capture_backend '{capture_backend}'")
     except Exception as e:
-        print(f"  Error processing entry: {str(e)}")
-        return []
+        print(f"Error: Could not start the {capture_backend} capture backend: {e}")
+    return None
+
+def get_capture_bounds(monitor_bounds):
+    """
+    Apply saved crop bounds directly as the grab region, making the crop pass optional
+    Returns tuple of (capture_bounds, cropped)
+    """
+    crop_bounds = load_crop_bounds(crop_bounds_file) if crop_at_grab else None
+    if crop_bounds:
+        try:
+            capture_bounds = crop_region(monitor_bounds, crop_bounds)
+            print(f"Cropping at grab time with bounds {crop_bounds}")
+            return capture_bounds, True
+        except ValueError as e:
+            print(f"Warning: {e}. Capturing the full monitor instead.")
+    return monitor_bounds, False
+
+def pending_captures(capture_dates, output_folder, journal):
+    """
+    Skip dates already captured by a previous (interrupted) run
+    Returns the dates that still need a capture
+    """
+    pending_dates = []
+    for date_data in capture_dates:
+        date_str = date_data['date']
+        filepath = screenshot_path(date_str, output_folder)
+        if journal.is_complete(date_str, filepath):
+            continue
+        if date_str in journal.entries or os.path.exists(filepath):
+            print(f"Re-queueing {date_str}: {filepath} is missing, corrupted or not journaled")
+            journal.forget(date_str)
+        pending_dates.append(date_data)
     
-def parse_csv_manually(csv_file):
+    skipped = len(capture_dates) - len(pending_dates)
+    if skipped:
+        print(f"Resuming: {skipped} dates already captured and verified, {len(pending_dates)} remaining")
+    return pending_dates
+
+def countdown(backend):
     """
-    Manual CSV parsing as fallback for complex CSV structure
+    Add a safety pause before starting (only needed while the backend controls the desktop)
     """
-    activities_data = []
+    if not backend.controls_desktop:
+        return
+    print("Script will start in 5 seconds. Please make sure your browser is open on the second monitor...")
+    print("DO NOT move your mouse or use keyboard during execution!")
+    for i in range(5, 0, -1):
+        print(f"Starting in {i} seconds...")
+        time.sleep(1)
+
+def run_captures(pending_dates, backend, output_folder, journal, sport='Run', start_date=first_date, video=None, timer=None):
+    """
+    Capture every pending date through a retry scheduler and save (or stream)
+    and journal the frames that pass validation
+    A failed or rejected capture is retried with exponential back-off after the
+    other dates (in place when streaming, which needs the frames in order)
+    Up to backend.concurrency dates load at the same time, unless streaming
+    With pipelined_capture, grabbed frames are processed and saved on a worker
+    thread while the next date loads
+    Stages are timed with timer (a StageTimer); without one, the utilisation of
+    this run's stages is printed at the end
+    Returns dict of date -> seconds waited for the page to load
+    """
+    total_dates = len(pending_dates)
+    load_waits = {}
+    fingerprints = {}
+    # Heatmap coverage of every accepted capture, including earlier runs
+    accepted_lit = {
+        date_str: entry['fingerprint']['lit']
+        for date_str, entry in journal.entries.items() if entry.get('fingerprint')
+    }
+    own_timer = timer is None
+    timer = StageTimer() if own_timer else timer
+    backend.timer = timer
+    writer = BackgroundPNGWriter(max_pending_writes, timer=timer) if background_writes and video is None else None
     
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        content = f.read()
+    def capture(date_data):
+        print(f"\nProcessing {len(load_waits) + 1}/{total_dates}")
+        frame, waited = capture_heatmap(date_data, backend, sport, start_date)
+        return {'frame': frame, 'waited': waited}
     
-    lines = content.split('\n')
-    print(f"Processing {len(lines)} lines manually...")
+    def process(date_data, result):
+        result['fingerprint'] = frame_fingerprint(result['frame'], rgb=True)
+        return result
     
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if 'Tallinn Streets' in line and i > 0:  # Skip header
-            try:
-                print(f"\nProcessing line {i + 1} with Tallinn Streets activity...")
-                
-                # Extract date - it's between the first set of double quotes after the ID
-                # Pattern: "ID,""Date"",Name...
-                date_pattern = r'""([^"]+)""'
-                date_match = re.search(date_pattern, line)
-                
-                if not date_match:
-                    print(f"  Could not extract date from line {i + 1}")
-                    i += 1
-                    continue
-                
-                date_str = date_match.group(1)
-                print(f"  Found date: {date_str}")
-                
-                # Parse date
-                try:
-                    date_obj = datetime.strptime(date_str, '%b %d, %Y, %I:%M:%S %p')
-                    formatted_date = date_obj.strftime('%Y-%m-%d')
-                    print(f"  Parsed date: {formatted_date}")
-                except Exception as e:
-                    print(f"  Could not parse date '{date_str}': {e}")
-                    i += 1
-                    continue
-                
-                # Extract activity name - find "Tallinn Streets" and get the full name
-                name_patterns = [
-                    r'(Tallinn Streets[^,]*)',
-                    r'(Survival Morning Run - Tallinn Streets[^,]*)',
-                    r'([^,]*Tallinn Streets[^,]*)'
-                ]
-                
-                activity_name = "Tallinn Streets Activity"
-                for pattern in name_patterns:
-                    name_match = re.search(pattern, line)
-                    if name_match:
-                        activity_name = name_match.group(1)
-                        break
-                
-                print(f"  Activity name: {activity_name}")
-                
-                # Extract distance - first check current line
-                name_end = line.find(activity_name) + len(activity_name)
-                remaining_line = line[name_end:]
-                
-                # Look for decimal numbers that could be distance
-                decimal_pattern = r',([0-9]+\.[0-9]+),'
-                decimal_matches = re.findall(decimal_pattern, remaining_line)
-                
-                # If no distance found on current line, check next line (for split entries)
-                if not decimal_matches and i + 1 < len(lines):
-                    next_line = lines[i + 1]
-                    if not next_line.strip().startswith('"'):  # Not a new entry
-                        print(f"  Checking continuation on line {i + 2}...")
-                        decimal_matches = re.findall(decimal_pattern, next_line)
-                        remaining_line = next_line
-                
-                if decimal_matches:
-                    print(f"  Found decimal numbers: {decimal_matches[:5]}")
-                    
-                    # Filter for reasonable distance values (0.1 to 100 km)
-                    potential_distances = []
-                    for d in decimal_matches:
-                        val = float(d)
-                        if 0.1 <= val <= 100:
-                            potential_distances.append(val)
-                    
-                    if potential_distances:
-                        distance = potential_distances[0]  # Take the first reasonable one
-                        print(f"  Selected distance: {distance} km")
-                    else:
-                        distance = 0
-                        print(f"  No reasonable distance found, using 0")
-                else:
-                    distance = 0
-                    print(f"  No decimal numbers found, using 0")
-                
-                activities_data.append({
-                    'date': formatted_date,
-                    'distance': distance,
-                    'name': activity_name
-                })
-                
-                print(f"  Successfully parsed: {formatted_date}, {distance} km, '{activity_name}'")
-                
-            except Exception as e:
-                print(f"  Error processing line {i + 1}: {str(e)}")
-        
-        i += 1
+    def validate(date_data, result):
+        # The heatmap only grows, so less coverage than the previous date means a failed load
+        previous = max((d for d in accepted_lit if d < date_data['date']), default=None)
+        if previous is None:
+            return True
+        return result['fingerprint']['lit'] >= accepted_lit[previous] * (1 - coverage_tolerance)
     
-    # Sort by date
-    activities_data.sort(key=lambda x: x['date'])
+    def save(date_data, result):
+        date_str = date_data['date']
+        frame = result['frame']
+        size = (frame.shape[1], frame.shape[0])
+        accepted_lit[date_str] = result['fingerprint']['lit']
+        fingerprints[date_str] = result['fingerprint']
+        load_waits[date_str] = result['waited']
+        
+        if video is not None:
+            video.write(date_str, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            print(f"Frame streamed to {video.output_filename}")
+        else:
+            os.makedirs(output_folder, exist_ok=True)
+            filepath = screenshot_path(date_str, output_folder)
+            if writer is not None:
+                writer.submit(date_str, filepath, frame.tobytes(), size)
+                print(f"Screenshot queued: {filepath} ({writer.pending()} pending writes)")
+                record_written(journal, writer, load_waits, fingerprints)
+            else:
+                with timer.stage('png encode'):
+                    mss.tools.to_png(frame.tobytes(), size, output=filepath)
+                timer.count_bytes(os.path.getsize(filepath))
+                print(f"Screenshot saved: {filepath}")
+                record_capture(journal, date_str, filepath, result['waited'], result['fingerprint'])
+        timer.count_frames()
+        print(f"Completed {len(load_waits)}/{total_dates}")
     
-    print(f"\nManual parsing completed. Found {len(activities_data)} Tallinn Streets activities:")
-    for activity in activities_data:
-        print(f"  {activity['date']}: {activity['distance']:.2f} km - {activity['name']}")
+    scheduler = CaptureScheduler(
+        capture,
+        validate if validate_captures else None,
+        max_attempts=capture_attempts,
+        base_delay=retry_delay,
+        max_delay=retry_max_delay,
+        requeue=video is None,
+        workers=backend.concurrency,
+        process=process,
+        pipeline=pipelined_capture,
+        timer=timer
+    )
+    try:
+        scheduler.run(pending_dates, on_success=save)
+    finally:
+        # Also runs on Ctrl+C, so every grabbed frame reaches the disk and the journal
+        if writer is not None:
+            if writer.pending():
+                print(f"Flushing {writer.pending()} pending screenshot writes...")
+            writer.close()
+            record_written(journal, writer, load_waits, fingerprints)
+    if own_timer:
+        timer.report("Capture stage utilisation")
     
-    return activities_data
+    if scheduler.failed:
+        print(f"\n{len(scheduler.failed)} dates failed after {capture_attempts} attempts and will be retried on the next run:")
+        for date_str, error in sorted(scheduler.failed.items()):
+            print(f"  {date_str}: {error}")
+    return load_waits
 
-def generate_screenshot_dates(activities_data, start_date="2024-01-01"):
+def record_capture(journal, date_str, filepath, waited, fingerprint=None):
     """
-    Generate dates from start_date to each activity date
+    Journal a saved screenshot (with its fingerprint if known)
     """
-    if not activities_data:
+    extra = {'fingerprint': fingerprint} if fingerprint else {}
+    if not journal.record(date_str, filepath, load_wait=round(waited, 2), **extra):
+        print(f"Warning: {filepath} is not a valid PNG, it will be captured again on the next run")
+
+def record_written(journal, writer, load_waits, fingerprints):
+    """
+    Journal the screenshots the background writer has finished
+    """
+    for date_str, filepath, error in writer.pop_completed():
+        if error:
+            print(f"Warning: Could not save {filepath}: {error}. It will be captured again on the next run")
+        else:
+            record_capture(journal, date_str, filepath, load_waits.get(date_str, 0), fingerprints.get(date_str))
+
+def check_captures(capture_dates, journal):
+    """
+    Compare the journaled fingerprints of consecutive captures: report frames
+    identical to the day before (the video holds them instead of re-encoding)
+    and captures whose heatmap coverage dropped, which are blank or half-loaded
+    Dropped captures are removed from the journal so the next run captures them again
+    Returns list of dates whose coverage dropped
+    """
+    dates = [d['date'] for d in capture_dates if d['date'] in journal.entries]
+    fingerprints = [journal.entries[date_str].get('fingerprint') for date_str in dates]
+    if not any(fingerprints):
         return []
     
-    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
-    screenshot_dates = []
+    duplicates = sum(len(run) - 1 for run in collapse_duplicates(fingerprints))
+    if duplicates:
+        print(f"{duplicates} captures are identical to the day before")
     
-    for activity in activities_data:
-        activity_dt = datetime.strptime(activity['date'], '%Y-%m-%d')
+    dropped = [dates[index] for index in coverage_drops(fingerprints, coverage_tolerance)]
+    for date_str in dropped:
+        lit = journal.entries[date_str]['fingerprint']['lit']
+        print(f"Warning: Heatmap coverage dropped on {date_str} ({lit} lit pixels), the page probably did not load")
+        if recapture_coverage_drops:
+            journal.forget(date_str)
+    if dropped and recapture_coverage_drops:
+        print(f"{len(dropped)} captures will be taken again on the next run")
+    return dropped
+
+def open_video_stream(screenshot_dates, output_folder, timer=None, output_filename=None, hold_dates=None):
+    """
+    Video writer for stream_video mode (None when it is off)
+    The video goes to output_filename (None: stream_output), raw frames are
+    archived to output_folder only with archive_frames
+    hold_dates are shown in the video along with the dates with new activities
+    """
+    if not stream_video:
+        return None
+    return StreamingVideoWriter(
+        output_filename or stream_output, stream_fps, screenshot_dates, stream_date_format,
+        archive_folder=output_folder if archive_frames else None, timer=timer, hold_dates=hold_dates
+    )
+
+def print_wait_summary(load_waits):
+    """
+    Report how long each date waited for the page to load
+    """
+    if not load_waits:
+        return
+    waits = list(load_waits.values())
+    print(f"\nPage load waits: average {sum(waits) / len(waits):.1f} s, "
+          f"max {max(waits):.1f} s, total {sum(waits) / 60:.1f} min")
+    for date_str, waited in load_waits.items():
+        print(f"  {date_str}: {waited:.1f} s")
+
+def load_challenges(path="challenges.json"):
+    """
+    Load the challenge list for batch mode, e.g.
+    [{"name": "tallinn-streets", "name_pattern": "Tallinn Streets", "sport": "Run"},
+     {"name": "rides", "sport_type": "Ride", "sport": "Ride", "start_date": "2023-01-01"}]
+    name_pattern and sport_type select activities, sport is the heatmap's sport
+    parameter (defaults to sport_type or Run), title is shown in messages
+    """
+    with open(path, 'r') as f:
+        challenges = json.load(f)
+    names = [challenge['name'] for challenge in challenges]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate challenge names in {path}")
+    return challenges
+
+def run_batch(challenges, csv_file="TallinnStreets.csv", output_root="challenges", timer=None):
+    """
+    Parse the export once, write a capture plan and metadata file for every
+    challenge, and capture each (sport, start date, day) heatmap only once
+    
+    Layout:
+    output_root/<challenge>/screenshot_metadata.json
+    output_root/frames/<sport>_<start date>/(cropped_)screenshots/YYYYMMDD.png
+    
+    With offline_render every challenge is rendered from its own activities
+    into output_root/<challenge>/cropped_screenshots/ instead (or streamed
+    into output_root/<challenge>/<stream_output> with stream_video).
+    Captured frames are shared between challenges, so stream_video does not
+    apply to captures; create_video.py renders their videos in batch mode.
+    """
+    partitions = load_challenge_activities(csv_file, challenges)
+    
+    if offline_render:
+        cropped = True
+    else:
+        source_bounds = get_source_bounds()
+        if source_bounds is None:
+            return
+        capture_bounds, cropped = get_capture_bounds(source_bounds)
+    
+    # Captures shared between challenges with the same sport and start date
+    groups = {}
+    renders = []
+    for challenge in challenges:
+        name = challenge['name']
+        activities_data = partitions[name]
+        if not activities_data:
+            print(f"No activities found for challenge '{name}', skipping")
+            continue
+        
+        start_date = challenge.get('start_date', first_date)
+        sport = challenge.get('sport') or challenge.get('sport_type') or 'Run'
+        screenshot_dates = generate_screenshot_dates(activities_data, start_date)
+        capture_dates = plan_capture_dates(screenshot_dates, capture_mode, hold_interval)
+        if not capture_dates:
+            print(f"No dates to capture for challenge '{name}' from {start_date}, skipping")
+            continue
         
-        # Generate all dates from start_date to activity_date
-        current_dt = start_dt
-        while current_dt <= activity_dt:
-            date_str = current_dt.strftime('%Y-%m-%d')
-            if date_str not in [d['date'] for d in screenshot_dates]:
-                # Calculate accumulated distance and days up to this date
-                accumulated_distance = sum(
-                    act['distance'] for act in activities_data 
-                    if datetime.strptime(act['date'], '%Y-%m-%d') <= current_dt
+        challenge_folder = os.path.join(output_root, name)
+        os.makedirs(challenge_folder, exist_ok=True)
+        if offline_render:
+            frames_folder = os.path.join(challenge_folder, 'cropped_screenshots')
+            renders.append((name, challenge_folder, frames_folder, activities_data, screenshot_dates, capture_dates, start_date))
+        else:
+            group_root = os.path.join(output_root, 'frames', f"{sport}_{start_date}")
+            frames_folder = os.path.join(group_root, 'cropped_screenshots' if cropped else 'screenshots')
+            group = groups.setdefault((sport, start_date), {'root': group_root, 'folder': frames_folder, 'dates': {}})
+            for date_data in capture_dates:
+                group['dates'].setdefault(date_data['date'], {'date': date_data['date']})
+        
+        metadata = {
+            'title': challenge.get('title') or challenge.get('name_pattern') or name,
+            'frames_folder': frames_folder,
+            'screenshot_dates': screenshot_dates,
+            'capture_dates': [d['date'] for d in capture_dates],
+            'hold_dates': held_dates(capture_dates),
+            'activities_data': activities_data
+        }
+        with open(os.path.join(challenge_folder, 'screenshot_metadata.json'), 'w') as f:
+            json.dump(metadata, f, indent=2)
+        print(f"Challenge '{name}': {len(activities_data)} activities, "
+              f"{len(capture_dates)} of {len(screenshot_dates)} dates to capture ({sport} heatmap)")
+    
+    if offline_render:
+        for name, challenge_folder, frames_folder, activities_data, screenshot_dates, capture_dates, start_date in renders:
+            print(f"\nRendering challenge '{name}' into '{frames_folder}'")
+            video = open_video_stream(
+                screenshot_dates, frames_folder, timer,
+                os.path.join(challenge_folder, os.path.basename(stream_output)), held_dates(capture_dates)
+            )
+            try:
+                render_offline_frames(
+                    activities_data, capture_dates, frames_folder, start_date,
+                    video=video, timer=timer, work_folder=challenge_folder
                 )
-                accumulated_days = len([
-                    act for act in activities_data 
-                    if datetime.strptime(act['date'], '%Y-%m-%d') <= current_dt
-                ])
-                
-                screenshot_dates.append({
-                    'date': date_str,
-                    'accumulated_distance': accumulated_distance,
-                    'accumulated_days': accumulated_days
-                })
-            current_dt += timedelta(days=1)
+            finally:
+                if video is not None:
+                    video.close()
+        return
+    if stream_video:
+        print("stream_video does not apply to batch captures (frames are shared between challenges), "
+              "saving frames for create_video.py instead")
     
-    return screenshot_dates
+    work = []
+    for (sport, start_date), group in groups.items():
+        os.makedirs(group['root'], exist_ok=True)
+        journal = CaptureJournal(os.path.join(group['root'], 'capture_journal.json'))
+        capture_dates = sorted(group['dates'].values(), key=lambda d: d['date'])
+        pending_dates = pending_captures(capture_dates, group['folder'], journal)
+        if pending_dates:
+            work.append((pending_dates, group['folder'], journal, sport, start_date, capture_dates))
+    
+    total = sum(len(item[0]) for item in work)
+    if not total:
+        print("All dates already captured. Nothing to do.")
+        return
+    
+    backend = open_capture_backend(capture_bounds)
+    if backend is None:
+        return
+    print(f"\nScript will process {total} screenshots for {len(challenges)} challenges...")
+    load_waits = {}
+    with backend:
+        countdown(backend)
+        for pending_dates, frames_folder, journal, sport, start_date, _ in work:
+            print(f"\nCapturing {len(pending_dates)} {sport} heatmaps into '{frames_folder}'")
+            waits = run_captures(pending_dates, backend, frames_folder, journal, sport, start_date, timer=timer)
+            load_waits.update({f"{sport} {date_str}": waited for date_str, waited in waits.items()})
+    print_wait_summary(load_waits)
+    for _, _, journal, _, _, capture_dates in work:
+        check_captures(capture_dates, journal)
 
-def main():
-    # Load Tallinn Streets data from CSV
-    activities_data = load_tallinn_streets_data()
+def main(timer=None):
+    if batch_mode:
+        run_batch(load_challenges(challenges_file), output_root=challenges_folder, timer=timer)
+        return
+    
+    # Load Tallinn Streets data from CSV (or the cache) and generate screenshot dates
+    activities_data, screenshot_dates = load_activity_plan(cache_file=cache_file, force_rebuild=rebuild_cache)
     if not activities_data:
         print("No Tallinn Streets activities found or error loading CSV. Exiting.")
         return
     
-    # Generate screenshot dates
-    screenshot_dates = generate_screenshot_dates(activities_data)
     if not screenshot_dates:
         print("No dates to process. Exiting.")
         return
     
-    # Get second monitor bounds
-    monitor_bounds = get_second_monitor_bounds()
-    if monitor_bounds is None:
-        print("Error: Could not detect second monitor. Please ensure it's connected.")
-        return
-
-    print(f"Detected second monitor bounds: {monitor_bounds}")
+    # Only schedule captures for dates where the heatmap changes
+    capture_dates = plan_capture_dates(screenshot_dates, capture_mode, hold_interval)
+    print(f"Capture plan ({capture_mode}): {len(capture_dates)} of {len(screenshot_dates)} dates")
     
     # Save screenshot metadata for video creation
-    import json
     metadata = {
         'screenshot_dates': screenshot_dates,
+        'capture_dates': [d['date'] for d in capture_dates],
+        'hold_dates': held_dates(capture_dates),
         'activities_data': activities_data
     }
     with open('screenshot_metadata.json', 'w') as f:
         json.dump(metadata, f, indent=2)
     print("Saved screenshot metadata for video creation")
     
-    # Add a safety pause before starting
-    print(f"\nScript will process {len(screenshot_dates)} screenshots...")
-    print("Script will start in 5 seconds. Please make sure your browser is open on the second monitor...")
-    print("DO NOT move your mouse or use keyboard during execution!")
-    for i in range(5, 0, -1):
-        print(f"Starting in {i} seconds...")
-        time.sleep(1)
+    if offline_render:
+        video = open_video_stream(screenshot_dates, 'cropped_screenshots', timer, hold_dates=held_dates(capture_dates))
+        try:
+            render_offline_frames(activities_data, capture_dates, video=video, timer=timer)
+        finally:
+            if video is not None:
+                video.close()
+        return
     
-    total_dates = len(screenshot_dates)
-    for index, date_data in enumerate(screenshot_dates, 1):
-        print(f"\nProcessing {index}/{total_dates}")
-        take_strava_screenshot(date_data, monitor_bounds)
-        print(f"Completed {index}/{total_dates}")
+    source_bounds = get_source_bounds()
+    if source_bounds is None:
+        return
+    
+    capture_bounds, cropped = get_capture_bounds(source_bounds)
+    output_folder = 'cropped_screenshots' if cropped else 'screenshots'
+    print(f"Saving screenshots to '{output_folder}'")
+    
+    journal = CaptureJournal(journal_file)
+    if stream_video:
+        # The video needs every frame, so nothing can be skipped
+        pending_dates = capture_dates
+    else:
+        pending_dates = pending_captures(capture_dates, output_folder, journal)
+    if not pending_dates:
+        print("All dates already captured. Nothing to do.")
+        return
+    
+    backend = open_capture_backend(capture_bounds)
+    if backend is None:
+        return
+    print(f"\nScript will process {len(pending_dates)} screenshots...")
+    video = open_video_stream(screenshot_dates, output_folder, timer, hold_dates=held_dates(capture_dates))
+    try:
+        countdown(backend)
+        load_waits = run_captures(pending_dates, backend, output_folder, journal, video=video, timer=timer)
+    finally:
+        backend.close()
+        if video is not None:
+            video.close()
+    print_wait_summary(load_waits)
+    if video is None:
+        check_captures(capture_dates, journal)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    with instrumented_run("strava-screenshot", run_report_folder) as run_timer:
+        main(run_timer)
@@ -0,0 +1,94 @@
+import importlib.util
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def load_script(filename):
+    """
+    Import one of the hyphenated scripts (not importable by name) as a module
+    """
+    name = filename[:-3].replace('-', '_')
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[name]
+            raise
+    return sys.modules[name]
+
+@pytest.fixture(scope="session")
+def screenshot_script():
+    pytest.importorskip("screeninfo")
+    return load_script("strava-screenshot.py")
+
+class FakeClock:
+    """
+    Clock that only moves when sleep() is called, usable as the time module too
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+class FakeScreenshot:
+    """
+    mss screenshot of BGRA pixels
+    """
+    def __init__(self, pixels):
+        self.pixels = pixels
+        self.size = (pixels.shape[1], pixels.shape[0])
+
+    @property
+    def rgb(self):
+        return self.pixels[..., 2::-1].tobytes()
+
+    def __array__(self, dtype=None, copy=None):
+        return self.pixels
+
+class FakeMss:
+    """
+    mss instance grabbing the given BGRA pixels, or black frames of the grabbed size
+    """
+    def __init__(self, pixels=None):
+        self.pixels = pixels
+        self.regions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def grab(self, bounds):
+        self.regions.append(bounds)
+        if self.pixels is None:
+            return FakeScreenshot(np.zeros((bounds['height'], bounds['width'], 4), dtype=np.uint8))
+        return FakeScreenshot(self.pixels)
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def fake_mss():
+    """
+    The FakeMss class, to patch in for mss or to build with pixels
+    """
+    return FakeMss
@@ -0,0 +1,175 @@
+import base64
+import hashlib
+import itertools
+import json
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+def render_standin(url, width, height):
+    """
+    BGR frame of tests/data/heatmap_standin.html: black with an orange band
+    ?band=N pixels wide
+    """
+    match = re.search(r'[?&]band=(\d+)', url or '')
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    if match:
+        frame[:, :int(match.group(1))] = (0, 128, 255)
+    return frame
+
+def recv_message(conn):
+    """
+    Read one masked client WebSocket frame, None when the client closes
+    """
+    header = conn.recv(2)
+    if len(header) < 2 or header[0] & 0x0F == 8:
+        return None
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack('>H', conn.recv(2))[0]
+    elif length == 127:
+        length = struct.unpack('>Q', conn.recv(8))[0]
+    mask = conn.recv(4)
+    data = b''
+    while len(data) < length:
+        data += conn.recv(length - len(data))
+    return bytes(byte ^ mask[index % 4] for index, byte in enumerate(data)).decode()
+
+def send_message(conn, message):
+    data = json.dumps(message).encode()
+    if len(data) < 126:
+        header = bytes([0x81, len(data)])
+    elif len(data) < 65536:
+        header = bytes([0x81, 126]) + struct.pack('>H', len(data))
+    else:
+        header = bytes([0x81, 127]) + struct.pack('>Q', len(data))
+    conn.sendall(header + data)
+
+class FakeDevTools:
+    """
+    Stand-in for a browser's remote debugging port: the /json HTTP endpoints
+    and one WebSocket per tab answering the commands DevToolsBackend sends.
+    Pages are "rendered" with render_standin
+
+    Args:
+    load_time: Seconds between Page.navigate and the load event
+    break_on: Substring of URLs whose navigation drops the tab's connection
+    """
+    def __init__(self, load_time=0.2, break_on=None):
+        self.load_time = load_time
+        self.break_on = break_on
+        self.targets = set()
+        self.navigations = []
+        self.loading = 0
+        self.max_loading = 0
+        self.lock = threading.Lock()
+        self.ids = itertools.count()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def navigate(self, conn, message, page):
+        url = message['params']['url']
+        with self.lock:
+            self.navigations.append(url)
+            self.loading += 1
+            self.max_loading = max(self.max_loading, self.loading)
+        try:
+            if self.break_on and self.break_on in url:
+                return False
+            page['url'] = url
+            send_message(conn, {'id': message['id'], 'result': {'frameId': 'F', 'loaderId': 'L'}})
+            time.sleep(self.load_time)
+            send_message(conn, {'method': 'Page.loadEventFired', 'params': {'timestamp': time.time()}})
+            return True
+        finally:
+            with self.lock:
+                self.loading -= 1
+
+    def serve_tab(self, conn):
+        page = {'url': 'about:blank', 'width': 800, 'height': 600}
+        while True:
+            raw = recv_message(conn)
+            if raw is None:
+                return
+            message = json.loads(raw)
+            method, params, result = message['method'], message.get('params', {}), {}
+            if method == 'Page.navigate':
+                if not self.navigate(conn, message, page):
+                    return
+                continue
+            if method == 'Emulation.setDeviceMetricsOverride':
+                page['width'], page['height'] = params['width'], params['height']
+            elif method == 'Page.getLayoutMetrics':
+                result = {'cssVisualViewport': {'clientWidth': page['width'], 'clientHeight': page['height']}}
+            elif method == 'Page.captureScreenshot':
+                frame = render_standin(page['url'], page['width'], page['height'])
+                clip = params.get('clip')
+                if clip:
+                    x, y = int(clip['x']), int(clip['y'])
+                    frame = frame[y:y + int(clip['height']), x:x + int(clip['width'])]
+                    if clip.get('scale', 1) != 1:
+                        frame = cv2.resize(frame, None, fx=clip['scale'], fy=clip['scale'], interpolation=cv2.INTER_AREA)
+                extension = '.png' if params.get('format') == 'png' else '.jpg'
+                result = {'data': base64.b64encode(cv2.imencode(extension, frame)[1].tobytes()).decode()}
+            send_message(conn, {'id': message['id'], 'result': result})
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_PUT(self):
+                self.do_GET()
+
+            def do_GET(self):
+                if self.headers.get('Upgrade', '').lower() == 'websocket':
+                    accept = hashlib.sha1((self.headers['Sec-WebSocket-Key'] + WEBSOCKET_GUID).encode()).digest()
+                    self.send_response(101)
+                    self.send_header('Upgrade', 'websocket')
+                    self.send_header('Connection', 'Upgrade')
+                    self.send_header('Sec-WebSocket-Accept', base64.b64encode(accept).decode())
+                    self.end_headers()
+                    self.wfile.flush()
+                    fake.serve_tab(self.connection)
+                    self.close_connection = True
+                    return
+                if self.path.startswith('/json/version'):
+                    body = {'Browser': 'FakeDevTools/1.0'}
+                elif self.path.startswith('/json/new'):
+                    target_id = f"T{next(fake.ids)}"
+                    with fake.lock:
+                        fake.targets.add(target_id)
+                    body = {'id': target_id, 'webSocketDebuggerUrl': f"ws://127.0.0.1:{fake.port}/devtools/page/{target_id}"}
+                elif self.path.startswith('/json/close/'):
+                    with fake.lock:
+                        fake.targets.discard(self.path.rsplit('/', 1)[1])
+                    body = "Target is closing"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = (body if isinstance(body, str) else json.dumps(body)).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
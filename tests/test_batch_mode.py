@@ -0,0 +1,35 @@
+import json
+import os
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "malformed_export.csv")
+
+CHALLENGES = [
+    {'name': 'streets', 'name_pattern': 'tallinn streets'},
+    # Every matching activity is before the start date
+    {'name': 'late', 'name_pattern': 'tallinn streets', 'start_date': '2025-01-01'},
+]
+
+def test_challenge_without_dates_is_skipped(screenshot_script, monkeypatch, tmp_path):
+    renders = []
+    monkeypatch.setattr(screenshot_script, 'offline_render', True)
+    monkeypatch.setattr(screenshot_script, 'stream_video', False)
+    monkeypatch.setattr(
+        screenshot_script, 'render_offline_frames',
+        lambda activities_data, capture_dates, output_folder, *args, **kwargs: renders.append((output_folder, capture_dates))
+    )
+    screenshot_script.run_batch(CHALLENGES, CORPUS, str(tmp_path))
+    assert [os.path.basename(os.path.dirname(folder)) for folder, _ in renders] == ['streets']
+    assert all(capture_dates for _, capture_dates in renders)
+    assert not os.path.exists(tmp_path / "late")
+    with open(tmp_path / "streets" / "screenshot_metadata.json") as f:
+        assert json.load(f)['capture_dates']
+
+def test_render_without_dates_returns_early(screenshot_script, tmp_path, capsys):
+    class Video:
+        def write(self, date_str, frame):
+            raise AssertionError("no frame should be written")
+
+    screenshot_script.render_offline_frames([], [], str(tmp_path / "frames"), video=Video(), work_folder=str(tmp_path))
+    screenshot_script.render_offline_frames([], [], str(tmp_path / "frames"), work_folder=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+    assert "All frames already rendered" not in capsys.readouterr().out
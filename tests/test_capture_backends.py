@@ -0,0 +1,91 @@
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("websocket")
+
+from capture_backends import DevToolsBackend, find_chromium
+from fake_devtools import FakeDevTools
+from page_load import PageLoadDetector
+
+STANDIN_PAGE = Path(__file__).resolve().parent / "data" / "heatmap_standin.html"
+
+def detector():
+    # Stable for longer than the stand-in page takes to draw its band
+    return PageLoadDetector(threshold=1.0, stable_frames=5, poll_interval=0.1, timeout=10, min_wait=0)
+
+def band_width(frame):
+    """
+    Width of the orange band in an RGB frame
+    """
+    orange = (frame[:, :, 0] > 200) & (frame[:, :, 1] > 90) & (frame[:, :, 2] < 60)
+    return int(orange[frame.shape[0] // 2].sum())
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def devtools():
+    fake = FakeDevTools().start()
+    yield fake
+    fake.stop()
+
+def open_backend(port, **options):
+    options.setdefault('viewport', (320, 200))
+    options.setdefault('tabs', 1)
+    return DevToolsBackend(port=port, detector=detector(), load_timeout=10, **options)
+
+def test_capture_grabs_the_viewport(devtools):
+    with open_backend(devtools.port) as backend:
+        frame, waited = backend.capture("http://standin.test/?band=40")
+        assert devtools.targets
+    assert frame.shape == (200, 320, 3)
+    assert band_width(frame) == 40
+    assert waited >= devtools.load_time
+    # Closing the backend closes its tabs but not the browser it attached to
+    assert devtools.targets == set()
+
+def test_capture_keeps_only_bounds(devtools):
+    bounds = {'left': 20, 'top': 10, 'width': 100, 'height': 50}
+    with open_backend(devtools.port, bounds=bounds) as backend:
+        frame, _ = backend.capture("http://standin.test/?band=60")
+    assert frame.shape == (50, 100, 3)
+    assert band_width(frame) == 40
+
+def test_tabs_load_at_the_same_time(devtools):
+    urls = [f"http://standin.test/?band={band}" for band in (10, 20, 30, 40, 50, 60)]
+    with open_backend(devtools.port, tabs=3) as backend:
+        assert backend.concurrency == 3
+        with ThreadPoolExecutor(3) as executor:
+            frames = [frame for frame, _ in executor.map(backend.capture, urls)]
+    assert [band_width(frame) for frame in frames] == [10, 20, 30, 40, 50, 60]
+    assert devtools.max_loading > 1
+    assert sorted(devtools.navigations) == sorted(urls)
+
+def test_broken_tab_is_replaced():
+    fake = FakeDevTools(break_on="crash").start()
+    try:
+        with open_backend(fake.port) as backend:
+            with pytest.raises(Exception):
+                backend.capture("http://standin.test/?band=5&crash")
+            frame, _ = backend.capture("http://standin.test/?band=7")
+            assert band_width(frame) == 7
+            assert len(backend.tabs) == 1
+    finally:
+        fake.stop()
+
+def test_find_chromium_with_missing_path(tmp_path):
+    assert find_chromium(str(tmp_path / "no-such-browser")) is None
+
+@pytest.mark.skipif(find_chromium() is None, reason="Chromium/Chrome is not installed")
+def test_chromium_captures_the_standin_page(tmp_path):
+    urls = [f"{STANDIN_PAGE.as_uri()}?band={band}" for band in (60, 120)]
+    with open_backend(free_port(), tabs=2, profile=str(tmp_path / "profile"), headless=True) as backend:
+        with ThreadPoolExecutor(2) as executor:
+            frames = [frame for frame, _ in executor.map(backend.capture, urls)]
+    assert [frame.shape for frame in frames] == [(200, 320, 3)] * 2
+    assert [band_width(frame) for frame in frames] == [60, 120]
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import pytest
+
+from capture_scheduler import CaptureScheduler
+
+class FakeBackend:
+    """
+    Capture callable that plays back scripted outcomes per date
+    An outcome is a result, or an exception to raise; the last one repeats
+    """
+    def __init__(self, outcomes=None):
+        self.outcomes = outcomes or {}
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, item):
+        date_str = item['date']
+        with self.lock:
+            attempt = sum(1 for call in self.calls if call == date_str)
+            self.calls.append(date_str)
+        script = self.outcomes.get(date_str, [f"{date_str} frame"])
+        outcome = script[min(attempt, len(script) - 1)]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+def items(*dates):
+    return [{'date': date_str} for date_str in dates]
+
+def run(scheduler, dates):
+    saved = []
+    completed = scheduler.run(items(*dates), on_success=lambda item, result: saved.append((item['date'], result)))
+    return completed, saved
+
+def test_delay_doubles_up_to_max_delay():
+    scheduler = CaptureScheduler(FakeBackend(), base_delay=5, max_delay=30)
+    assert [scheduler.delay(attempts) for attempts in range(1, 6)] == [5, 10, 20, 30, 30]
+
+def test_retries_wait_with_exponential_back_off(clock):
+    backend = FakeBackend({'a': [RuntimeError("timeout"), RuntimeError("timeout"), "a frame"]})
+    scheduler = CaptureScheduler(backend, max_attempts=3, base_delay=5, requeue=False, clock=clock, sleep=clock.sleep)
+    completed, saved = run(scheduler, ['a'])
+    assert clock.sleeps == [5, 10]
+    assert completed == {'a': "a frame"}
+    assert saved == [('a', "a frame")]
+    assert scheduler.attempts == {'a': 3}
+
+def test_requeue_retries_after_the_rest_of_the_queue(clock):
+    backend = FakeBackend({'a': [RuntimeError("timeout"), "a frame"]})
+    scheduler = CaptureScheduler(backend, base_delay=5, requeue=True, clock=clock, sleep=clock.sleep)
+    completed, saved = run(scheduler, ['a', 'b', 'c'])
+    assert backend.calls == ['a', 'b', 'c', 'a']
+    assert [date_str for date_str, _ in saved] == ['b', 'c', 'a']
+    assert set(completed) == {'a', 'b', 'c'}
+
+def test_without_requeue_retries_in_place(clock):
+    backend = FakeBackend({'a': [RuntimeError("timeout"), "a frame"]})
+    scheduler = CaptureScheduler(backend, base_delay=5, requeue=False, clock=clock, sleep=clock.sleep)
+    _, saved = run(scheduler, ['a', 'b', 'c'])
+    assert backend.calls == ['a', 'a', 'b', 'c']
+    assert [date_str for date_str, _ in saved] == ['a', 'b', 'c']
+
+def test_gives_up_after_max_attempts(clock):
+    backend = FakeBackend({'b': [RuntimeError("page did not load")]})
+    scheduler = CaptureScheduler(backend, max_attempts=3, base_delay=1, clock=clock, sleep=clock.sleep)
+    completed, saved = run(scheduler, ['a', 'b', 'c'])
+    assert backend.calls.count('b') == 3
+    assert scheduler.failed == {'b': "page did not load"}
+    assert set(completed) == {'a', 'c'}
+    assert 'b' not in [date_str for date_str, _ in saved]
+
+def test_rejected_results_are_retried(clock):
+    backend = FakeBackend({'a': ["blank", "a frame"]})
+    scheduler = CaptureScheduler(
+        backend, validate=lambda item, result: result != "blank",
+        base_delay=1, clock=clock, sleep=clock.sleep
+    )
+    completed, saved = run(scheduler, ['a'])
+    assert completed == {'a': "a frame"}
+    assert saved == [('a', "a frame")]
+
+def test_process_result_is_validated_and_saved(clock):
+    scheduler = CaptureScheduler(
+        FakeBackend(), process=lambda item, result: result.upper(),
+        validate=lambda item, result: result.isupper(), clock=clock, sleep=clock.sleep
+    )
+    _, saved = run(scheduler, ['a'])
+    assert saved == [('a', "A FRAME")]
+
+def test_ordered_pipeline_holds_back_frames_after_a_rejection():
+    # b is rejected while c is already grabbed, so c has to wait for b's retry
+    backend = FakeBackend({'b': ["blank", "b frame"]})
+    processing_b = threading.Event()
+
+    def process(item, result):
+        if item['date'] == 'b' and result == "blank":
+            processing_b.set()
+            # Give the capture thread time to grab c meanwhile
+            time.sleep(0.2)
+        return result
+
+    scheduler = CaptureScheduler(
+        backend, validate=lambda item, result: result != "blank", process=process,
+        base_delay=0.01, requeue=False, pipeline=True
+    )
+    completed, saved = run(scheduler, ['a', 'b', 'c', 'd'])
+    assert processing_b.is_set()
+    assert [date_str for date_str, _ in saved] == ['a', 'b', 'c', 'd']
+    assert saved[1] == ('b', "b frame")
+    # c was grabbed before b's retry and again after it, without using up an attempt
+    assert backend.calls.count('c') == 2
+    assert [date_str for date_str in backend.calls if date_str in ('b', 'c')] == ['b', 'c', 'b', 'c']
+    assert scheduler.attempts == {'a': 1, 'b': 2, 'c': 1, 'd': 1}
+    assert scheduler.failed == {}
+    assert set(completed) == {'a', 'b', 'c', 'd'}
+
+def test_pipeline_captures_while_the_previous_frame_is_processed():
+    next_captured = threading.Event()
+    overlapped = []
+
+    def capture(item):
+        if item['date'] == 'b':
+            next_captured.set()
+        return item['date']
+
+    def process(item, result):
+        if item['date'] == 'a':
+            # Only returns early if b is captured while a is still being processed
+            overlapped.append(next_captured.wait(timeout=5))
+        return result
+
+    scheduler = CaptureScheduler(capture, process=process, requeue=False, pipeline=True)
+    _, saved = run(scheduler, ['a', 'b', 'c'])
+    assert overlapped == [True]
+    assert saved == [('a', 'a'), ('b', 'b'), ('c', 'c')]
+
+def test_without_pipeline_processing_blocks_the_next_capture():
+    order = []
+
+    def capture(item):
+        order.append(('capture', item['date']))
+        return item['date']
+
+    def process(item, result):
+        order.append(('process', item['date']))
+        return result
+
+    scheduler = CaptureScheduler(capture, process=process, requeue=False, pipeline=False)
+    run(scheduler, ['a', 'b'])
+    assert order == [('capture', 'a'), ('process', 'a'), ('capture', 'b'), ('process', 'b')]
+
+def test_workers_capture_at_the_same_time():
+    both_running = threading.Barrier(2, timeout=5)
+
+    def capture(item):
+        # Raises BrokenBarrierError unless two captures run at once
+        both_running.wait()
+        return item['date']
+
+    scheduler = CaptureScheduler(capture, base_delay=0.01, requeue=True, workers=2, pipeline=True)
+    completed, _ = run(scheduler, ['a', 'b', 'c', 'd'])
+    assert set(completed) == {'a', 'b', 'c', 'd'}
+    assert scheduler.failed == {}
+
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_workers_need_requeue(pipeline):
+    scheduler = CaptureScheduler(FakeBackend(), requeue=False, workers=4, pipeline=pipeline)
+    assert scheduler.workers == 1
@@ -0,0 +1,86 @@
+import io
+import os
+
+import pytest
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "malformed_export.csv")
+
+def rows(script, text):
+    return list(script.iter_csv_rows(io.StringIO(text, newline='')))
+
+@pytest.fixture
+def challenge_activities(screenshot_script):
+    challenges = [
+        {'name': 'streets', 'name_pattern': 'tallinn streets'},
+        {'name': 'rides', 'sport_type': 'Ride'},
+    ]
+    return screenshot_script.load_challenge_activities(CORPUS, challenges)
+
+def test_multiline_field_with_activity_like_lines(screenshot_script):
+    text = (
+        'Activity ID,Activity Name,Activity Description,Distance\n'
+        '1,Run,"Splits:\n1,5:30\n2,5:25",5.0\n'
+        '2,Walk,,1.0\n'
+    )
+    assert rows(screenshot_script, text) == [
+        ['Activity ID', 'Activity Name', 'Activity Description', 'Distance'],
+        ['1', 'Run', 'Splits:\n1,5:30\n2,5:25', '5.0'],
+        ['2', 'Walk', '', '1.0'],
+    ]
+
+def test_unterminated_quote_is_closed_at_the_next_row(screenshot_script):
+    text = (
+        'Activity ID,Activity Name,Distance\n'
+        '1,"Run,5.0\n'
+        '2,Walk,1.0\n'
+        '3,Ride,20.0\n'
+    )
+    parsed = rows(screenshot_script, text)
+    assert parsed[-2:] == [['2', 'Walk', '1.0'], ['3', 'Ride', '20.0']]
+    assert parsed[1][0] == '1'
+
+def test_unterminated_quote_at_end_of_file(screenshot_script):
+    text = 'Activity ID,Activity Name,Distance\n2,Walk,1.0\n3,"Ride,20.0\n'
+    parsed = rows(screenshot_script, text)
+    assert parsed[1] == ['2', 'Walk', '1.0']
+    assert parsed[2][0] == '3'
+
+def test_wrapped_rows_are_unwrapped(screenshot_script):
+    text = 'Activity ID,Activity Name,Distance\n"1,""Run, easy"",5.0"\n'
+    assert rows(screenshot_script, text)[1] == ['1', 'Run, easy', '5.0']
+
+def test_oversized_field_is_recovered(screenshot_script):
+    # An open quote swallowing a long file makes csv.reader raise on the field size limit
+    lines = ['Activity ID,Activity Name,Distance\n', '1,"Run,5.0\n']
+    lines += [f'{index},Walk {index},1.0\n' for index in range(2, 20000)]
+    parsed = list(screenshot_script.iter_csv_rows(lines))
+    assert len(parsed) == 20000
+    assert parsed[-1] == ['19999', 'Walk 19999', '1.0']
+
+def test_corpus_challenge_activities(challenge_activities):
+    streets = challenge_activities['streets']
+    assert [(a['id'], a['date'], a['distance']) for a in streets] == [
+        ('1001', '2024-01-02', 5.2),
+        ('1003', '2024-01-05', 3.1),
+        ('1004', '2024-01-06', 6.0),
+        ('1005', '2024-01-07', 7.5),
+        # 1006 has an unterminated quote around its distance, the rows after it survive
+        ('1007', '2024-01-09', 3.3),
+        ('1008', '2024-01-10', 0),
+        ('1009', '2024-01-11', 5.0),
+    ]
+    assert streets[3]['name'] == 'Tallinn Streets "hills" #4'
+    assert streets[0]['filename'] == 'activities/1001.gpx'
+
+def test_corpus_sport_type_filter(challenge_activities):
+    rides = challenge_activities['rides']
+    assert [(a['id'], a['distance']) for a in rides] == [('1002', 20.0)]
+
+def test_corpus_header_has_no_bom(screenshot_script):
+    with open(CORPUS, encoding='utf-8-sig', newline='') as f:
+        header = next(screenshot_script.iter_csv_rows(f))
+    assert header[0] == 'Activity ID'
+
+def test_missing_file(screenshot_script, tmp_path):
+    partitions = screenshot_script.load_challenge_activities(str(tmp_path / "missing.csv"), [{'name': 'streets'}])
+    assert partitions == {'streets': []}
@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+
+from capture_journal import CaptureJournal
+from create_video import frame_fingerprints, load_frame_fingerprints
+from frame_check import collapse_duplicates, frame_fingerprint
+
+def write_frame(path, level):
+    frame = np.zeros((32, 48, 3), dtype=np.uint8)
+    frame[:, :level] = (0, 90, 250)
+    cv2.imwrite(str(path), frame)
+    return frame
+
+def journal_with(tmp_path, frames):
+    """
+    Journal recording every (date, path, frame) with the frame's fingerprint
+    """
+    journal = CaptureJournal(str(tmp_path / "capture_journal.json"))
+    for date_str, path, frame in frames:
+        journal.record(date_str, str(path), fingerprint=frame_fingerprint(frame))
+    return journal.path
+
+def test_matching_entries_use_the_journal_fingerprint(tmp_path):
+    folder = tmp_path / "screenshots"
+    folder.mkdir()
+    frames = [(f'2024-01-0{day}', folder / f"2024010{day}.png", write_frame(folder / f"2024010{day}.png", 10 * day)) for day in (1, 2)]
+    entries = load_frame_fingerprints(journal_with(tmp_path, frames))
+    # Sentinel fingerprints show the journal ones are used, not fresh ones
+    for entry in entries.values():
+        entry['fingerprint'] = {'hash': '00', 'lit': -1}
+    fingerprints = frame_fingerprints([path for _, path, _ in frames], entries)
+    assert fingerprints == {'20240101': {'hash': '00', 'lit': -1}, '20240102': {'hash': '00', 'lit': -1}}
+
+def test_rewritten_frames_are_fingerprinted_fresh(tmp_path):
+    folder = tmp_path / "screenshots"
+    folder.mkdir()
+    # Both captures were identical when journaled...
+    frames = [(f'2024-01-0{day}', folder / f"2024010{day}.png", write_frame(folder / f"2024010{day}.png", 10)) for day in (1, 2)]
+    entries = load_frame_fingerprints(journal_with(tmp_path, frames))
+    # ...but the second frame was rendered again since
+    write_frame(folder / "20240102.png", 30)
+    png_files = [path for _, path, _ in frames]
+    fingerprints = frame_fingerprints(png_files, entries)
+    assert fingerprints['20240102'] == frame_fingerprint(cv2.imread(str(png_files[1])))
+    assert collapse_duplicates([fingerprints[path.stem] for path in png_files]) == [[0], [1]]
+
+def test_entries_for_another_folder_are_not_trusted(tmp_path):
+    captured = tmp_path / "screenshots"
+    cropped = tmp_path / "cropped_screenshots"
+    captured.mkdir()
+    cropped.mkdir()
+    frames = [(f'2024-01-0{day}', captured / f"2024010{day}.png", write_frame(captured / f"2024010{day}.png", 10)) for day in (1, 2)]
+    entries = load_frame_fingerprints(journal_with(tmp_path, frames))
+    png_files = [cropped / "20240101.png", cropped / "20240102.png"]
+    write_frame(png_files[0], 5)
+    write_frame(png_files[1], 25)
+    fingerprints = frame_fingerprints(png_files, entries)
+    assert collapse_duplicates([fingerprints[path.stem] for path in png_files]) == [[0], [1]]
+
+def test_frames_without_entries_get_no_fingerprint(tmp_path):
+    path = tmp_path / "20240101.png"
+    write_frame(path, 10)
+    assert frame_fingerprints([path], {}) == {}
+    other = tmp_path / "20240102.png"
+    write_frame(other, 10)
+    entries = load_frame_fingerprints(journal_with(tmp_path, [('2024-01-01', path, cv2.imread(str(path)))]))
+    assert list(frame_fingerprints([path, other], entries)) == ['20240101']
+
+def test_missing_journal(tmp_path):
+    assert load_frame_fingerprints(str(tmp_path / "missing.json")) == {}
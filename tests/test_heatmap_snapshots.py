@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from heatmap_renderer import HeatmapAccumulator, HeatmapRenderer, Viewport
+
+def accumulator(folder, keep=3, interval=0):
+    renderer = HeatmapRenderer(Viewport(12, 59.43, 24.74, 64, 48))
+    return HeatmapAccumulator(renderer, str(folder), interval, keep)
+
+def track(offset):
+    return np.array([[59.43 + offset, 24.73], [59.43 + offset, 24.75]])
+
+def render(acc, dates):
+    for index, date_str in enumerate(dates):
+        acc.stamp(track(index * 0.001))
+        acc.advance(date_str)
+        acc.save_snapshot()
+
+DATES = ['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+
+def test_only_newest_snapshots_are_kept(tmp_path):
+    acc = accumulator(tmp_path, keep=2)
+    render(acc, DATES)
+    assert sorted(os.listdir(tmp_path)) == ['canvas_20240104.npz', 'canvas_20240105.npz']
+
+def test_keep_zero_keeps_every_snapshot(tmp_path):
+    acc = accumulator(tmp_path, keep=0)
+    render(acc, DATES)
+    assert len(os.listdir(tmp_path)) == len(DATES)
+
+def test_current_snapshot_survives_pruning(tmp_path):
+    acc = accumulator(tmp_path, keep=2)
+    render(acc, DATES)
+    # Saving an earlier cutoff again (e.g. after seeking back) keeps that snapshot
+    acc.cutoff = '2024-01-02'
+    acc.save_snapshot()
+    assert sorted(os.listdir(tmp_path)) == ['canvas_20240102.npz', 'canvas_20240105.npz']
+
+def test_restore_uses_latest_kept_snapshot(tmp_path):
+    acc = accumulator(tmp_path, keep=2)
+    render(acc, DATES)
+    restored = accumulator(tmp_path, keep=2)
+    # One activity per date
+    cutoff = restored.restore('2024-01-06', lambda cutoff: DATES.index(cutoff) + 1)
+    assert cutoff == '2024-01-05'
+    assert restored.activity_count == 5
+    np.testing.assert_array_equal(restored.canvas, acc.canvas)
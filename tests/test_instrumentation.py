@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+
+import pytest
+
+import instrumentation
+from instrumentation import StageTimer, instrumented_run, profiling_enabled
+
+def test_stage_busy_time_and_utilisation(clock):
+    timer = StageTimer(clock)
+    with timer.stage('capture'):
+        clock.now += 3
+    with timer.stage('process'):
+        clock.now += 1
+    timer.capacity['capture'] = 2
+    clock.now = 10
+    assert timer.utilisation() == {'capture': pytest.approx(0.15), 'process': pytest.approx(0.1)}
+    summary = timer.summary()
+    assert summary['stages']['capture'] == {
+        'busy_seconds': 3, 'runs': 1, 'mean_seconds': 3, 'capacity': 2, 'utilisation': 0.15
+    }
+    assert summary['bottleneck'] == 'capture'
+
+def test_stage_times_per_frame(clock):
+    timer = StageTimer(clock)
+    with timer.frame('20240101'):
+        with timer.stage('grab'):
+            clock.now += 0.5
+        # An explicit frame wins over the thread's frame() block
+        timer.add('encode', 0.25, frame='20240102')
+    timer.add('concat', 1.0)
+    assert timer.summary()['frame_times'] == {'20240101': {'grab': 0.5}, '20240102': {'encode': 0.25}}
+
+def test_frame_blocks_are_per_thread():
+    timer = StageTimer()
+    started = threading.Event()
+    done = threading.Event()
+
+    def other_thread():
+        started.wait()
+        timer.add('save', 1.0)
+        done.set()
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    with timer.frame('20240101'):
+        started.set()
+        done.wait(5)
+    thread.join()
+    assert timer.frame_times == {}
+    assert timer.busy == {'save': 1.0}
+
+def test_throughput(clock):
+    timer = StageTimer(clock)
+    timer.count_frames(4)
+    timer.count_bytes(3_000_000)
+    clock.now = 2
+    summary = timer.summary()
+    assert summary['frames_per_second'] == 2
+    assert summary['megabytes_per_second'] == 1.5
+
+def test_merge_adds_up_worker_timers():
+    timer = StageTimer()
+    for _ in range(2):
+        worker = StageTimer()
+        worker.capacity['decode'] = 2
+        worker.add('decode', 1.0, frame='20240101')
+        worker.add('encode', 2.0)
+        worker.count_frames(3)
+        worker.count_bytes(100)
+        timer.merge(worker.export())
+    assert timer.busy == {'decode': 2.0, 'encode': 4.0}
+    assert timer.counts == {'decode': 2, 'encode': 2}
+    # Workers run side by side, so their capacities add up
+    assert timer.capacity == {'decode': 4, 'encode': 2}
+    assert timer.frame_times == {'20240101': {'decode': 2.0}}
+    assert (timer.frames, timer.bytes_written) == (6, 200)
+
+def test_write_report(tmp_path):
+    timer = StageTimer()
+    timer.add('encode', 1.0)
+    path = timer.write_report(str(tmp_path / "reports" / "run.json"), script="test")
+    with open(path) as f:
+        report = json.load(f)
+    assert report['script'] == "test"
+    assert report['stages']['encode']['runs'] == 1
+    assert os.listdir(tmp_path / "reports") == ["run.json"]
+
+def read_reports(folder):
+    reports = {}
+    for name in os.listdir(folder):
+        if name.endswith('.json'):
+            with open(os.path.join(folder, name)) as f:
+                reports[name] = json.load(f)
+    return reports
+
+def test_instrumented_run_writes_a_report(tmp_path, capsys):
+    folder = str(tmp_path / "run_reports")
+    with instrumented_run("script", folder, profile=False) as timer:
+        timer.add('render', 0.5)
+    reports = read_reports(folder)
+    [(name, report)] = reports.items()
+    assert name.startswith("script_")
+    assert report['status'] == "completed"
+    assert report['profile'] is None
+    assert "Run report saved" in capsys.readouterr().out
+
+def test_instrumented_run_reports_failures(tmp_path):
+    folder = str(tmp_path / "run_reports")
+    with pytest.raises(ValueError):
+        with instrumented_run("script", folder, profile=False):
+            raise ValueError("boom")
+    with pytest.raises(KeyboardInterrupt):
+        with instrumented_run("other", folder, profile=False):
+            raise KeyboardInterrupt
+    statuses = {name.split('_')[0]: report['status'] for name, report in read_reports(folder).items()}
+    assert statuses == {'script': "failed", 'other': "interrupted"}
+
+def test_instrumented_run_profiles(tmp_path):
+    folder = str(tmp_path / "run_reports")
+    with instrumented_run("script", folder, profile=True, top=5):
+        sum(range(1000))
+    [report] = read_reports(folder).values()
+    assert report['profile'].endswith('.prof')
+    assert os.path.getsize(report['profile']) > 0
+
+def test_profiling_enabled(monkeypatch):
+    monkeypatch.setattr(instrumentation.sys, 'argv', ['script.py'])
+    monkeypatch.delenv(instrumentation.PROFILE_ENV, raising=False)
+    assert not profiling_enabled()
+    monkeypatch.setenv(instrumentation.PROFILE_ENV, "0")
+    assert not profiling_enabled()
+    monkeypatch.setenv(instrumentation.PROFILE_ENV, "1")
+    assert profiling_enabled()
+    monkeypatch.delenv(instrumentation.PROFILE_ENV)
+    monkeypatch.setattr(instrumentation.sys, 'argv', ['script.py', '--profile'])
+    assert profiling_enabled()
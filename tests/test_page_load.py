@@ -0,0 +1,76 @@
+import numpy as np
+
+from page_load import PageLoadDetector, frame_difference, grab_low_res_frame
+
+def frames(*levels, shape=(6, 8)):
+    """
+    Grab function returning a flat frame per level, repeating the last one
+    """
+    sequence = [np.full(shape, level, dtype=np.uint8) for level in levels]
+    grabbed = []
+
+    def grab_frame():
+        frame = sequence[min(len(grabbed), len(sequence) - 1)]
+        grabbed.append(frame)
+        return frame
+    grab_frame.grabbed = grabbed
+    return grab_frame
+
+def test_frame_difference():
+    dark = np.zeros((4, 4), dtype=np.uint8)
+    light = np.full((4, 4), 250, dtype=np.uint8)
+    assert frame_difference(dark, dark) == 0
+    # No uint8 wrap-around in either direction
+    assert frame_difference(dark, light) == 250
+    assert frame_difference(light, dark) == 250
+
+def test_stable_page_returns_after_stable_frames(clock):
+    detector = PageLoadDetector(threshold=2.0, stable_frames=3, poll_interval=0.5, timeout=30, min_wait=2.0)
+    stable, waited = detector.wait(frames(10), clock, clock.sleep)
+    assert stable
+    assert waited == 2.0 + 3 * 0.5
+
+def test_changing_frames_reset_the_count(clock):
+    detector = PageLoadDetector(threshold=2.0, stable_frames=2, poll_interval=1.0, timeout=30, min_wait=0)
+    # Tiles keep arriving for four polls, then the page settles
+    grab = frames(0, 40, 41, 90, 160, 160, 161)
+    stable, waited = detector.wait(grab, clock, clock.sleep)
+    assert stable
+    # 40 -> 41 is below the threshold but the next change starts over
+    assert waited == 6.0
+    assert len(grab.grabbed) == 7
+
+def test_small_noise_counts_as_stable(clock):
+    detector = PageLoadDetector(threshold=2.0, stable_frames=3, poll_interval=0.5, timeout=30, min_wait=0)
+    stable, _ = detector.wait(frames(100, 101, 99, 100), clock, clock.sleep)
+    assert stable
+
+def test_timeout_when_frames_never_settle(clock):
+    detector = PageLoadDetector(threshold=2.0, stable_frames=3, poll_interval=1.0, timeout=10, min_wait=2.0)
+    grab = frames(*[level * 20 % 256 for level in range(100)])
+    stable, waited = detector.wait(grab, clock, clock.sleep)
+    assert not stable
+    assert waited == 10.0
+
+def test_min_wait_is_capped_by_timeout(clock):
+    detector = PageLoadDetector(stable_frames=1, poll_interval=1.0, timeout=1.5, min_wait=5.0)
+    grab = frames(0, 50, 100)
+    stable, waited = detector.wait(grab, clock, clock.sleep)
+    assert not stable
+    assert waited == 1.5
+    assert len(grab.grabbed) == 1
+
+def test_grab_low_res_frame(fake_mss):
+    pixels = np.zeros((16, 32, 4), dtype=np.uint8)
+    pixels[..., 0] = 30
+    pixels[..., 1] = 60
+    pixels[..., 2] = 90
+    pixels[..., 3] = 255
+    sct = fake_mss(pixels)
+    bounds = {'left': 0, 'top': 0, 'width': 32, 'height': 16}
+    frame = grab_low_res_frame(sct, bounds, step=8)
+    assert sct.regions == [bounds]
+    assert frame.shape == (2, 4)
+    assert frame.dtype == np.uint8
+    # Alpha is ignored
+    assert (frame == 60).all()
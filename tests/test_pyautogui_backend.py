@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import capture_backends
+from capture_backends import PyAutoGUIBackend
+
+class FakeKeyboard:
+    def __init__(self):
+        self.typed = []
+
+    def hotkey(self, *keys):
+        pass
+
+    def press(self, key):
+        pass
+
+    def write(self, text):
+        self.typed.append(text)
+
+@pytest.fixture
+def fake_desktop(monkeypatch, clock, fake_mss):
+    keyboard = FakeKeyboard()
+    monkeypatch.setattr(capture_backends, 'time', clock)
+    monkeypatch.setattr(capture_backends, 'pyautogui', keyboard)
+    monkeypatch.setattr(capture_backends, 'mss', fake_mss)
+    return clock, keyboard
+
+BOUNDS = {'left': 0, 'top': 0, 'width': 8, 'height': 6}
+# Sleeps of navigate() (after Ctrl+L and after clearing) and the fixed load wait
+NAVIGATION_SLEEPS = [1, 0.5, 2]
+
+def test_capture_types_the_url_and_grabs_bounds(fake_desktop):
+    clock, keyboard = fake_desktop
+    backend = PyAutoGUIBackend(BOUNDS, detector=None, load_timeout=2, pause=1)
+    frame, waited = backend.capture("https://example.test/a")
+    assert keyboard.typed == ["https://example.test/a"]
+    assert frame.shape == (6, 8, 3)
+    assert frame.dtype == np.uint8
+    assert waited == 2
+    # No pause before the first navigation, nor after the grab
+    assert clock.sleeps == NAVIGATION_SLEEPS
+
+def test_pause_overlaps_the_processing_of_the_previous_frame(fake_desktop):
+    clock, _ = fake_desktop
+    backend = PyAutoGUIBackend(BOUNDS, detector=None, load_timeout=2, pause=1)
+    backend.capture("https://example.test/a")
+    # The previous frame is processed for 0.3 s before the next capture starts
+    clock.now += 0.3
+    clock.sleeps.clear()
+    backend.capture("https://example.test/b")
+    assert clock.sleeps == [0.7] + NAVIGATION_SLEEPS
+
+def test_no_pause_after_slow_processing(fake_desktop):
+    clock, _ = fake_desktop
+    backend = PyAutoGUIBackend(BOUNDS, detector=None, load_timeout=2, pause=1)
+    backend.capture("https://example.test/a")
+    clock.now += 1.5
+    clock.sleeps.clear()
+    backend.capture("https://example.test/b")
+    assert clock.sleeps == NAVIGATION_SLEEPS
@@ -0,0 +1,95 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import create_video
+
+def reference_screenshot_dates(activities_data, start_date="2024-01-01"):
+    """
+    The original day-by-day generate_screenshot_dates loop
+    """
+    if not activities_data:
+        return []
+
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    screenshot_dates = []
+
+    for activity in activities_data:
+        activity_dt = datetime.strptime(activity['date'], '%Y-%m-%d')
+        current_dt = start_dt
+        while current_dt <= activity_dt:
+            date_str = current_dt.strftime('%Y-%m-%d')
+            if date_str not in [d['date'] for d in screenshot_dates]:
+                accumulated_distance = sum(
+                    act['distance'] for act in activities_data
+                    if datetime.strptime(act['date'], '%Y-%m-%d') <= current_dt
+                )
+                accumulated_days = len([
+                    act for act in activities_data
+                    if datetime.strptime(act['date'], '%Y-%m-%d') <= current_dt
+                ])
+                screenshot_dates.append({
+                    'date': date_str,
+                    'accumulated_distance': accumulated_distance,
+                    'accumulated_days': accumulated_days
+                })
+            current_dt += timedelta(days=1)
+
+    return screenshot_dates
+
+ACTIVITIES = [
+    {'date': '2024-01-03', 'distance': 5.2},
+    {'date': '2024-01-03', 'distance': 3.1},
+    {'date': '2024-01-07', 'distance': 10.0},
+    {'date': '2024-02-01', 'distance': 0},
+    {'date': '2024-02-29', 'distance': 7.75},
+    {'date': '2024-03-02', 'distance': 4.4},
+]
+
+UNSORTED = [ACTIVITIES[i] for i in (4, 0, 5, 2, 1, 3)]
+
+def assert_same_dates(actual, expected):
+    assert [d['date'] for d in actual] == [d['date'] for d in expected]
+    assert [d['accumulated_days'] for d in actual] == [d['accumulated_days'] for d in expected]
+    assert [d['accumulated_distance'] for d in actual] == pytest.approx([d['accumulated_distance'] for d in expected])
+
+@pytest.mark.parametrize("activities", [ACTIVITIES, UNSORTED], ids=["sorted", "unsorted"])
+def test_matches_original_loop(screenshot_script, activities):
+    expected = reference_screenshot_dates(activities, "2024-01-01")
+    actual = screenshot_script.generate_screenshot_dates(activities, "2024-01-01")
+    assert_same_dates(actual, expected)
+
+def test_activities_before_start_date(screenshot_script):
+    activities = [{'date': '2023-12-30', 'distance': 2.0}] + ACTIVITIES
+    expected = reference_screenshot_dates(activities, "2024-01-01")
+    actual = screenshot_script.generate_screenshot_dates(activities, "2024-01-01")
+    assert_same_dates(actual, expected)
+
+def test_no_activities(screenshot_script):
+    assert screenshot_script.generate_screenshot_dates([]) == []
+
+@pytest.mark.parametrize("activities", [ACTIVITIES, UNSORTED], ids=["sorted", "unsorted"])
+def test_planned_captures_match_original_loop(screenshot_script, activities):
+    expected = screenshot_script.plan_capture_dates(reference_screenshot_dates(activities, "2024-01-01"))
+    actual = screenshot_script.plan_capture_dates(screenshot_script.generate_screenshot_dates(activities, "2024-01-01"))
+    assert_same_dates(actual, expected)
+    assert [d['date'] for d in actual] == ['2024-01-03', '2024-01-07', '2024-02-01', '2024-02-29', '2024-03-02']
+
+def test_hold_days_reach_the_video(screenshot_script, tmp_path):
+    screenshot_dates = screenshot_script.generate_screenshot_dates(ACTIVITIES, "2024-01-01")
+    capture_dates = screenshot_script.plan_capture_dates(screenshot_dates, hold_interval=10)
+    hold_dates = screenshot_script.held_dates(capture_dates)
+    assert hold_dates == ['2024-01-17', '2024-01-27', '2024-02-11', '2024-02-21']
+    # The metadata's screenshot dates are not marked
+    assert not any('hold' in d for d in screenshot_dates)
+
+    kept = create_video.filter_unique_activities(list(screenshot_dates), hold_dates)
+    assert [d['date'] for d in kept] == [d['date'] for d in capture_dates]
+
+    video = create_video.StreamingVideoWriter(
+        str(tmp_path / "out.mp4"), 2, screenshot_dates, encoder='opencv', hold_dates=hold_dates
+    )
+    with video:
+        written = [video.write(d['date'], np.zeros((48, 64, 3), dtype=np.uint8)) for d in screenshot_dates]
+    assert sum(written) == len(capture_dates)
@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pytest
+
+import tile_cache
+from heatmap_renderer import HeatmapRenderer, Viewport
+from tile_cache import TileCache
+
+def tracks(count=12, seed=1):
+    """
+    Smooth random tracks around Tallinn
+    """
+    rng = np.random.default_rng(seed)
+    result = []
+    for _ in range(count):
+        start = np.array([59.43, 24.74]) + rng.normal(0, 0.01, 2)
+        heading = np.cumsum(rng.normal(0, 0.15, 400))
+        steps = np.column_stack((np.sin(heading), 2 * np.cos(heading))).cumsum(axis=0) * 0.0001
+        result.append(start + steps)
+    return result
+
+TRACKS = tracks()
+DATES = [f"2024-01-{day:02d}" for day in range(1, len(TRACKS) + 1)]
+
+def renderer_for(fragment, width=640, height=480):
+    return HeatmapRenderer(Viewport.from_fragment(fragment, width, height))
+
+def reference_density(renderer, latlons):
+    canvas = renderer.new_canvas()
+    for latlon in latlons:
+        renderer.add_track(canvas, latlon)
+    return canvas
+
+def lit_pixels(renderer, canvas):
+    return int((renderer.colorize(canvas) != renderer.colormap[0]).any(axis=2).sum())
+
+@pytest.mark.parametrize("fragment, tolerance", [
+    ("#12/59.43/24.74", 0.01),
+    ("#12.4/59.43/24.74", 0.06),
+    ("#12.9/59.43/24.74", 0.1),
+])
+def test_frames_match_the_renderer(tmp_path, fragment, tolerance):
+    renderer = renderer_for(fragment)
+    cache = TileCache(str(tmp_path), renderer, list(zip(DATES, TRACKS)))
+    density = cache.density(renderer.viewport, DATES[-1])
+    expected = reference_density(renderer, TRACKS)
+    assert density.sum() == pytest.approx(expected.sum(), rel=tolerance)
+    assert lit_pixels(renderer, density) == pytest.approx(lit_pixels(renderer, expected), rel=0.15)
+
+def test_line_width_is_part_of_the_cache_key(tmp_path):
+    renderer = renderer_for("#12.4/59.43/24.74")
+    cache = TileCache(str(tmp_path), renderer, list(zip(DATES, TRACKS)))
+    # 2 px lines at zoom 12.4 are drawn 3 px wide on zoom 13 tiles
+    assert cache.level(renderer.viewport) == (13, 3)
+    assert cache.level(Viewport.from_fragment("#13/59.43/24.74", 640, 480)) == (13, 2)
+    cache.density(renderer.viewport, DATES[-1])
+    assert os.listdir(tmp_path) == ["512px_w3"]
+
+def test_least_recently_used_tiles_are_evicted(tmp_path):
+    renderer = renderer_for("#12/59.43/24.74")
+    cache = TileCache(str(tmp_path), renderer, [], tile_size=64, max_bytes=0)
+    tile = np.zeros((64, 64), dtype=np.float32)
+    paths = [str(tmp_path / name) for name in ("a.npy", "b.npy", "c.npy")]
+    cache.write_tile(paths[0], tile)
+    cache.max_bytes = 2 * cache.total_bytes
+    cache.write_tile(paths[1], tile)
+    # Reading a makes b the least recently used tile
+    cache.read_tile(paths[0])
+    cache.write_tile(paths[2], tile)
+    assert list(cache.entries) == [paths[0], paths[2]]
+    assert sorted(os.listdir(tmp_path)) == ["a.npy", "c.npy"]
+    assert cache.total_bytes <= cache.max_bytes
+
+def test_frames_stay_under_max_bytes(tmp_path):
+    renderer = renderer_for("#12/59.43/24.74")
+    activities = list(zip(DATES, TRACKS))
+    unlimited = TileCache(str(tmp_path / "unlimited"), renderer, activities, tile_size=128)
+    capped = TileCache(str(tmp_path / "capped"), renderer, activities, tile_size=128, max_bytes=4 * 128 * 128 * 4)
+    for date_str in DATES:
+        np.testing.assert_array_equal(
+            capped.density(renderer.viewport, date_str), unlimited.density(renderer.viewport, date_str)
+        )
+        assert capped.total_bytes <= capped.max_bytes
+    on_disk = [os.path.join(root, name) for root, _, names in os.walk(capped.folder) for name in names]
+    assert sorted(on_disk) == sorted(capped.entries)
+    assert len(on_disk) < len(unlimited.entries)
+
+def test_resumes_from_the_previous_tile_version(tmp_path, monkeypatch):
+    renderer = renderer_for("#12/59.43/24.74")
+    first = TileCache(str(tmp_path / "cache"), renderer, list(zip(DATES[:6], TRACKS[:6])))
+    first.density(renderer.viewport, DATES[5])
+
+    stamped = []
+    add_track = tile_cache.HeatmapRenderer.add_track
+    monkeypatch.setattr(
+        tile_cache.HeatmapRenderer, 'add_track',
+        lambda self, canvas, latlon: stamped.append(id(latlon)) or add_track(self, canvas, latlon)
+    )
+    # A later run with new activities starts from the tiles on disk
+    resumed = TileCache(str(tmp_path / "cache"), renderer, list(zip(DATES, TRACKS)))
+    density = resumed.density(renderer.viewport, DATES[-1])
+    assert stamped
+    assert set(stamped) <= {id(latlon) for latlon in TRACKS[6:]}
+
+    fresh = TileCache(str(tmp_path / "fresh"), renderer, list(zip(DATES, TRACKS)))
+    np.testing.assert_allclose(density, fresh.density(renderer.viewport, DATES[-1]), atol=1e-5)
@@ -0,0 +1,31 @@
+import track_store
+from track_store import TrackStore
+
+GPX = """<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><trkseg>
+    <trkpt lat="59.43" lon="24.74"><time>2024-01-01T10:00:00Z</time></trkpt>
+    <trkpt lat="59.44" lon="24.75"><time>2024-01-01T10:01:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+def test_fit_tracks_without_fitdecode_are_skipped_once(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(track_store, 'fitdecode', None)
+    (tmp_path / "1.gpx").write_text(GPX)
+    activities = [
+        {'id': '1', 'filename': '1.gpx'},
+        {'id': '2', 'filename': '2.fit.gz'},
+        {'id': '3', 'filename': '3.fit'},
+    ]
+    store = TrackStore(str(tmp_path / "store"))
+    assert store.ingest(activities, str(tmp_path), workers=1) == 1
+    out = capsys.readouterr().out
+    assert out.count("Warning") == 1
+    assert "Could not read track" not in out
+    assert store.points('1').shape == (2, 3)
+    assert '2' not in store and '3' not in store
+
+    # Without fitdecode only the FIT tracks are left, and nothing is parsed
+    assert TrackStore(str(tmp_path / "store")).ingest(activities, str(tmp_path), workers=1) == 0
+    assert "Ingesting" not in capsys.readouterr().out
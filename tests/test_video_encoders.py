@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+import video_encoders
+from video_encoders import OpenCVEncoder, create_encoder
+
+FFMPEG_OPTIONS = {'codec': 'libx264', 'preset': 'fast', 'crf': 20, 'pix_fmt': 'yuv420p', 'threads': 2}
+
+def write_frames(encoder, count=3, width=64, height=48):
+    with encoder:
+        for index in range(count):
+            encoder.write(np.full((height, width, 3), index * 40, dtype=np.uint8))
+
+def frame_count(path):
+    capture = cv2.VideoCapture(str(path))
+    try:
+        return int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        capture.release()
+
+def test_opencv_backend_ignores_ffmpeg_options(tmp_path):
+    output = tmp_path / "out.mp4"
+    encoder = create_encoder(str(output), 2, 64, 48, 'opencv', **FFMPEG_OPTIONS)
+    assert isinstance(encoder, OpenCVEncoder)
+    write_frames(encoder)
+    assert frame_count(output) == 3
+
+def test_auto_falls_back_to_opencv_without_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_encoders, 'ffmpeg_available', lambda ffmpeg_path='ffmpeg': False)
+    output = tmp_path / "out.mp4"
+    encoder = create_encoder(str(output), 2, 64, 48, 'auto', fourcc='mp4v', **FFMPEG_OPTIONS)
+    assert isinstance(encoder, OpenCVEncoder)
+    write_frames(encoder)
+    assert frame_count(output) == 3
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError):
+        create_encoder(str(tmp_path / "out.mp4"), 2, 64, 48, 'gstreamer')
@@ -0,0 +1,266 @@
+import bisect
+import math
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+from heatmap_renderer import HeatmapRenderer, Viewport
+
+class TileCache:
+    """
+    Slippy map (z/x/y) tile pyramid of accumulated heatmap density, so frames
+    for any viewport and resolution are composited from cached tiles
+
+    A tile only changes on the dates of activities that pass through it, so
+    each tile is stored once per version: folder/<size>px_w<width>/z/x/y/YYYYMMDD_N.npy
+    is the density of the N activities touching the tile up to that date. A new
+    activity re-renders only the tiles it touches, starting from their previous
+    version. The files on disk are capped at max_bytes and the least recently
+    used ones are evicted first.
+
+    A fractional zoom is composited from tiles of the next integer zoom scaled
+    down, so their lines are drawn wider by the same factor (rounded to whole
+    pixels). Frames then look like a HeatmapRenderer render of the viewport.
+
+    Args:
+    folder: Cache folder
+    renderer: HeatmapRenderer whose line width (in frame pixels) and colors the tiles use
+    activities: List of (date, lat/lon array or None) in date order
+    tile_size: Tile size in pixels
+    max_bytes: Size cap of the tiles on disk
+    """
+    def __init__(self, folder, renderer, activities, tile_size=512, max_bytes=512 * 2 ** 20):
+        self.folder = folder
+        self.renderer = renderer
+        self.activities = activities
+        self.tile_size = tile_size
+        self.max_bytes = max_bytes
+        # Activity indices and dates touching each tile, per (zoom, line width) level
+        self.tile_index = {}
+        # Last version of every tile of the previous frame: (level, x, y) -> (count, density)
+        self.memory = {}
+        # Files on disk, least recently used first: path -> size
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.renders = 0
+        self.scan()
+
+    def scan(self):
+        """
+        Index the tiles already on disk in least recently used order
+        """
+        files = []
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith('.npy'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime_ns, path, stat.st_size))
+        files.sort()
+        self.entries = OrderedDict((path, size) for _, path, size in files)
+        self.total_bytes = sum(self.entries.values())
+
+    def level(self, viewport):
+        """
+        Tile level (z, line width) that viewport is composited from: the first
+        integer zoom of this tile size at least as detailed as the viewport,
+        with the line width scaled up as much as the tiles are scaled down
+        """
+        z = math.ceil(math.log2(viewport.world_size / self.tile_size) - 1e-9)
+        return z, max(1, round(self.renderer.line_width * self.scale(viewport, z)))
+
+    def scale(self, viewport, z):
+        """
+        Tile pixels per frame pixel at zoom z
+        """
+        return self.tile_size * 2 ** z / viewport.world_size
+
+    def tiles_of_track(self, latlon, level):
+        """
+        Set of (x, y) tiles of a level that a track's line passes through
+        """
+        if latlon is None or len(latlon) < 2:
+            return set()
+        z, line_width = level
+        world = Viewport(z, 0.0, 0.0, self.tile_size, self.tile_size, self.tile_size).world_pixels(latlon)
+        # Add points along long segments so a GPS gap can't skip a tile
+        step = self.tile_size / 4
+        lengths = np.hypot(*np.diff(world, axis=0).T)
+        distance = np.concatenate(([0.0], np.cumsum(lengths)))
+        if lengths.max() > step:
+            samples = np.arange(0.0, distance[-1], step)
+            world = np.vstack((world, np.column_stack((
+                np.interp(samples, distance, world[:, 0]),
+                np.interp(samples, distance, world[:, 1])
+            ))))
+        # Lines near a tile edge also draw into the neighbouring tile
+        margin = line_width + 1
+        tiles = set()
+        for dx, dy in ((0, 0), (-margin, -margin), (-margin, margin), (margin, -margin), (margin, margin)):
+            xs = np.floor((world[:, 0] + dx) / self.tile_size).astype(np.int64)
+            ys = np.floor((world[:, 1] + dy) / self.tile_size).astype(np.int64)
+            tiles.update(zip(xs.tolist(), ys.tolist()))
+        return tiles
+
+    def index_level(self, level):
+        """
+        Activity indices and dates touching each tile of a level (computed once per level)
+        """
+        if level not in self.tile_index:
+            index = {}
+            for i, (date_str, latlon) in enumerate(self.activities):
+                for tile in self.tiles_of_track(latlon, level):
+                    indices, dates = index.setdefault(tile, ([], []))
+                    indices.append(i)
+                    dates.append(date_str)
+            self.tile_index[level] = index
+        return self.tile_index[level]
+
+    def tile_folder(self, level, x, y):
+        # Tiles drawn with another size or line width can't be reused
+        z, line_width = level
+        return os.path.join(self.folder, f"{self.tile_size}px_w{line_width}", str(z), str(x), str(y))
+
+    def tile_path(self, level, x, y, date_str, count):
+        return os.path.join(self.tile_folder(level, x, y), f"{date_str.replace('-', '')}_{count}.npy")
+
+    def read_tile(self, path):
+        try:
+            tile = np.load(path)
+        except (OSError, ValueError):
+            return None
+        if path in self.entries:
+            self.entries.move_to_end(path)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return tile
+
+    def write_tile(self, path, tile):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npy'
+        np.save(tmp_path, tile)
+        os.replace(tmp_path, path)
+        self.total_bytes += os.path.getsize(path) - self.entries.pop(path, 0)
+        self.entries[path] = os.path.getsize(path)
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used tiles until the cache fits max_bytes
+        """
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            path, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def previous_version(self, level, x, y, dates, count):
+        """
+        Latest usable version of a tile with fewer than count activities
+        Returns tuple of (version count, density) or None
+        """
+        cached = self.memory.get((level, x, y))
+        if cached is not None and cached[0] <= count:
+            return cached
+        tile_folder = self.tile_folder(level, x, y)
+        try:
+            names = os.listdir(tile_folder)
+        except OSError:
+            return None
+        versions = []
+        for name in names:
+            stem, _, ext = name.partition('.')
+            date_part, _, count_part = stem.partition('_')
+            if ext != 'npy' or not count_part.isdigit():
+                continue
+            version = int(count_part)
+            # The file is only valid while the same activities touch the tile
+            if 0 < version < count and dates[version - 1].replace('-', '') == date_part:
+                versions.append(version)
+        for version in sorted(versions, reverse=True):
+            tile = self.read_tile(os.path.join(tile_folder, f"{dates[version - 1].replace('-', '')}_{version}.npy"))
+            if tile is not None:
+                return version, tile
+        return None
+
+    def tile_density(self, level, x, y, cutoff):
+        """
+        Density of tile x/y of a level with every activity up to cutoff, or None if no activity touches it
+        """
+        entry = self.index_level(level).get((x, y))
+        if entry is None:
+            return None
+        indices, dates = entry
+        count = bisect.bisect_right(dates, cutoff)
+        if count == 0:
+            return None
+
+        cached = self.memory.get((level, x, y))
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        path = self.tile_path(level, x, y, dates[count - 1], count)
+        tile = self.read_tile(path) if path in self.entries else None
+        if tile is not None:
+            self.hits += 1
+        else:
+            # Re-render from the previous version, stamping only the newer activities
+            previous = self.previous_version(level, x, y, dates, count)
+            start, tile = previous if previous is not None else (0, None)
+            tile = tile.copy() if tile is not None else np.zeros((self.tile_size, self.tile_size), dtype=np.float32)
+            z, line_width = level
+            tile_renderer = HeatmapRenderer(
+                Viewport.for_tile(z, x, y, self.tile_size), line_width,
+                self.renderer.saturation, self.renderer.colormap
+            )
+            for i in indices[start:count]:
+                tile_renderer.add_track(tile, self.activities[i][1])
+            self.write_tile(path, tile)
+            self.renders += 1
+        self.memory[(level, x, y)] = (count, tile)
+        return tile
+
+    def density(self, viewport, cutoff):
+        """
+        Density canvas of viewport with every activity up to cutoff, composited
+        from tiles at the next integer zoom level
+        """
+        level = self.level(viewport)
+        z = level[0]
+        scale = self.scale(viewport, z)
+        left = viewport.center_x * scale - viewport.width / 2 * scale
+        top = viewport.center_y * scale - viewport.height / 2 * scale
+        right = left + viewport.width * scale
+        bottom = top + viewport.height * scale
+        x0, y0 = math.floor(left / self.tile_size), math.floor(top / self.tile_size)
+        x1, y1 = math.floor(right / self.tile_size), math.floor(bottom / self.tile_size)
+
+        mosaic = np.zeros(((y1 - y0 + 1) * self.tile_size, (x1 - x0 + 1) * self.tile_size), dtype=np.float32)
+        used = set()
+        for y in range(y0, y1 + 1):
+            for x in range(x0, x1 + 1):
+                tile = self.tile_density(level, x, y, cutoff)
+                if tile is not None:
+                    used.add((level, x, y))
+                    top_px, left_px = (y - y0) * self.tile_size, (x - x0) * self.tile_size
+                    mosaic[top_px:top_px + self.tile_size, left_px:left_px + self.tile_size] = tile
+        # Keep only this frame's tiles in memory
+        self.memory = {key: value for key, value in self.memory.items() if key in used}
+
+        # Map each frame pixel center to its position in the mosaic
+        offset = 0.5 * scale - 0.5
+        matrix = np.float32([
+            [scale, 0, left - x0 * self.tile_size + offset],
+            [0, scale, top - y0 * self.tile_size + offset]
+        ])
+        return cv2.warpAffine(
+            mosaic, matrix, (viewport.width, viewport.height),
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP
+        )
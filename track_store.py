@@ -0,0 +1,174 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from heatmap_renderer import fitdecode, read_track_points
+from capture_journal import atomic_write_json, read_json_or_empty
+
+# One float64 file per column, all tracks back to back
+COLUMNS = ('lat', 'lon', 'time')
+
+def activity_key(activity):
+    """
+    Store key of an activity: its Activity ID, or its track file for exports without IDs
+    """
+    return activity.get('id') or activity.get('filename')
+
+def _ingest_task(task):
+    """
+    Parse one track file in a worker process
+    Returns tuple of (key, points or None, error or None)
+    """
+    key, path = task
+    try:
+        return key, read_track_points(path), None
+    except Exception as e:
+        return key, None, str(e)
+
+class TrackStore:
+    """
+    Columnar store of the export's GPS tracks, so tracks are parsed only once
+
+    Every point of every ingested activity is stored in the lat.f8, lon.f8 and
+    time.f8 column files (POSIX seconds, NaN if unknown), and index.json holds
+    each activity's [start, end) point offsets. The columns are memory-mapped,
+    so slicing a track reads only its own points.
+
+    New tracks are appended to the column files and the index is rewritten
+    atomically afterwards, so an interrupted ingest only loses its new tracks.
+    """
+    def __init__(self, folder="track_store"):
+        self.folder = folder
+        self.offsets = {}
+        self.point_count = 0
+        self.columns = None
+        self.load()
+
+    def column_path(self, column):
+        return os.path.join(self.folder, f"{column}.f8")
+
+    def load(self):
+        """
+        Load the index and memory-map the columns, starting empty if the store is missing or unreadable
+        """
+        index = read_json_or_empty(os.path.join(self.folder, 'index.json'))
+        self.offsets = {}
+        self.point_count = 0
+        self.columns = None
+        if not index:
+            return
+        try:
+            offsets = {key: tuple(span) for key, span in index['offsets'].items()}
+            point_count = index['point_count']
+            for column in COLUMNS:
+                if os.path.getsize(self.column_path(column)) < point_count * 8:
+                    raise ValueError(f"{column}.f8 is shorter than the index")
+        except Exception as e:
+            print(f"Warning: Rebuilding unreadable track store {self.folder}: {e}")
+            return
+        self.offsets = offsets
+        self.point_count = point_count
+
+    def save_index(self):
+        atomic_write_json(os.path.join(self.folder, 'index.json'), {'point_count': self.point_count, 'offsets': self.offsets})
+
+    def _open_columns(self):
+        if self.columns is None:
+            self.columns = {
+                column: np.memmap(self.column_path(column), dtype=np.float64, mode='r', shape=(self.point_count,))
+                if self.point_count else np.empty(0, dtype=np.float64)
+                for column in COLUMNS
+            }
+        return self.columns
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def points(self, key):
+        """
+        Track of an activity as an array of (lat, lon, time) rows, or None if it was not ingested
+        """
+        span = self.offsets.get(key)
+        if span is None:
+            return None
+        start, end = span
+        columns = self._open_columns()
+        return np.column_stack([columns[column][start:end] for column in COLUMNS])
+
+    def latlon(self, key):
+        """
+        Track of an activity as an array of (lat, lon) rows, or None if it was not ingested
+        """
+        span = self.offsets.get(key)
+        if span is None:
+            return None
+        start, end = span
+        columns = self._open_columns()
+        return np.column_stack((columns['lat'][start:end], columns['lon'][start:end]))
+
+    def ingest(self, activities_data, export_folder=".", workers=None):
+        """
+        Parse the track files of activities that are not in the store yet, in
+        parallel processes, and append them to the columns
+        Returns number of newly ingested tracks
+        """
+        tasks = {}
+        for activity in activities_data:
+            key = activity_key(activity)
+            if key and activity.get('filename') and key not in self.offsets:
+                tasks[key] = os.path.join(export_folder, activity['filename'])
+        fit_keys = [key for key, path in tasks.items() if path.lower().endswith(('.fit', '.fit.gz'))]
+        if fit_keys and fitdecode is None:
+            # Left out of the store, so a later run with fitdecode installed ingests them
+            print(f"Warning: Skipping {len(fit_keys)} FIT tracks, reading them needs the fitdecode package (pip install fitdecode)")
+            for key in fit_keys:
+                del tasks[key]
+        if not tasks:
+            return 0
+
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        print(f"Ingesting {len(tasks)} new tracks with {workers} worker(s)...")
+        os.makedirs(self.folder, exist_ok=True)
+        # Release the memory maps before the files grow
+        self.columns = None
+
+        start = time.perf_counter()
+        ingested = 0
+        failed = 0
+        new_points = 0
+        files = {}
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for column in COLUMNS:
+                path = self.column_path(column)
+                files[column] = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+                # Drop anything an interrupted ingest wrote past the index
+                files[column].truncate(self.point_count * 8)
+                files[column].seek(self.point_count * 8)
+
+            results = executor.map(_ingest_task, tasks.items(), chunksize=4) if executor else map(_ingest_task, tasks.items())
+            for key, points, error in results:
+                if error:
+                    failed += 1
+                    print(f"Warning: Could not read track {tasks[key]}: {error}")
+                    continue
+                for i, column in enumerate(COLUMNS):
+                    files[column].write(np.ascontiguousarray(points[:, i]).tobytes())
+                self.offsets[key] = (self.point_count, self.point_count + len(points))
+                self.point_count += len(points)
+                new_points += len(points)
+                ingested += 1
+        finally:
+            if executor:
+                executor.shutdown()
+            for f in files.values():
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+            # Index only what reached the column files
+            self.save_index()
+        elapsed = time.perf_counter() - start
+
+        print(f"Ingested {ingested} tracks ({new_points} points) in {elapsed:.1f} s, "
+              f"{len(self.offsets)} tracks in the store, {failed} failed")
+        return ingested
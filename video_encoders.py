@@ -0,0 +1,185 @@
+import os
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+# Default quality settings per FFmpeg codec
+CODEC_DEFAULTS = {
+    'libx264': {'preset': 'medium', 'crf': 23},
+    'libx265': {'preset': 'medium', 'crf': 28},
+    'libvpx-vp9': {'preset': None, 'crf': 32},
+}
+
+class OpenCVEncoder:
+    """
+    Writes BGR frames with cv2.VideoWriter (the original mp4v writer)
+    """
+    def __init__(self, output_filename, fps, width, height, fourcc='mp4v'):
+        self.output_filename = output_filename
+        self.writer = cv2.VideoWriter(
+            output_filename,
+            cv2.VideoWriter_fourcc(*fourcc),
+            fps,
+            (width, height)
+        )
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Could not open video writer for {output_filename}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class FFmpegEncoder:
+    """
+    Streams raw BGR frames to a local ffmpeg process over stdin
+
+    Args:
+    output_filename: Output video file, the container is taken from the extension
+    fps: Frames per second
+    width, height: Frame size
+    codec: FFmpeg video encoder, e.g. libx264 or libvpx-vp9 (default: libvpx-vp9 for .webm, else libx264)
+    preset: Encoder speed preset (x264/x265 only), None for the codec default
+    crf: Constant rate factor, lower is better quality
+    pix_fmt: Output pixel format
+    threads: Encoder threads, 0 lets ffmpeg use every core
+    ffmpeg_path: ffmpeg executable
+    """
+    def __init__(
+        self,
+        output_filename,
+        fps,
+        width,
+        height,
+        codec=None,
+        preset='default',
+        crf=None,
+        pix_fmt='yuv420p',
+        threads=0,
+        ffmpeg_path='ffmpeg'
+    ):
+        if codec is None:
+            codec = 'libvpx-vp9' if output_filename.lower().endswith('.webm') else 'libx264'
+        defaults = CODEC_DEFAULTS.get(codec, {'preset': None, 'crf': None})
+        if preset == 'default':
+            preset = defaults['preset']
+        if crf is None:
+            crf = defaults['crf']
+
+        self.output_filename = output_filename
+        self.frame_bytes = width * height * 3
+        command = [
+            ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+            '-an', '-c:v', codec, '-pix_fmt', pix_fmt, '-threads', str(threads)
+        ]
+        if pix_fmt == 'yuv420p' and (width % 2 or height % 2):
+            # 4:2:0 chroma needs even dimensions
+            command += ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2']
+        if preset:
+            command += ['-preset', preset]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        if codec == 'libvpx-vp9':
+            # Constant quality mode and multithreaded rows
+            command += ['-b:v', '0', '-row-mt', '1']
+        if output_filename.lower().endswith('.mp4'):
+            command += ['-movflags', '+faststart']
+        command.append(output_filename)
+
+        self.command = command
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame has {frame.nbytes} bytes, expected {self.frame_bytes}")
+        try:
+            self.process.stdin.write(frame.data)
+        except BrokenPipeError:
+            self.process.wait()
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode} while encoding {self.output_filename}")
+
+    def close(self):
+        if self.process.stdin and not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode} while encoding {self.output_filename}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't mask the original error with ffmpeg's exit status
+            try:
+                self.close()
+            except RuntimeError:
+                pass
+
+def ffmpeg_available(ffmpeg_path='ffmpeg'):
+    """
+    True if the ffmpeg executable can be found
+    """
+    return shutil.which(ffmpeg_path) is not None
+
+def concat_videos(segment_files, output_filename, ffmpeg_path='ffmpeg'):
+    """
+    Join videos encoded with identical settings using ffmpeg's concat demuxer
+    Streams are copied, not re-encoded
+    """
+    list_file = output_filename + '.concat.txt'
+    with open(list_file, 'w') as f:
+        for segment_file in segment_files:
+            escaped = os.path.abspath(segment_file).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        command = [
+            ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_file,
+            '-c', 'copy'
+        ]
+        if output_filename.lower().endswith('.mp4'):
+            command += ['-movflags', '+faststart']
+        command.append(output_filename)
+        subprocess.run(command, check=True)
+    finally:
+        os.remove(list_file)
+
+def create_encoder(output_filename, fps, width, height, backend='auto', **options):
+    """
+    Create a video encoder with write(frame) and close()
+
+    Args:
+    backend: "ffmpeg", "opencv" or "auto" (ffmpeg if installed, otherwise OpenCV)
+    options: Passed to the encoder, e.g. codec, preset, crf, threads for ffmpeg or fourcc for OpenCV
+    (the options of the other backend are ignored)
+    """
+    if backend == 'auto':
+        backend = 'ffmpeg' if ffmpeg_available(options.get('ffmpeg_path', 'ffmpeg')) else 'opencv'
+        if backend == 'opencv':
+            print("ffmpeg not found, falling back to the OpenCV mp4v writer")
+
+    if backend == 'ffmpeg':
+        options.pop('fourcc', None)
+        return FFmpegEncoder(output_filename, fps, width, height, **options)
+    if backend == 'opencv':
+        # codec, crf, preset etc. only apply to ffmpeg
+        options = {k: v for k, v in options.items() if k == 'fourcc'}
+        return OpenCVEncoder(output_filename, fps, width, height, **options)
+    raise ValueError(f"Unknown encoder backend: {backend}")